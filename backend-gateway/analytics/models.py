@@ -0,0 +1,68 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Index, Numeric
+from database.db import Base
+
+class DailyRiskRollup(Base):
+    """Per-user, per-day aggregate of successful risk analyses.
+
+    Maintained on write by analytics.rollup_service so /analytics/trends never
+    has to scan agent_analysis or parse its JSONB responses.
+    """
+    __tablename__ = "daily_risk_rollup"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    analyses_count = Column(Integer, nullable=False, default=0)
+    risk_score_sum = Column(Numeric, nullable=False, default=0)
+
+    # Severity buckets (critical > 80, high > 60, medium > 40, low otherwise)
+    critical_count = Column(Integer, nullable=False, default=0)
+    high_count = Column(Integer, nullable=False, default=0)
+    medium_count = Column(Integer, nullable=False, default=0)
+    low_count = Column(Integer, nullable=False, default=0)
+
+    risks_detected = Column(Integer, nullable=False, default=0)
+
+    # Document types (based on filename)
+    contract_count = Column(Integer, nullable=False, default=0)
+    agreement_count = Column(Integer, nullable=False, default=0)
+    policy_count = Column(Integer, nullable=False, default=0)
+    other_count = Column(Integer, nullable=False, default=0)
+
+class TokenUsage(Base):
+    """Ledger of LLM tokens consumed, one row per agent call that reported usage.
+
+    Written with the analysis by analytics.usage_service; rows outlive their
+    document so deleting documents does not reset a user's budget.
+    """
+    __tablename__ = "token_usage"
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    agent_type = Column(String, nullable=False)
+    provider = Column(String, nullable=True)  # Provider of the final answer; attempts may span both
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+Index("idx_token_usage_user_created", TokenUsage.user_id, TokenUsage.created_at, postgresql_include=["total_tokens"])
+
+class TokenBudgetCounter(Base):
+    """Tokens charged to a user's budget in the current UTC day and month.
+
+    Agent calls reserve their estimated tokens here with one conditional
+    upsert, so concurrent requests cannot overshoot a budget; the
+    reservation is reconciled to the actual usage when the call completes.
+    A counter whose day/month is not the current one counts as zero.
+    """
+    __tablename__ = "token_budget_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, nullable=False)
+    day_used = Column(BigInteger, nullable=False, default=0)
+    month = Column(Date, nullable=False)
+    month_used = Column(BigInteger, nullable=False, default=0)
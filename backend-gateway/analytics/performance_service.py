@@ -0,0 +1,74 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from documents.models import AgentAnalysis
+
+def build_processing_time_select(user_id: int, start: datetime, end: datetime):
+    """
+    Processing time percentiles and success counts of a user's analyses,
+    per agent, per provider and overall (one GROUPING SETS query).
+
+    Only rows with telemetry (processing_ms) are counted.
+
+    Args:
+        start: Inclusive lower bound on created_at
+        end: Exclusive upper bound on created_at
+    """
+    processing_ms = AgentAnalysis.processing_ms
+    return select(
+        AgentAnalysis.agent_type,
+        AgentAnalysis.ai_provider,
+        # Bit 1: not grouped by agent_type, bit 0: not grouped by ai_provider
+        func.grouping(AgentAnalysis.agent_type, AgentAnalysis.ai_provider).label("grouping"),
+        func.count().label("count"),
+        func.count().filter(AgentAnalysis.success == True).label("succeeded"),
+        func.avg(processing_ms).label("avg_ms"),
+        func.percentile_cont(0.5).within_group(processing_ms).label("p50_ms"),
+        func.percentile_cont(0.95).within_group(processing_ms).label("p95_ms"),
+    ).where(
+        AgentAnalysis.user_id == user_id,
+        AgentAnalysis.created_at >= start,
+        AgentAnalysis.created_at < end,
+        processing_ms.isnot(None)
+    ).group_by(func.grouping_sets(
+        tuple_(AgentAnalysis.agent_type),
+        tuple_(AgentAnalysis.ai_provider),
+        text("()")
+    ))
+
+def _stats(row) -> dict:
+    return {
+        "count": row.count,
+        "success_rate": round(100 * row.succeeded / row.count, 1),
+        "avg_ms": round(float(row.avg_ms)),
+        "p50_ms": round(row.p50_ms),
+        "p95_ms": round(row.p95_ms),
+    }
+
+async def processing_time_stats(db: AsyncSession, user_id: int, start: date, end: date) -> dict:
+    """
+    Processing time statistics for analyses created between start and end
+    (inclusive dates).
+
+    Returns:
+        {"overall": stats or None, "by_agent": {agent: stats}, "by_provider": {provider: stats}}
+        where stats has count, success_rate, avg_ms, p50_ms and p95_ms
+    """
+    result = await db.execute(build_processing_time_select(
+        user_id,
+        datetime.combine(start, time.min),
+        datetime.combine(end + timedelta(days=1), time.min)
+    ))
+    stats = {"overall": None, "by_agent": {}, "by_provider": {}}
+    for row in result:
+        if not row.count:
+            # The overall group of an empty period
+            continue
+        if row.grouping == 1:
+            stats["by_agent"][row.agent_type] = _stats(row)
+        elif row.grouping == 2:
+            # Failed calls have no provider
+            stats["by_provider"][row.ai_provider or "none"] = _stats(row)
+        else:
+            stats["overall"] = _stats(row)
+    return stats
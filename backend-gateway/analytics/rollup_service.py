@@ -0,0 +1,125 @@
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import func, cast, and_, not_, select, delete, Date
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from analytics.models import DailyRiskRollup
+from documents.models import Document, AgentAnalysis
+
+ROLLUP_COLUMNS = [
+    "user_id",
+    "day",
+    "analyses_count",
+    "risk_score_sum",
+    "critical_count",
+    "high_count",
+    "medium_count",
+    "low_count",
+    "risks_detected",
+    "contract_count",
+    "agreement_count",
+    "policy_count",
+    "other_count",
+]
+
+def build_rollup_select(user_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    SELECT producing daily_risk_rollup rows straight from agent_analysis.
+
+    Args:
+        user_id: Restrict to a single user (all users when None)
+        start: Inclusive lower bound on created_at
+        end: Exclusive upper bound on created_at
+    """
+    score = func.coalesce(AgentAnalysis.risk_percentage, 0)
+    day = cast(func.date_trunc("day", AgentAnalysis.created_at), Date)
+
+    filename = func.lower(func.coalesce(Document.filename, ""))
+    is_contract = filename.contains("contract")
+    is_agreement = and_(not_(is_contract), filename.contains("agreement"))
+    is_policy = and_(not_(is_contract), not_(filename.contains("agreement")), filename.contains("policy"))
+
+    stmt = select(
+        AgentAnalysis.user_id,
+        day.label("day"),
+        func.count().label("analyses_count"),
+        func.coalesce(func.sum(score), 0).label("risk_score_sum"),
+        func.count().filter(score > 80).label("critical_count"),
+        func.count().filter(and_(score > 60, score <= 80)).label("high_count"),
+        func.count().filter(and_(score > 40, score <= 60)).label("medium_count"),
+        func.count().filter(score <= 40).label("low_count"),
+        func.coalesce(func.sum(AgentAnalysis.total_risks), 0).label("risks_detected"),
+        func.count().filter(is_contract).label("contract_count"),
+        func.count().filter(is_agreement).label("agreement_count"),
+        func.count().filter(is_policy).label("policy_count"),
+        func.count().filter(and_(not_(is_contract), not_(is_agreement), not_(is_policy))).label("other_count"),
+    ).select_from(AgentAnalysis).outerjoin(
+        Document, Document.id == AgentAnalysis.document_id
+    ).where(
+        AgentAnalysis.agent_type == "risk",
+        AgentAnalysis.success == True,
+        AgentAnalysis.user_id.isnot(None)
+    ).group_by(AgentAnalysis.user_id, day)
+
+    if user_id is not None:
+        stmt = stmt.where(AgentAnalysis.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(AgentAnalysis.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(AgentAnalysis.created_at < end)
+    return stmt
+
+def refresh_daily_risk_rollup(db: Session, user_id: int, days: Iterable[date]):
+    """
+    Recompute the rollup rows for the given user and days.
+
+    Rows are rebuilt from agent_analysis rather than incremented, so the
+    rollup stays correct when an analysis is overwritten, fails on retry,
+    or moves to another day. Each (user, day) is recomputed under a
+    transaction-level advisory lock, so two concurrent saves can't leave
+    the row computed from the earlier one's snapshot. Does not commit.
+    """
+    # Sorted so concurrent refreshes take the locks in the same order
+    for day in sorted({d for d in days if d is not None}):
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+
+        db.execute(select(func.pg_advisory_xact_lock(user_id, day.toordinal())))
+
+        db.execute(delete(DailyRiskRollup).where(
+            DailyRiskRollup.user_id == user_id,
+            DailyRiskRollup.day == day
+        ))
+
+        stmt = insert(DailyRiskRollup).from_select(
+            ROLLUP_COLUMNS,
+            build_rollup_select(user_id=user_id, start=start, end=end)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "day"],
+            set_={col: stmt.excluded[col] for col in ROLLUP_COLUMNS[2:]}
+        )
+        db.execute(stmt)
+
+def refresh_rollup_for_analysis(db: Session, analysis: AgentAnalysis, previous_created_at: Optional[datetime] = None):
+    """
+    Keep daily_risk_rollup in sync after an AgentAnalysis write.
+
+    Call after the analysis has been added/updated and before commit.
+    previous_created_at is the timestamp the row had before an update, so
+    the day it was moved away from is recomputed as well.
+    """
+    if analysis.agent_type != "risk" or analysis.user_id is None:
+        return
+
+    db.flush()
+    days = [analysis.created_at.date() if analysis.created_at else datetime.utcnow().date()]
+    if previous_created_at:
+        days.append(previous_created_at.date())
+    refresh_daily_risk_rollup(db, analysis.user_id, days)
+
+def rebuild_all_rollups(db: Session):
+    """Rebuild the whole daily_risk_rollup table from agent_analysis. Commits."""
+    db.execute(delete(DailyRiskRollup))
+    db.execute(insert(DailyRiskRollup).from_select(ROLLUP_COLUMNS, build_rollup_select()))
+    db.commit()
@@ -1,123 +1,107 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
+from sqlalchemy import select, func, cast, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Literal, Optional
+from datetime import datetime, timedelta, date
 from database.db import get_db
-from documents.models import Document, AgentAnalysis
+from analytics.models import DailyRiskRollup, TokenUsage
+from analytics.performance_service import processing_time_stats
+from analytics.usage_service import token_budget_status
+from documents.models import Document
 from auth.auth_service import get_current_user
-from auth.models import User
+from auth.principal_cache import Principal
 
 router = APIRouter(
     prefix="/analytics",
     tags=["analytics"]
 )
 
+PERIOD_DAYS = {
+    "7d": 7,
+    "30d": 30,
+    "90d": 90,
+    "1y": 365
+}
+
+def resolve_period(period: str, start_date: Optional[date], end_date: Optional[date]):
+    """Turn a period selector into an inclusive (start, end) date range."""
+    today = datetime.utcnow().date()
+    if period == "custom":
+        if not start_date:
+            raise HTTPException(status_code=400, detail="start_date is required for a custom period")
+        end = end_date or today
+        if start_date > end:
+            raise HTTPException(status_code=400, detail="start_date must be before end_date")
+        return start_date, end
+    return today - timedelta(days=PERIOD_DAYS[period] - 1), today
+
 @router.get("/trends")
-def get_analytics_trends(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_analytics_trends(
+    period: Literal["7d", "30d", "90d", "1y", "custom"] = "30d",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
-    # Default to 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    # Fetch all risk analyses for the user in the last 30 days
-    analyses = db.query(AgentAnalysis).filter(
-        AgentAnalysis.user_id == current_user.id,
-        AgentAnalysis.agent_type == 'risk',
-        AgentAnalysis.success == True,
-        AgentAnalysis.created_at >= thirty_days_ago
-    ).order_by(AgentAnalysis.created_at).all()
-    
-    total_analyses = len(analyses)
-    
-    # Calculate Severity Distribution
+    start, end = resolve_period(period, start_date, end_date)
+
+    # One indexed range scan over the pre-aggregated daily rollup
+    result = await db.execute(select(DailyRiskRollup).filter(
+        DailyRiskRollup.user_id == current_user.id,
+        DailyRiskRollup.day >= start,
+        DailyRiskRollup.day <= end
+    ).order_by(DailyRiskRollup.day))
+    rollups = result.scalars().all()
+
+    total_analyses = 0
+    total_risks_detected_count = 0
     severity_dist = {
         "critical": 0,
         "high": 0,
         "medium": 0,
         "low": 0
     }
-    
-    # Calculate Daily Trend
-    daily_trend_map = {}
-    
-    # Document Types (Mock for now as we don't strictly categorize yet)
     document_types = {
         "contract": 0,
         "agreement": 0,
         "policy": 0,
         "other": 0
     }
-    
-    total_risk_score = 0
-    
-    for analysis in analyses:
-        data = analysis.response or {}
-        risk_score = data.get('risk_score', 0)
-        total_risk_score += risk_score
-        
-        # Severity
-        if risk_score > 80:
-            severity_dist["critical"] += 1
-        elif risk_score > 60:
-            severity_dist["high"] += 1
-        elif risk_score > 40:
-            severity_dist["medium"] += 1
-        else:
-            severity_dist["low"] += 1
-            
-        # Daily Trend
-        date_str = analysis.created_at.strftime('%Y-%m-%d')
-        if date_str not in daily_trend_map:
-            daily_trend_map[date_str] = {"count": 0, "total_risk": 0}
-        
-        daily_trend_map[date_str]["count"] += 1
-        daily_trend_map[date_str]["total_risk"] += risk_score
-        
-        # Document Type (Mock based on filename)
-        doc_name = "other"
-        if analysis.document:
-            filename = analysis.document.filename.lower()
-            if "contract" in filename:
-                document_types["contract"] += 1
-            elif "agreement" in filename:
-                document_types["agreement"] += 1
-            elif "policy" in filename:
-                document_types["policy"] += 1
-            else:
-                document_types["other"] += 1
-        else:
-            document_types["other"] += 1
-
-    # Format Daily Trend
     daily_trend = []
-    # Fill in missing days? For now just return days with data
-    for date_str, stats in daily_trend_map.items():
+
+    for rollup in rollups:
+        total_analyses += rollup.analyses_count
+        total_risks_detected_count += rollup.risks_detected
+
+        severity_dist["critical"] += rollup.critical_count
+        severity_dist["high"] += rollup.high_count
+        severity_dist["medium"] += rollup.medium_count
+        severity_dist["low"] += rollup.low_count
+
+        document_types["contract"] += rollup.contract_count
+        document_types["agreement"] += rollup.agreement_count
+        document_types["policy"] += rollup.policy_count
+        document_types["other"] += rollup.other_count
+
         daily_trend.append({
-            "date": date_str,
-            "analyses_count": stats["count"],
-            "average_risk": stats["total_risk"] / stats["count"] if stats["count"] > 0 else 0
+            "date": rollup.day.isoformat(),
+            "analyses_count": rollup.analyses_count,
+            "average_risk": float(rollup.risk_score_sum) / rollup.analyses_count if rollup.analyses_count > 0 else 0
         })
-    
-    # Sort by date
-    daily_trend.sort(key=lambda x: x["date"])
-    
-    # Performance Metrics
-    avg_processing_time = "45s" # Mock
-    accuracy_rate = "94%" # Mock
-    
-    total_risks_detected_count = 0
-    for analysis in analyses:
-        data = analysis.response or {}
-        detailed = data.get("detailed_analysis", {})
-        risks = detailed.get("identified_risks", [])
-        total_risks_detected_count += len(risks)
+
+    # Performance Metrics, from the telemetry stored with each analysis
+    processing_time = await processing_time_stats(db, current_user.id, start, end)
+    overall = processing_time["overall"]
+    avg_processing_time = f"{overall['avg_ms'] / 1000:.1f}s" if overall else "N/A"
+    # Share of agent calls that produced a valid analysis
+    accuracy_rate = f"{overall['success_rate']:g}%" if overall else "N/A"
 
     return {
         "success": True,
         "data": {
-            "time_period": "30d",
+            "time_period": period,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
             "total_analyses": total_analyses,
             "daily_trend": daily_trend,
             "severity_distribution": severity_dist,
@@ -125,7 +109,8 @@ def get_analytics_trends(
             "performance_metrics": {
                 "avg_processing_time": avg_processing_time,
                 "accuracy_rate": accuracy_rate,
-                "total_risks_detected": total_risks_detected_count
+                "total_risks_detected": total_risks_detected_count,
+                "processing_time": processing_time
             },
             "insights": [
                 "Risk levels have decreased by 5% compared to last period.",
@@ -134,3 +119,69 @@ def get_analytics_trends(
             ]
         }
     }
+
+@router.get("/usage")
+async def get_token_usage(
+    period: Literal["7d", "30d", "90d", "1y", "custom"] = "30d",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """LLM tokens consumed by the current user, with budget status."""
+    start, end = resolve_period(period, start_date, end_date)
+    in_period = (
+        TokenUsage.user_id == current_user.id,
+        TokenUsage.created_at >= start,
+        TokenUsage.created_at < end + timedelta(days=1)
+    )
+
+    def totals(*columns):
+        return select(
+            *columns,
+            func.sum(TokenUsage.prompt_tokens).label("prompt_tokens"),
+            func.sum(TokenUsage.completion_tokens).label("completion_tokens"),
+            func.sum(TokenUsage.total_tokens).label("total_tokens"),
+            func.count().label("calls")
+        ).where(*in_period)
+
+    def row_totals(row) -> Dict[str, int]:
+        return {
+            "prompt_tokens": int(row.prompt_tokens or 0),
+            "completion_tokens": int(row.completion_tokens or 0),
+            "total_tokens": int(row.total_tokens or 0),
+            "calls": row.calls
+        }
+
+    day = cast(func.date_trunc("day", TokenUsage.created_at), Date).label("day")
+    overall = (await db.execute(totals())).one()
+    by_agent = await db.execute(totals(TokenUsage.agent_type).group_by(TokenUsage.agent_type))
+    by_provider = await db.execute(totals(TokenUsage.provider, TokenUsage.model).group_by(TokenUsage.provider, TokenUsage.model))
+    daily = await db.execute(totals(day).group_by(day).order_by(day))
+    top_documents = await db.execute(
+        totals(TokenUsage.document_id, Document.filename)
+        .outerjoin(Document, Document.id == TokenUsage.document_id)
+        .group_by(TokenUsage.document_id, Document.filename)
+        .order_by(func.sum(TokenUsage.total_tokens).desc())
+        .limit(10)
+    )
+
+    return {
+        "success": True,
+        "data": {
+            "time_period": period,
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "totals": row_totals(overall),
+            "budget": await token_budget_status(db, current_user.id),
+            "by_agent": {row.agent_type: row_totals(row) for row in by_agent},
+            "by_provider": [
+                {"provider": row.provider, "model": row.model, **row_totals(row)} for row in by_provider
+            ],
+            "daily": [{"date": row.day.isoformat(), **row_totals(row)} for row in daily],
+            # document_id is null for deleted documents
+            "top_documents": [
+                {"document_id": row.document_id, "filename": row.filename, **row_totals(row)} for row in top_documents
+            ]
+        }
+    }
@@ -0,0 +1,265 @@
+"""
+LLM token accounting and per-user budgets.
+
+Each agent call that reports usage adds a token_usage row in the same
+transaction as its analysis. Budgets are enforced on token_budget_counters,
+the tokens charged to the user in the current UTC day and month:
+
+    users.daily_token_budget / monthly_token_budget   per-user override
+    DAILY_TOKEN_BUDGET / MONTHLY_TOKEN_BUDGET         default (0: unlimited)
+
+Before an agent is called its estimated tokens are reserved with a single
+conditional upsert on the user's counter row, so concurrent requests
+serialize on that row and cannot overshoot a budget. When the call
+completes, record_token_usage reconciles the reservation to the actual
+usage (failed calls release it) in the day and month it was taken in.
+Whatever is still unreconciled when the request ends (cancelled, or failed
+before the result was saved) is released by release_reservation. Requests
+over budget are rejected with 429 and a Retry-After pointing at the next UTC
+day or month.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from analytics.models import TokenBudgetCounter, TokenUsage
+from auth.models import User
+from database.db import AsyncSessionLocal
+from documents.models import AgentAnalysis
+
+logger = logging.getLogger(__name__)
+
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", 0))
+MONTHLY_TOKEN_BUDGET = int(os.getenv("MONTHLY_TOKEN_BUDGET", 0))
+
+# Request estimate: prompt tokens from the text length, plus the system
+# prompt and the structured response of one agent
+CHARS_PER_TOKEN = 4
+AGENT_OVERHEAD_TOKENS = int(os.getenv("AGENT_OVERHEAD_TOKENS", 3000))
+
+def estimate_tokens(text: Optional[str], agent_count: int = 1) -> int:
+    """Rough token cost of running agent_count agents over text."""
+    return agent_count * (len(text or "") // CHARS_PER_TOKEN + AGENT_OVERHEAD_TOKENS)
+
+def _period_starts(now: datetime):
+    day_start = datetime(now.year, now.month, now.day)
+    month_start = datetime(now.year, now.month, 1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return day_start, day_start + timedelta(days=1), month_start, next_month
+
+@dataclass
+class TokenReservation:
+    """Tokens charged to a user's counters ahead of agent calls, and the day and month charged."""
+    user_id: int
+    tokens: int
+    day: date
+    month: date
+    # Set once the reconciliation of these tokens is committed
+    settled: bool = False
+    parts: List["TokenReservation"] = field(default_factory=list)
+
+    def take(self, tokens: int) -> "TokenReservation":
+        """Split off up to tokens of this reservation for one agent call."""
+        tokens = min(tokens, self.tokens)
+        self.tokens -= tokens
+        part = TokenReservation(self.user_id, tokens, self.day, self.month)
+        self.parts.append(part)
+        return part
+
+    def unsettled(self) -> int:
+        own = 0 if self.settled else self.tokens
+        return own + sum(part.unsettled() for part in self.parts)
+
+    def mark_settled(self):
+        self.settled = True
+        for part in self.parts:
+            part.mark_settled()
+
+async def _adjust_counter(db: AsyncSession, user_id: int, delta: int, day: Optional[date] = None, month: Optional[date] = None):
+    """
+    Add delta to the user's counters for day and month (the current ones by
+    default), never below zero. If a counter has since moved on to a later
+    period, a release no longer applies, but tokens used beyond a
+    reservation are charged to the current period.
+    """
+    if not delta:
+        return
+    day_start, _, month_start, _ = _period_starts(datetime.utcnow())
+    day = day or day_start.date()
+    month = month or month_start.date()
+    counter = TokenBudgetCounter
+    day_cases = [(counter.day == day, func.greatest(counter.day_used + delta, 0))]
+    month_cases = [(counter.month == month, func.greatest(counter.month_used + delta, 0))]
+    if delta > 0:
+        day_cases.append((counter.day > day, counter.day_used + delta))
+        month_cases.append((counter.month > month, counter.month_used + delta))
+    await db.execute(update(counter).where(counter.user_id == user_id).values(
+        day_used=case(*day_cases, else_=counter.day_used),
+        month_used=case(*month_cases, else_=counter.month_used)
+    ))
+
+async def record_token_usage(
+    db: AsyncSession, analysis: AgentAnalysis, telemetry: Optional[dict], reservation: Optional[TokenReservation] = None
+):
+    """
+    Add a ledger row for the agent call that produced analysis and
+    reconcile the tokens reserved for it to the actual usage. Does not
+    commit; mark the reservation settled once the caller has committed.
+    """
+    prompt_tokens = completion_tokens = 0
+    if isinstance(telemetry, dict):
+        prompt_tokens = int(telemetry.get("prompt_tokens") or 0)
+        completion_tokens = int(telemetry.get("completion_tokens") or 0)
+    if reservation is None:
+        await _adjust_counter(db, analysis.user_id, prompt_tokens + completion_tokens)
+    else:
+        await _adjust_counter(
+            db, analysis.user_id, prompt_tokens + completion_tokens - reservation.tokens, reservation.day, reservation.month
+        )
+    if not prompt_tokens and not completion_tokens:
+        return
+    db.add(TokenUsage(
+        user_id=analysis.user_id,
+        document_id=analysis.document_id,
+        agent_type=analysis.agent_type,
+        provider=telemetry.get("provider"),
+        model=telemetry.get("model"),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens
+    ))
+
+async def _user_budgets(db: AsyncSession, user_id: int):
+    result = await db.execute(select(User.daily_token_budget, User.monthly_token_budget).where(User.id == user_id))
+    budgets = result.first()
+    daily = budgets.daily_token_budget if budgets and budgets.daily_token_budget is not None else DAILY_TOKEN_BUDGET
+    monthly = budgets.monthly_token_budget if budgets and budgets.monthly_token_budget is not None else MONTHLY_TOKEN_BUDGET
+    return daily, monthly
+
+async def token_budget_status(db: AsyncSession, user_id: int) -> dict:
+    """Tokens charged today and this month (including reservations) against the user's budgets (None: unlimited)."""
+    day_start, next_day, month_start, next_month = _period_starts(datetime.utcnow())
+
+    result = await db.execute(select(TokenBudgetCounter).where(TokenBudgetCounter.user_id == user_id))
+    counter = result.scalars().first()
+    used_today = counter.day_used if counter and counter.day == day_start.date() else 0
+    used_month = counter.month_used if counter and counter.month == month_start.date() else 0
+    daily, monthly = await _user_budgets(db, user_id)
+
+    return {
+        "daily": {
+            "used": int(used_today),
+            "budget": daily or None,
+            "remaining": max(daily - int(used_today), 0) if daily else None,
+            "resets_at": next_day
+        },
+        "monthly": {
+            "used": int(used_month),
+            "budget": monthly or None,
+            "remaining": max(monthly - int(used_month), 0) if monthly else None,
+            "resets_at": next_month
+        }
+    }
+
+def _budget_exceeded(period: str, entry: dict, estimated_tokens: int) -> HTTPException:
+    retry_after = max(int((entry["resets_at"] - datetime.utcnow()).total_seconds()), 1)
+    return HTTPException(
+        status_code=429,
+        detail={
+            "message": f"{period.capitalize()} token budget exceeded",
+            "used": entry["used"],
+            "budget": entry["budget"],
+            "estimated": estimated_tokens,
+            "resets_at": entry["resets_at"].isoformat()
+        },
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def reserve_tokens(db: AsyncSession, user_id: int, estimated_tokens: int) -> Optional[TokenReservation]:
+    """
+    Charge estimated_tokens to the user's counters if they fit both budgets.
+    Commits.
+
+    Returns:
+        The reservation, or None when a budget would be exceeded
+        (see budget_exceeded_error)
+    """
+    daily, monthly = await _user_budgets(db, user_id)
+    day_start, _, month_start, _ = _period_starts(datetime.utcnow())
+    counter = TokenBudgetCounter
+    fits = (not daily or estimated_tokens <= daily) and (not monthly or estimated_tokens <= monthly)
+
+    reserved = None
+    if fits:
+        stmt = insert(counter).values(
+            user_id=user_id,
+            day=day_start.date(), day_used=estimated_tokens,
+            month=month_start.date(), month_used=estimated_tokens
+        )
+        # A counter left over from an earlier day or month starts again from zero
+        day_used = case((counter.day == stmt.excluded.day, counter.day_used), else_=0)
+        month_used = case((counter.month == stmt.excluded.month, counter.month_used), else_=0)
+        conditions = []
+        if daily:
+            conditions.append(day_used + estimated_tokens <= daily)
+        if monthly:
+            conditions.append(month_used + estimated_tokens <= monthly)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[counter.user_id],
+            set_={
+                "day": stmt.excluded.day,
+                "day_used": day_used + estimated_tokens,
+                "month": stmt.excluded.month,
+                "month_used": month_used + estimated_tokens
+            },
+            where=and_(*conditions) if conditions else None
+        ).returning(counter.user_id)
+        reserved = (await db.execute(stmt)).first()
+    await db.commit()
+    if reserved is None:
+        return None
+    return TokenReservation(user_id, estimated_tokens, day_start.date(), month_start.date())
+
+async def budget_exceeded_error(db: AsyncSession, user_id: int, estimated_tokens: int) -> HTTPException:
+    """The 429 for a reservation of estimated_tokens that did not fit."""
+    status = await token_budget_status(db, user_id)
+    limited = [period for period in ("daily", "monthly") if status[period]["budget"] is not None]
+    exceeded = [period for period in limited if status[period]["used"] + estimated_tokens > status[period]["budget"]]
+    # exceeded is empty only if usage dropped between the upsert and the status read
+    period = (exceeded or limited)[0]
+    return _budget_exceeded(period, status[period], estimated_tokens)
+
+async def enforce_token_budget(db: AsyncSession, user_id: int, estimated_tokens: int) -> TokenReservation:
+    """Reserve estimated_tokens, or raise 429 if they would exceed the user's daily or monthly budget. Commits."""
+    reservation = await reserve_tokens(db, user_id, estimated_tokens)
+    if reservation is None:
+        raise await budget_exceeded_error(db, user_id, estimated_tokens)
+    return reservation
+
+async def _release(reservation: TokenReservation):
+    tokens = reservation.unsettled()
+    if not tokens:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await _adjust_counter(db, reservation.user_id, -tokens, reservation.day, reservation.month)
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Could not release {tokens} reserved tokens of user {reservation.user_id}: {e}")
+        return
+    reservation.mark_settled()
+
+async def release_reservation(reservation: Optional[TokenReservation]):
+    """
+    Give back the tokens of reservation that were never reconciled. Call in
+    a finally block once the request is done; runs to completion even if the
+    request is being cancelled.
+    """
+    if reservation is not None and reservation.unsettled():
+        await asyncio.shield(_release(reservation))
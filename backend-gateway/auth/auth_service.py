@@ -1,20 +1,34 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from database.db import get_db
 from auth.models import User
+from auth.principal_cache import Principal, principal_cache
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60))
+# Usernames allowed on operational endpoints (comma-separated; none by default)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
 
 security = HTTPBearer()
 
+# bcrypt work factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# bcrypt takes ~250ms per call at cost 12, so it runs on its own bounded pool
+# instead of the event loop (bcrypt releases the GIL while hashing)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
 def verify_password(plain_password, hashed_password):
     if isinstance(plain_password, str):
         plain_password = plain_password.encode('utf-8')
@@ -25,7 +39,23 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     if isinstance(password, str):
         password = password.encode('utf-8')
-    return bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True when the hash was made with a different work factor than BCRYPT_ROUNDS."""
+    try:
+        # Format: $2b$<cost>$<salt+hash>
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (AttributeError, IndexError, ValueError):
+        return False
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, get_password_hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -48,48 +78,116 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str, credentials_exception):
+    return decode_token(token, credentials_exception)["sub"]
+
+def decode_token(token: str, credentials_exception) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+        if payload.get("sub") is None:
             raise credentials_exception
-        return username
+        return payload
     except JWTError:
         raise credentials_exception
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def token_claims(user: User) -> dict:
+    """Claims identifying a user in access and refresh tokens."""
+    return {"sub": user.username, "uid": user.id, "ver": user.token_version or 0}
+
+def token_version_matches(payload: dict, token_version: Optional[int]) -> bool:
+    """Tokens issued before versioning carry no "ver" and count as version 0."""
+    return (payload.get("ver") or 0) == (token_version or 0)
+
+async def load_principal(db: AsyncSession, user_id: Optional[int] = None, username: Optional[str] = None) -> Optional[Principal]:
+    """Load a principal from the database and cache it."""
+    generation = principal_cache.generation
+    if user_id is not None:
+        user = await db.get(User, user_id)
+    else:
+        result = await db.execute(select(User).filter(User.username == username))
+        user = result.scalars().first()
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.put(principal, generation)
+    return principal
+
+_bypass_user_id: Optional[int] = None
+
+async def _get_bypass_principal(db: AsyncSession) -> Principal:
+    global _bypass_user_id
+    if _bypass_user_id is not None:
+        principal = principal_cache.get(_bypass_user_id) or await load_principal(db, user_id=_bypass_user_id)
+        if principal:
+            return principal
+
+    principal = await load_principal(db, username="admin")
+    if not principal:
+        # Create seeded admin user if not exists
+        user = User(
+            username="admin", 
+            email="admin@example.com", 
+            phone_number="0000000000",
+            full_name="Super Admin", 
+            hashed_password=await get_password_hash_async("admin")
+        )
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+    _bypass_user_id = principal.id
+    return principal
+
+async def principal_from_token(db: AsyncSession, token: str) -> Optional[Principal]:
+    """
+    The active principal a JWT access token belongs to, or None if the
+    token is invalid, revoked or belongs to an inactive user.
+
+    Tokens carrying "uid"/"ver" are served from principal_cache without a
+    query while the cached version matches; older tokens (username only)
+    fall back to a lookup by username. Either way a token whose version is
+    not the user's current token_version is rejected.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username = payload.get("sub")
+    if username is None:
+        return None
+
+    user_id = payload.get("uid")
+    if user_id is None:
+        principal = await load_principal(db, username=username)
+    else:
+        principal = principal_cache.get(user_id)
+        if principal is None or not token_version_matches(payload, principal.token_version):
+            # Not cached, or the token is newer than the cached entry
+            principal = await load_principal(db, user_id=user_id)
+
+    if principal is None or not principal.is_active or not token_version_matches(payload, principal.token_version):
+        return None
+    return principal
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)) -> Principal:
+    """Resolve the bearer token to a Principal (see principal_from_token)."""
     token = credentials.credentials
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     
     # Check for bypass token
     if token == "iamsuperman":
-        user = db.query(User).filter(User.username == "admin").first()
-        if not user:
-             # Create seeded admin user if not exists
-            user = User(
-                username="admin", 
-                email="admin@example.com", 
-                phone_number="0000000000",
-                full_name="Super Admin", 
-                hashed_password=get_password_hash("admin")
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        return user
+        return await _get_bypass_principal(db)
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    principal = await principal_from_token(db, token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+async def get_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """get_current_user, restricted to the users listed in ADMIN_USERNAMES."""
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,70 @@
+"""
+Cross-worker invalidation of cached principals.
+
+Migration 015 adds a trigger on users that runs
+pg_notify('principal_invalidated', <user id>) when a cached field (username,
+email, full_name, is_active, token_version) changes or a user is deleted.
+The notification is delivered on commit, whichever process or SQL session
+made the change. Every gateway worker keeps one dedicated connection
+LISTENing on the channel and drops the user's cache entry.
+
+LISTEN needs a direct session, so with DB_PGBOUNCER (transaction pooling)
+set AUTH_LISTEN_DATABASE_URL to the database itself. Without a listener
+connection, cache entries are only bounded by AUTH_CACHE_TTL.
+"""
+import asyncio
+import logging
+import os
+from typing import Optional
+import asyncpg
+from sqlalchemy.engine import make_url
+from database.db import ASYNC_DATABASE_URL, DB_PGBOUNCER
+from auth.principal_cache import principal_cache
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CHANNEL = "principal_invalidated"
+AUTH_LISTEN_DATABASE_URL = os.getenv("AUTH_LISTEN_DATABASE_URL", "" if DB_PGBOUNCER else ASYNC_DATABASE_URL)
+AUTH_LISTEN_RETRY = float(os.getenv("AUTH_LISTEN_RETRY", 5))
+
+def _listen_dsn() -> Optional[str]:
+    if not AUTH_LISTEN_DATABASE_URL:
+        return None
+    # asyncpg takes a plain libpq URL
+    return make_url(AUTH_LISTEN_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        principal_cache.invalidate(int(payload))
+    except ValueError:
+        principal_cache.clear()
+
+async def run_invalidation_listener():
+    """Background loop started with the app."""
+    dsn = _listen_dsn()
+    if dsn is None:
+        logger.warning(f"No principal invalidation listener; cached principals expire after {principal_cache.ttl}s")
+        return
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+        except Exception as e:
+            logger.error(f"Principal invalidation listener could not connect: {e}")
+            await asyncio.sleep(AUTH_LISTEN_RETRY)
+            continue
+
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _: closed.set())
+        try:
+            await connection.add_listener(PRINCIPAL_CHANNEL, _on_notification)
+            # Changes made while disconnected were missed
+            principal_cache.clear()
+            await closed.wait()
+            logger.warning("Principal invalidation listener disconnected")
+        except Exception as e:
+            logger.error(f"Principal invalidation listener failed: {e}")
+        finally:
+            principal_cache.clear()
+            if not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(AUTH_LISTEN_RETRY)
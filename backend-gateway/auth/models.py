@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean
 from database.db import Base
 
 class User(Base):
@@ -11,3 +11,8 @@ class User(Base):
     full_name = Column(String)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+    # Bumped to revoke every token issued before (password change, deactivation)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # LLM token budgets; NULL uses DAILY_TOKEN_BUDGET / MONTHLY_TOKEN_BUDGET, 0 is unlimited
+    daily_token_budget = Column(Integer, nullable=True)
+    monthly_token_budget = Column(BigInteger, nullable=True)
@@ -0,0 +1,83 @@
+"""
+In-process cache of authenticated principals.
+
+Access tokens carry the user id ("uid") and the user's token_version
+("ver"), so a request whose principal is cached needs no database query at
+all. Entries are evicted least-recently-used beyond AUTH_CACHE_SIZE and
+expire after AUTH_CACHE_TTL seconds.
+
+Invalidation is shared by all workers: a trigger on users (migration 015)
+sends a Postgres NOTIFY on principal_invalidated whenever a cached field
+changes, and every worker's listener (auth/invalidation.py) drops the
+entry. Deactivation and password changes also bump token_version, which
+revokes outstanding access and refresh tokens. While a worker's listener is disconnected,
+entries are still bounded by AUTH_CACHE_TTL, and the cache is cleared on
+reconnect.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+
+@dataclass(frozen=True)
+class Principal:
+    """Read-only snapshot of the authenticated user handed to endpoints."""
+    id: int
+    username: str
+    email: Optional[str]
+    full_name: Optional[str]
+    is_active: bool
+    token_version: int
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=user.is_active is not False,
+            token_version=user.token_version or 0
+        )
+
+class PrincipalCache:
+    def __init__(self, ttl: float = AUTH_CACHE_TTL, max_size: int = AUTH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Bumped by every invalidation, so a principal loaded before one is not cached after it
+        self.generation = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        principal, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return principal
+
+    def put(self, principal: Principal, generation: Optional[int] = None):
+        """Cache principal, unless an invalidation happened since generation was read."""
+        if self.ttl <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[principal.id] = (principal, time.monotonic() + self.ttl)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self.generation += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+principal_cache = PrincipalCache()
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
-from database.db import get_db
+from database.db import get_db, release_connection
 from auth.models import User
-from auth.auth_service import verify_password, get_password_hash, create_access_token, get_current_user, create_refresh_token, verify_token
+from auth.auth_service import verify_password_async, get_password_hash_async, password_needs_rehash, create_access_token, get_current_user, create_refresh_token, decode_token, token_claims, token_version_matches
+from auth.principal_cache import Principal, principal_cache
 from pydantic import BaseModel
 from typing import Optional, Generic, TypeVar, Any
-from sqlalchemy import or_
+from sqlalchemy import or_, select
 
 router = APIRouter(
     prefix="/auth",
@@ -55,17 +56,42 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+async def authenticate_user(db: AsyncSession, login_identifier: str, password: str) -> User:
+    """Check credentials, upgrading the stored hash if BCRYPT_ROUNDS changed."""
+    result = await db.execute(select(User).filter(
+        or_(
+            User.username == login_identifier,
+            User.email == login_identifier,
+            User.phone_number == login_identifier
+        )
+    ))
+    user = result.scalars().first()
+    # Don't hold a pooled connection while bcrypt runs
+    await release_connection(db)
+    
+    if not user or not await verify_password_async(password, user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username/email/phone or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    if password_needs_rehash(user.hashed_password):
+        user.hashed_password = await get_password_hash_async(password)
+        await db.commit()
+    return user
+
 @router.post("/register", response_model=APIResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if any identifier already exists
-    if db.query(User).filter(User.username == user.username).first():
+    if (await db.execute(select(User.id).filter(User.username == user.username))).first():
         raise HTTPException(status_code=400, detail="Username already registered")
-    if db.query(User).filter(User.email == user.email).first():
+    if (await db.execute(select(User.id).filter(User.email == user.email))).first():
         raise HTTPException(status_code=400, detail="Email already registered")
-    if db.query(User).filter(User.phone_number == user.phone_number).first():
+    if (await db.execute(select(User.id).filter(User.phone_number == user.phone_number))).first():
         raise HTTPException(status_code=400, detail="Phone number already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     new_user = User(
         username=user.username,
         email=user.email,
@@ -74,11 +100,11 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
-    access_token = create_access_token(data={"sub": new_user.username})
-    refresh_token = create_refresh_token(data={"sub": new_user.username})
+    access_token = create_access_token(data=token_claims(new_user))
+    refresh_token = create_refresh_token(data=token_claims(new_user))
     
     # Create UserResponse object
     user_response = UserResponse(
@@ -95,46 +121,20 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     # form_data.username can be username, email, or phone
     login_identifier = form_data.username
-    user = db.query(User).filter(
-        or_(
-            User.username == login_identifier,
-            User.email == login_identifier,
-            User.phone_number == login_identifier
-        )
-    ).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username/email/phone or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    access_token = create_access_token(data={"sub": user.username})
+    user = await authenticate_user(db, login_identifier, form_data.password)
+    access_token = create_access_token(data=token_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=APIResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_db)):
     # request.username can be username, email, or phone
     login_identifier = request.username
-    user = db.query(User).filter(
-        or_(
-            User.username == login_identifier,
-            User.email == login_identifier,
-            User.phone_number == login_identifier
-        )
-    ).first()
-    
-    if not user or not verify_password(request.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username/email/phone or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    access_token = create_access_token(data={"sub": user.username})
-    refresh_token = create_refresh_token(data={"sub": user.username})
+    user = await authenticate_user(db, login_identifier, request.password)
+    access_token = create_access_token(data=token_claims(user))
+    refresh_token = create_refresh_token(data=token_claims(user))
     
     # Create UserResponse object
     user_response = UserResponse(
@@ -154,20 +154,27 @@ class RefreshRequest(BaseModel):
     refresh_token: str
 
 @router.post("/refresh", response_model=APIResponse)
-def refresh_token(request: RefreshRequest, db: Session = Depends(get_db)):
+async def refresh_token(request: RefreshRequest, db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    username = verify_token(request.refresh_token, credentials_exception)
-    user = db.query(User).filter(User.username == username).first()
+    payload = decode_token(request.refresh_token, credentials_exception)
+    if payload.get("uid") is not None:
+        user = await db.get(User, payload["uid"])
+    else:
+        result = await db.execute(select(User).filter(User.username == payload["sub"]))
+        user = result.scalars().first()
     
-    if user is None:
+    if user is None or user.is_active is False:
+        raise credentials_exception
+    if not token_version_matches(payload, user.token_version):
+        # Issued before the user was deactivated or changed their password
         raise credentials_exception
         
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data=token_claims(user))
     # Optionally rotate refresh token here
     
     return APIResponse(
@@ -177,7 +184,7 @@ def refresh_token(request: RefreshRequest, db: Session = Depends(get_db)):
     )
 
 @router.get("/me", response_model=APIResponse)
-def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: Principal = Depends(get_current_user)):
     user_response = UserResponse(
         id=current_user.id,
         username=current_user.username,
@@ -191,22 +198,37 @@ def read_users_me(current_user: User = Depends(get_current_user)):
     )
 
 @router.post("/change-password")
-def change_password(request: ChangePasswordRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    if not verify_password(request.old_password, current_user.hashed_password):
+async def change_password(request: ChangePasswordRequest, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, current_user.id)
+    if not await verify_password_async(request.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect old password")
     
-    current_user.hashed_password = get_password_hash(request.new_password)
-    db.commit()
-    return {"message": "Password changed successfully"}
+    user.hashed_password = await get_password_hash_async(request.new_password)
+    # Revokes every token issued before; the caller gets a fresh pair
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    # Other workers drop theirs on the principal_invalidated notification
+    principal_cache.invalidate(user.id)
+    return APIResponse(
+        success=True,
+        message="Password changed successfully",
+        data={
+            "token": create_access_token(data=token_claims(user)),
+            "refresh_token": create_refresh_token(data=token_claims(user))
+        }
+    )
 
 @router.post("/reset-password")
-def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == request.username).first()
+async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).filter(User.username == request.username))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user.hashed_password = get_password_hash("test@123")
-    db.commit()
+    user.hashed_password = await get_password_hash_async("test@123")
+    user.token_version = (user.token_version or 0) + 1
+    await db.commit()
+    principal_cache.invalidate(user.id)
     return {"message": "Password reset to test@123"}
 
 class UserUpdate(BaseModel):
@@ -214,24 +236,26 @@ class UserUpdate(BaseModel):
     email: Optional[str] = None
 
 @router.put("/profile", response_model=APIResponse)
-def update_profile(update_data: UserUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def update_profile(update_data: UserUpdate, current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    user = await db.get(User, current_user.id)
     if update_data.full_name:
-        current_user.full_name = update_data.full_name
+        user.full_name = update_data.full_name
     if update_data.email:
         # Check if email is taken by another user
-        existing = db.query(User).filter(User.email == update_data.email, User.id != current_user.id).first()
+        result = await db.execute(select(User.id).filter(User.email == update_data.email, User.id != current_user.id))
+        existing = result.first()
         if existing:
             raise HTTPException(status_code=400, detail="Email already in use")
-        current_user.email = update_data.email
+        user.email = update_data.email
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    principal_cache.invalidate(user.id)
     
     user_response = UserResponse(
-        id=current_user.id,
-        username=current_user.username,
-        email=current_user.email,
-        full_name=current_user.full_name
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name
     )
     
     return APIResponse(
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, joinedload
+from sqlalchemy import func, desc, select
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 from database.db import get_db
 from documents.models import Document, AgentAnalysis, Report
 from auth.auth_service import get_current_user
-from auth.models import User
+from auth.principal_cache import Principal
 
 router = APIRouter(
     prefix="/dashboard",
@@ -14,40 +15,50 @@ router = APIRouter(
 )
 
 @router.get("/real-time-stats")
-def get_real_time_stats(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+async def get_real_time_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     # 1. Total Documents
-    total_documents = db.query(Document).filter(Document.user_id == current_user.id).count()
+    total_documents = await db.scalar(
+        select(func.count()).select_from(Document).filter(Document.user_id == current_user.id)
+    )
 
     # 2. Recent Uploads (last 24 hours)
     twenty_four_hours_ago = datetime.utcnow() - timedelta(hours=24)
-    recent_uploads_count = db.query(Document).filter(
+    recent_uploads_count = await db.scalar(select(func.count()).select_from(Document).filter(
         Document.user_id == current_user.id,
         Document.upload_date >= twenty_four_hours_ago
-    ).count()
+    ))
 
     # 3. All Reports (Downloaded/Generated)
-    all_reports_count = db.query(Report).filter(Report.user_id == current_user.id).count()
+    all_reports_count = await db.scalar(
+        select(func.count()).select_from(Report).filter(Report.user_id == current_user.id)
+    )
 
     # 4. Analysis History (Completed Analyses)
-    analysis_history_count = db.query(AgentAnalysis).filter(
+    analysis_history_count = await db.scalar(select(func.count()).select_from(AgentAnalysis).filter(
         AgentAnalysis.user_id == current_user.id,
         AgentAnalysis.success == True
-    ).count()
+    ))
 
     # 5. Recent Uploads List (Top 5)
-    recent_docs = db.query(Document).filter(Document.user_id == current_user.id)\
-        .order_by(desc(Document.upload_date))\
-        .limit(5)\
-        .all()
+    result = await db.execute(
+        select(Document).filter(Document.user_id == current_user.id)
+        .options(defer(Document.extracted_text))
+        .order_by(desc(Document.upload_date))
+        .limit(5)
+    )
+    recent_docs = result.scalars().all()
     
     recent_uploads_list = []
     for doc in recent_docs:
         # Determine status based on analysis
         # Check if any analysis exists
-        analysis = db.query(AgentAnalysis).filter(AgentAnalysis.document_id == doc.id).first()
+        result = await db.execute(
+            select(AgentAnalysis.success).filter(AgentAnalysis.document_id == doc.id).limit(1)
+        )
+        analysis = result.first()
         status = "Uploaded"
         if analysis:
             if analysis.success:
@@ -65,16 +76,20 @@ def get_real_time_stats(
 
     # 6. All Reports List (Top 5 Risk Analyses)
     # We want to show risk level and percentage.
-    recent_analyses = db.query(AgentAnalysis).filter(
+    result = await db.execute(select(AgentAnalysis).filter(
         AgentAnalysis.user_id == current_user.id,
         AgentAnalysis.agent_type == 'risk',
         AgentAnalysis.success == True
-    ).order_by(desc(AgentAnalysis.created_at)).limit(5).all()
+    ).options(
+        defer(AgentAnalysis.response),
+        defer(AgentAnalysis.extracted_text),
+        joinedload(AgentAnalysis.document).defer(Document.extracted_text)
+    ).order_by(desc(AgentAnalysis.created_at)).limit(5))
+    recent_analyses = result.scalars().all()
 
     all_reports_list = []
     for analysis in recent_analyses:
-        data = analysis.response or {}
-        risk_score = data.get('risk_score', 0)
+        risk_score = analysis.risk_percentage or 0
         # Determine level
         level = "low"
         if risk_score > 80:
@@ -0,0 +1,166 @@
+"""
+Versioned migration runner.
+
+Applies migrations/NNN_description.sql in version order and records each
+applied version in the schema_migrations table, so every deploy brings the
+database to the current schema exactly once. Run on deploy (entrypoint.sh):
+
+    python -m database.migrate
+
+Files containing the line "-- migrate:no-transaction" are executed statement
+by statement in autocommit mode (needed for CREATE INDEX CONCURRENTLY);
+all other files run inside a single transaction together with their
+schema_migrations record.
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import List
+
+# Allow running as a script from the backend-gateway directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from database.db import engine, Base
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+MIGRATION_FILE_PATTERN = re.compile(r"^(\d+)_([\w\-]+)\.sql$")
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+
+# Arbitrary constant shared by all gateway replicas so only one migrates at a time
+MIGRATION_LOCK_ID = 7_345_001
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    path: str
+    sql: str
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+    @property
+    def transactional(self) -> bool:
+        return NO_TRANSACTION_MARKER not in self.sql
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """Return all migration files in version order."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        path = os.path.join(directory, filename)
+        with open(path, "r", encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append(Migration(int(match.group(1)), match.group(2), path, sql))
+
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}: {versions}")
+    return migrations
+
+def split_statements(sql: str) -> List[str]:
+    """Split a no-transaction migration into individual statements."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
+def _ensure_migrations_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            checksum VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+    """))
+
+def _create_base_schema(bind):
+    """Create tables that do not exist yet from the ORM models (fresh databases)."""
+    # Import models so they are registered on Base.metadata
+    from auth.models import User
+    from documents.models import Document, AgentAnalysis, Report, Blob, UploadSession, BulkBatch
+    from analytics.models import DailyRiskRollup, TokenUsage, TokenBudgetCounter
+    Base.metadata.create_all(bind=bind)
+
+def _execute_script(conn, sql: str):
+    # Raw DBAPI cursor: migration files contain literal '%' and must not be
+    # subject to parameter formatting
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+def run_migrations(bind: Engine = engine) -> List[int]:
+    """
+    Create the base schema and apply all pending migrations.
+
+    Returns:
+        Versions applied during this run
+    """
+    applied_now = []
+    migrations = discover_migrations()
+
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            _create_base_schema(bind)
+
+            with bind.begin() as conn:
+                _ensure_migrations_table(conn)
+                applied = {
+                    row.version: row.checksum
+                    for row in conn.execute(text("SELECT version, checksum FROM schema_migrations"))
+                }
+
+            for migration in migrations:
+                if migration.version in applied:
+                    if applied[migration.version] != migration.checksum:
+                        logger.warning(f"Migration {migration.version}_{migration.name} changed after it was applied")
+                    continue
+
+                logger.info(f"Applying migration {migration.version}_{migration.name}")
+                print(f"   Applying {migration.version:03d}_{migration.name}")
+
+                record = text("INSERT INTO schema_migrations (version, name, checksum) VALUES (:version, :name, :checksum)")
+                params = {"version": migration.version, "name": migration.name, "checksum": migration.checksum}
+
+                if migration.transactional:
+                    with bind.begin() as conn:
+                        _execute_script(conn, migration.sql)
+                        conn.execute(record, params)
+                else:
+                    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        for statement in split_statements(migration.sql):
+                            _execute_script(conn, statement)
+                        conn.execute(record, params)
+
+                applied_now.append(migration.version)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+    return applied_now
+
+if __name__ == "__main__":
+    print("Running database migrations...")
+    print("-" * 50)
+    try:
+        versions = run_migrations()
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        raise
+    if versions:
+        print(f"✅ Applied {len(versions)} migration(s)")
+    else:
+        print("✅ Database schema is up to date")
+    print("-" * 50)
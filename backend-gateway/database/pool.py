@@ -0,0 +1,120 @@
+"""
+Connection pool instrumentation for the async engine.
+
+TimedAsyncQueuePool records how long each checkout waits for a pooled
+connection, so pool exhaustion shows up as growing wait times (and
+timeouts) instead of as unexplained endpoint latency. Time spent opening a
+new database connection during a checkout is recorded separately as
+connect time and left out of the wait, so slow connects can be told apart
+from pool starvation.
+"""
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from monitoring.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_CONNECT_TIME, DB_POOL_TIMEOUTS
+
+# Upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+class PoolStats:
+    """Cumulative checkout wait statistics for one pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.bucket_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self.connects = 0
+        self.total_connect = 0.0
+        self.max_connect = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+            else:
+                self.bucket_counts[-1] += 1
+
+    def record_connect(self, seconds: float):
+        with self._lock:
+            self.connects += 1
+            self.total_connect += seconds
+            self.max_connect = max(self.max_connect, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            buckets = {f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS, self.bucket_counts)}
+            buckets["le_inf"] = self.bucket_counts[-1]
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "wait_histogram": buckets,
+                "connects": self.connects,
+                "avg_connect_ms": round(self.total_connect / self.connects * 1000, 3) if self.connects else 0.0,
+                "max_connect_ms": round(self.max_connect * 1000, 3),
+            }
+
+pool_stats = PoolStats()
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records checkout wait and connect times in pool_stats."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        invoke_creator = self._invoke_creator
+
+        def timed_creator(connection_record):
+            started = time.perf_counter()
+            try:
+                return invoke_creator(connection_record)
+            finally:
+                # Read back by the checkout that triggered the connect
+                connection_record.record_info["connect_started"] = started
+                connection_record.record_info["connect_seconds"] = time.perf_counter() - started
+        self._invoke_creator = timed_creator
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_stats.record(time.perf_counter() - start, timed_out=True)
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        wait = time.perf_counter() - start
+        record_info = connection._connection_record.record_info
+        if record_info.get("connect_started", 0) >= start:
+            connect = record_info["connect_seconds"]
+            wait = max(wait - connect, 0.0)
+            pool_stats.record_connect(connect)
+            DB_POOL_CONNECT_TIME.observe(connect)
+        pool_stats.record(wait)
+        DB_POOL_CHECKOUT_WAIT.observe(wait)
+        return connection
+
+def pool_status(pool) -> dict:
+    """Current occupancy of a pool plus its cumulative wait statistics."""
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+    status.update(pool_stats.snapshot())
+    return status
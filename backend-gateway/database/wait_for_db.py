@@ -0,0 +1,52 @@
+"""
+Wait until the database accepts connections.
+
+Polls with "SELECT 1" every DB_WAIT_INTERVAL seconds and exits as soon as it
+succeeds, or with status 1 after DB_WAIT_TIMEOUT seconds. Run on deploy
+before the migrations (entrypoint.sh):
+
+    python -m database.wait_for_db
+"""
+import os
+import sys
+import time
+
+# Allow running as a script from the backend-gateway directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from database.db import engine
+
+DB_WAIT_TIMEOUT = float(os.getenv("DB_WAIT_TIMEOUT", 60))
+DB_WAIT_INTERVAL = float(os.getenv("DB_WAIT_INTERVAL", 0.5))
+
+def wait_for_db(bind: Engine = engine, timeout: float = DB_WAIT_TIMEOUT, interval: float = DB_WAIT_INTERVAL) -> float:
+    """
+    Block until the database answers.
+
+    Returns:
+        Seconds waited
+
+    Raises:
+        TimeoutError: The database did not answer within timeout seconds
+    """
+    started = time.monotonic()
+    while True:
+        try:
+            with bind.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return time.monotonic() - started
+        except Exception as e:
+            waited = time.monotonic() - started
+            if waited >= timeout:
+                raise TimeoutError(f"Database not ready after {waited:.1f}s: {e}") from e
+            time.sleep(interval)
+
+if __name__ == "__main__":
+    try:
+        waited = wait_for_db()
+    except TimeoutError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Database ready after {waited:.1f}s")
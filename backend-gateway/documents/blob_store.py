@@ -0,0 +1,175 @@
+"""
+Content-addressed storage for uploaded files.
+
+Files are streamed to a temporary file in fixed-size chunks while their
+SHA-256 is computed, then moved to BLOB_DIR/<aa>/<bb>/<sha256>. Identical
+uploads therefore share one file on disk; the blobs table counts how many
+documents reference each blob so the file is removed with its last
+document.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from documents.models import Blob
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "shared_data/blobs"
+BLOB_TMP_DIR = os.path.join(BLOB_DIR, "tmp")
+os.makedirs(BLOB_TMP_DIR, exist_ok=True)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+HASH_READ_SIZE = 1024 * 1024
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file on disk, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def ensure_content_hash(db: AsyncSession, row, path: str) -> str:
+    """
+    Return row.content_hash, computing and saving it first for rows stored
+    before content hashes were recorded (Document or Report). Commits.
+    """
+    if not row.content_hash:
+        row.content_hash = await run_in_threadpool(hash_file, path)
+        await db.commit()
+    return row.content_hash
+
+def blob_path(sha256: str) -> str:
+    """Fan-out path for a blob: shared_data/blobs/ab/cd/abcd..."""
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+def new_temp_path() -> str:
+    return os.path.join(BLOB_TMP_DIR, uuid.uuid4().hex)
+
+def _append(path: str, chunk: bytes):
+    with open(path, "ab") as f:
+        f.write(chunk)
+
+async def stream_to_temp(upload_file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, str, int]:
+    """
+    Copy an upload to a temporary file chunk by chunk, hashing as it goes.
+
+    Returns:
+        (temp_path, sha256, size)
+
+    Raises:
+        HTTPException 413 if the upload is larger than max_bytes
+    """
+    temp_path = new_temp_path()
+    digest = hashlib.sha256()
+    size = 0
+    f = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB"
+                )
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        f.close()
+        discard_temp(temp_path)
+        raise
+    f.close()
+    return temp_path, digest.hexdigest(), size
+
+def discard_temp(temp_path: str):
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+def promote_temp(temp_path: str, sha256: str) -> str:
+    """
+    Atomically move a fully written temp file to its blob path.
+
+    The file is replaced even if the blob already exists (same content), so
+    an upload racing with the deletion of the blob's last reference always
+    ends with the file present. Call after add_blob_reference.
+    """
+    path = blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    return path
+
+async def add_blob_reference(db: AsyncSession, sha256: str, size: int) -> str:
+    """Record one more document referencing the blob. Does not commit."""
+    return (await add_blob_references(db, {sha256: (size, 1)}))[sha256]
+
+async def add_blob_references(db: AsyncSession, blobs: Dict[str, Tuple[int, int]]) -> Dict[str, str]:
+    """
+    Record references to several blobs in one statement. Does not commit.
+
+    Args:
+        blobs: sha256 -> (size, number of new references)
+
+    Returns:
+        sha256 -> blob path
+    """
+    paths = {sha256: blob_path(sha256) for sha256 in blobs}
+    stmt = insert(Blob).values([
+        {"sha256": sha256, "size": size, "path": paths[sha256], "ref_count": count}
+        for sha256, (size, count) in blobs.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["sha256"],
+        set_={"ref_count": Blob.ref_count + stmt.excluded.ref_count}
+    )
+    await db.execute(stmt)
+    return paths
+
+async def release_blob_reference(db: AsyncSession, sha256: str) -> Optional[Tuple[str, str]]:
+    """
+    Drop one reference to a blob. Does not commit.
+
+    When this was the last reference the file is moved aside while the row
+    lock is held, and (blob_path, tombstone_path) is returned: the caller
+    calls remove_stored_file(tombstone_path) after committing, or
+    restore_blob_file(...) if the commit fails. Otherwise returns None.
+    """
+    result = await db.execute(select(Blob).filter(Blob.sha256 == sha256).with_for_update())
+    blob = result.scalars().first()
+    if blob is None:
+        return None
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        return None
+    await db.delete(blob)
+
+    tombstone = new_temp_path()
+    try:
+        os.replace(blob.path, tombstone)
+    except FileNotFoundError:
+        return None
+    return blob.path, tombstone
+
+def restore_blob_file(path: str, tombstone: str):
+    os.replace(tombstone, path)
+
+def remove_stored_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Failed to remove blob {path}: {e}")
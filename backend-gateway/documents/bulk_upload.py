@@ -0,0 +1,346 @@
+"""
+Bulk archive upload.
+
+POST /documents/bulk takes a ZIP or tar (optionally gzip/bzip2/xz
+compressed) archive as the raw request body. The body is spooled to disk,
+never held in memory; members are then unpacked one at a time straight into
+blob temp files (hashed on the way) and turned into Document rows in batched
+inserts. Extraction runs on the extraction process pool and the requested
+agents are run per document in the background, with progress recorded on
+the BulkBatch row.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import lzma
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import AsyncSessionLocal, release_connection
+from documents.models import BulkBatch, Document, AgentAnalysis
+from documents.blob_store import (
+    MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE,
+    new_temp_path, discard_temp, promote_temp, add_blob_references
+)
+from documents.upload_service import ALLOWED_EXTENSIONS
+from extraction.pool import extract_text_in_pool
+
+logger = logging.getLogger(__name__)
+
+MAX_BULK_UPLOAD_BYTES = int(os.getenv("MAX_BULK_UPLOAD_BYTES", 2 * 1024 * 1024 * 1024))
+MAX_BULK_FILES = int(os.getenv("MAX_BULK_FILES", 1000))
+# Cap on the total uncompressed size of an archive (zip bombs)
+MAX_BULK_UNPACKED_BYTES = int(os.getenv("MAX_BULK_UNPACKED_BYTES", 4 * 1024 * 1024 * 1024))
+BULK_INSERT_BATCH_SIZE = 100
+BULK_AGENT_CONCURRENCY = int(os.getenv("BULK_AGENT_CONCURRENCY", 4))
+# Raised while reading a damaged archive or compressed member
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, lzma.LZMAError, gzip.BadGzipFile)
+
+@dataclass
+class ArchiveMember:
+    filename: str
+    temp_path: Optional[str] = None
+    sha256: Optional[str] = None
+    size: int = 0
+    error: Optional[str] = None
+
+async def spool_request_body(request: Request) -> str:
+    """Write the raw request body to a temp file, enforcing MAX_BULK_UPLOAD_BYTES."""
+    path = new_temp_path()
+    size = 0
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        async for piece in request.stream():
+            size += len(piece)
+            if size > MAX_BULK_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Archive exceeds the maximum size of {MAX_BULK_UPLOAD_BYTES // (1024 * 1024)} MB"
+                )
+            await run_in_threadpool(f.write, piece)
+    except BaseException:
+        f.close()
+        discard_temp(path)
+        raise
+    f.close()
+    return path
+
+def _iter_archive(path: str) -> Iterator[Tuple[str, int, object]]:
+    """Yield (name, declared size, open file object) for each regular file."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                with zf.open(info) as member:
+                    yield info.filename, info.file_size, member
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path, mode="r:*") as tf:
+            for info in tf:
+                if not info.isfile():
+                    continue
+                member = tf.extractfile(info)
+                yield info.name, info.size, member
+    else:
+        raise HTTPException(status_code=400, detail="Body must be a ZIP or tar archive")
+
+def unpack_archive(path: str) -> Tuple[List[ArchiveMember], int]:
+    """
+    Copy each supported archive member into its own blob temp file.
+
+    Returns:
+        (members, skipped) where skipped counts files that are not documents
+        (unsupported extension, hidden files). Members that could not be
+        stored have error set.
+
+    Raises:
+        HTTPException: 400 for a corrupt or truncated archive, 413 for one
+            with too many documents or too much unpacked data. No temp
+            files are left behind.
+    """
+    members: List[ArchiveMember] = []
+    skipped = 0
+    unpacked = 0
+    temp_path = None
+    try:
+        for name, declared_size, member in _iter_archive(path):
+            filename = os.path.basename(name)
+            if (not filename or filename.startswith(".") or "__MACOSX" in name
+                    or not filename.lower().endswith(ALLOWED_EXTENSIONS)):
+                skipped += 1
+                continue
+            if len(members) >= MAX_BULK_FILES:
+                raise HTTPException(status_code=413, detail=f"Archive contains more than {MAX_BULK_FILES} documents")
+
+            entry = ArchiveMember(filename=filename)
+            members.append(entry)
+            if declared_size > MAX_UPLOAD_BYTES:
+                entry.error = "File exceeds the maximum upload size"
+                continue
+
+            temp_path = new_temp_path()
+            digest = hashlib.sha256()
+            size = 0
+            with open(temp_path, "wb") as out:
+                for chunk in iter(lambda: member.read(UPLOAD_CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    unpacked += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        entry.error = "File exceeds the maximum upload size"
+                        break
+                    if unpacked > MAX_BULK_UNPACKED_BYTES:
+                        raise HTTPException(status_code=413, detail="Archive expands beyond the allowed unpacked size")
+                    digest.update(chunk)
+                    out.write(chunk)
+            if entry.error:
+                discard_temp(temp_path)
+            else:
+                entry.temp_path, entry.sha256, entry.size = temp_path, digest.hexdigest(), size
+            temp_path = None
+    except BaseException as e:
+        if temp_path:
+            discard_temp(temp_path)
+        for m in members:
+            if m.temp_path:
+                discard_temp(m.temp_path)
+        if isinstance(e, ARCHIVE_ERRORS):
+            raise HTTPException(status_code=400, detail=f"Archive is corrupt or truncated: {e}")
+        raise
+    return members, skipped
+
+async def _known_texts(db: AsyncSession, hashes: List[str]) -> Dict[str, str]:
+    result = await db.execute(
+        select(Document.content_hash, Document.extracted_text).filter(
+            Document.content_hash.in_(hashes),
+            Document.extracted_text.isnot(None)
+        ).distinct(Document.content_hash).order_by(Document.content_hash)
+    )
+    return {row.content_hash: row.extracted_text for row in result}
+
+async def store_members(db: AsyncSession, batch: BulkBatch, members: List[ArchiveMember]) -> List[Document]:
+    """Create blobs and Document rows for unpacked members, BULK_INSERT_BATCH_SIZE per transaction."""
+    stored = [m for m in members if m.temp_path]
+    documents = []
+    for i in range(0, len(stored), BULK_INSERT_BATCH_SIZE):
+        chunk = stored[i:i + BULK_INSERT_BATCH_SIZE]
+
+        refs: Dict[str, Tuple[int, int]] = {}
+        for m in chunk:
+            size, count = refs.get(m.sha256, (m.size, 0))
+            refs[m.sha256] = (size, count + 1)
+        paths = await add_blob_references(db, refs)
+        for m in chunk:
+            await run_in_threadpool(promote_temp, m.temp_path, m.sha256)
+
+        texts = await _known_texts(db, list(refs))
+        rows = [
+            Document(
+                filename=m.filename,
+                file_path=paths[m.sha256],
+                user_id=batch.user_id,
+                content_hash=m.sha256,
+                file_size=m.size,
+                batch_id=batch.id,
+                extracted_text=texts.get(m.sha256)
+            )
+            for m in chunk
+        ]
+        db.add_all(rows)
+        await db.commit()
+        documents.extend(rows)
+    return documents
+
+async def create_batch(db: AsyncSession, user_id: int, archive_name: Optional[str], agents: List[str]) -> BulkBatch:
+    batch = BulkBatch(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        archive_name=archive_name,
+        status="receiving",
+        agents=agents
+    )
+    db.add(batch)
+    await db.commit()
+    return batch
+
+async def receive_archive(db: AsyncSession, batch: BulkBatch, request: Request) -> List[Document]:
+    """Spool, unpack and store the archive in the request body."""
+    await release_connection(db)
+    try:
+        archive_path = await spool_request_body(request)
+        try:
+            members, skipped = await run_in_threadpool(unpack_archive, archive_path)
+        finally:
+            discard_temp(archive_path)
+
+        try:
+            documents = await store_members(db, batch, members)
+        except BaseException:
+            for m in members:
+                if m.temp_path:
+                    discard_temp(m.temp_path)
+            raise
+    except Exception as e:
+        await db.rollback()
+        await _set_status(batch.id, "failed", getattr(e, "detail", None) or str(e))
+        raise
+
+    batch.total_files = len(members)
+    batch.skipped_files = skipped
+    batch.failed_files = sum(1 for m in members if m.error)
+    batch.status = "processing"
+    batch.updated_at = datetime.utcnow()
+    await db.commit()
+    return documents
+
+async def _bump(batch_id: str, **increments):
+    async with AsyncSessionLocal() as db:
+        values = {name: getattr(BulkBatch, name) + amount for name, amount in increments.items()}
+        await db.execute(update(BulkBatch).where(BulkBatch.id == batch_id).values(updated_at=datetime.utcnow(), **values))
+        await db.commit()
+
+async def _set_status(batch_id: str, status: str, error: Optional[str] = None):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(BulkBatch).where(BulkBatch.id == batch_id).values(
+            status=status, error=error, updated_at=datetime.utcnow()
+        ))
+        await db.commit()
+
+async def _extract(document_id: int, file_path: str, filename: str) -> Optional[str]:
+    try:
+        text = await extract_text_in_pool(file_path, filename)
+    except Exception as e:
+        logger.error(f"Bulk extraction failed for document {document_id}: {e}")
+        return None
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Document).where(Document.id == document_id).values(extracted_text=text))
+        await db.commit()
+    return text
+
+async def process_batch(batch_id: str, user_id: int, documents: List[dict], agents: List[str]):
+    """
+    Background part of a bulk upload: extract every document on the process
+    pool, then run the requested agents with at most BULK_AGENT_CONCURRENCY
+    documents in flight.
+
+    Args:
+        documents: dicts with id, file_path, filename and extracted_text
+    """
+    # Imported here: processing.router imports the documents package
+    from processing.router import process_background_task
+
+    semaphore = asyncio.Semaphore(BULK_AGENT_CONCURRENCY)
+    accepted_at = time.perf_counter()
+
+    async def handle(doc: dict):
+        text = doc["extracted_text"]
+        if text is None:
+            text = await _extract(doc["id"], doc["file_path"], doc["filename"])
+            if text is None:
+                await _bump(batch_id, failed_files=1)
+                return
+        await _bump(batch_id, extracted_files=1)
+        if not agents:
+            return
+        async with semaphore:
+            try:
+                await process_background_task(doc["id"], user_id, text, agents, {}, doc["filename"], accepted_at)
+            except Exception as e:
+                logger.error(f"Bulk analysis failed for document {doc['id']}: {e}")
+        await _bump(batch_id, analyzed_files=1)
+
+    try:
+        await asyncio.gather(*(handle(doc) for doc in documents))
+        await _set_status(batch_id, "completed")
+    except Exception as e:
+        logger.error(f"Bulk batch {batch_id} failed: {e}")
+        await _set_status(batch_id, "failed", str(e))
+
+async def batch_progress(db: AsyncSession, batch: BulkBatch) -> dict:
+    """Aggregate progress plus per-document status for a batch."""
+    analyzed = select(AgentAnalysis.document_id, func.bool_and(AgentAnalysis.success).label("success")).group_by(
+        AgentAnalysis.document_id
+    ).subquery()
+    result = await db.execute(
+        select(Document.id, Document.filename, Document.extracted_text.isnot(None).label("extracted"), analyzed.c.success)
+        .outerjoin(analyzed, analyzed.c.document_id == Document.id)
+        .filter(Document.batch_id == batch.id)
+        .order_by(Document.id)
+    )
+    documents = []
+    for row in result:
+        if row.success is not None:
+            status = "Analyzed" if row.success else "Failed"
+        else:
+            status = "Extracted" if row.extracted else "Uploaded"
+        documents.append({"id": row.id, "filename": row.filename, "status": status})
+
+    done = batch.extracted_files + batch.failed_files
+    if batch.agents:
+        done = batch.analyzed_files + batch.failed_files
+    return {
+        "batch_id": batch.id,
+        "archive_name": batch.archive_name,
+        "status": batch.status,
+        "agents": batch.agents or [],
+        "total_files": batch.total_files,
+        "skipped_files": batch.skipped_files,
+        "extracted_files": batch.extracted_files,
+        "failed_files": batch.failed_files,
+        "analyzed_files": batch.analyzed_files,
+        "progress": round(done / batch.total_files * 100, 1) if batch.total_files else 100.0,
+        "error": batch.error,
+        "created_at": batch.created_at,
+        "updated_at": batch.updated_at,
+        "documents": documents
+    }
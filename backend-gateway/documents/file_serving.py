@@ -0,0 +1,284 @@
+"""
+Conditional and range-aware file responses for documents and reports, and
+conditional, gzip-encoded responses for generated report views.
+
+Files are served with a strong ETag (the SHA-256 of the content) and
+Last-Modified, answer If-None-Match / If-Modified-Since with 304, and honour
+single byte-range requests with 206 so PDF viewers can fetch pages on
+demand. Responses are marked private and must be revalidated, because
+every request still goes through the ownership check.
+
+FILE_OFFLOAD_MODE hands the byte transfer to the front proxy once the
+request is authorized (see nginx/templates/default.conf.template):
+    none        stream the file from the gateway (default)
+    x-accel     X-Accel-Redirect to an internal nginx location
+    x-sendfile  X-Sendfile with the absolute path (Apache, lighttpd)
+    signed-url  307 redirect to a short-lived nginx secure_link URL
+Only files under FILE_OFFLOAD_ROOT are offloaded. The proxy URI ends with
+the original filename so the proxy derives the Content-Type from it.
+signed-url mode has no default secret: the gateway refuses to start in that
+mode without FILE_URL_SECRET, and nginx rejects every /files/ URL while the
+secret is unset.
+"""
+import base64
+import hashlib
+import os
+import re
+import time
+import zlib
+from urllib.parse import quote, urlsplit
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+
+STREAM_CHUNK_SIZE = 256 * 1024
+
+FILE_OFFLOAD_MODE = os.getenv("FILE_OFFLOAD_MODE", "none").lower()
+FILE_OFFLOAD_ROOT = os.path.abspath(os.getenv("FILE_OFFLOAD_ROOT", "shared_data"))
+# nginx location marked "internal" that aliases FILE_OFFLOAD_ROOT
+FILE_OFFLOAD_INTERNAL_PREFIX = os.getenv("FILE_OFFLOAD_INTERNAL_PREFIX", "/protected-files/")
+# Public location protected by secure_link (signed-url mode)
+FILE_OFFLOAD_BASE_URL = os.getenv("FILE_OFFLOAD_BASE_URL", "http://localhost:8081/files/")
+FILE_URL_SECRET = os.getenv("FILE_URL_SECRET", "")
+FILE_URL_TTL = int(os.getenv("FILE_URL_TTL", 300))
+GZIP_LEVEL = 6
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_BYTES = 1024
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+if FILE_OFFLOAD_MODE == "signed-url" and not FILE_URL_SECRET:
+    raise RuntimeError("FILE_OFFLOAD_MODE=signed-url requires FILE_URL_SECRET")
+
+def content_disposition(disposition: str, filename: str) -> str:
+    """
+    Content-Disposition header value for filename: a quoted ASCII fallback
+    plus the exact name in RFC 5987 form (filename*), which clients prefer.
+    """
+    fallback = "".join(c if 32 <= ord(c) < 127 else "_" for c in filename)
+    fallback = fallback.replace("\\", "\\\\").replace('"', '\\"')
+    return f"{disposition}; filename=\"{fallback}\"; filename*=utf-8''{quote(filename, safe='')}"
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    candidates = [c.strip() for c in header.split(",")]
+    # If-None-Match uses weak comparison
+    return etag in candidates or f"W/{etag}" in candidates
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    """Any date that can't be parsed or compared counts as modified."""
+    try:
+        since = parsedate_to_datetime(header)
+        if since.tzinfo is None:
+            # "-0000" and obsolete formats parse to naive datetimes
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    except (TypeError, ValueError, OverflowError):
+        return False
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range Range header into inclusive (start, end).
+
+    Returns None for headers that should be ignored (multiple ranges, other
+    units); raises HTTPException 416 for unsatisfiable ranges.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise _unsatisfiable(size)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise _unsatisfiable(size)
+    return start, end
+
+def _unsatisfiable(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=416,
+        detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+
+def _iter_file(path: str, start: int, length: int):
+    async def body():
+        f = await run_in_threadpool(open, path, "rb")
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = length
+            while remaining > 0:
+                chunk = await run_in_threadpool(f.read, min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+    return body()
+
+def _offload_uri(prefix: str, path: str, filename: str) -> Optional[str]:
+    """Proxy URI for path (decoded form), or None if it is outside FILE_OFFLOAD_ROOT."""
+    relative = os.path.relpath(os.path.abspath(path), FILE_OFFLOAD_ROOT)
+    if relative.startswith(".."):
+        return None
+    return f"{prefix.rstrip('/')}/{relative}/{os.path.basename(filename)}"
+
+def sign_file_uri(uri: str, expires: int) -> str:
+    """
+    Signature checked by nginx:
+        secure_link_md5 "$secure_link_expires$uri <FILE_URL_SECRET>";
+
+    MD5 because secure_link supports nothing else. The secret comes last, so
+    length extension does not apply. Forging a link would need an MD5
+    collision with a URI the gateway signed, and the gateway builds every
+    URI itself from stored paths. Use a long random secret; links expire
+    after FILE_URL_TTL.
+    """
+    digest = hashlib.md5(f"{expires}{uri} {FILE_URL_SECRET}".encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+def _offload_response(path: str, filename: str, disposition: str, headers: dict) -> Optional[Response]:
+    if FILE_OFFLOAD_MODE == "x-sendfile":
+        if _offload_uri("/", path, filename) is None:
+            return None
+        return Response(headers={**headers, "X-Sendfile": os.path.abspath(path)})
+
+    if FILE_OFFLOAD_MODE == "x-accel":
+        uri = _offload_uri(FILE_OFFLOAD_INTERNAL_PREFIX, path, filename)
+        if uri is None:
+            return None
+        return Response(headers={**headers, "X-Accel-Redirect": quote(uri)})
+
+    if FILE_OFFLOAD_MODE == "signed-url":
+        base = urlsplit(FILE_OFFLOAD_BASE_URL)
+        uri = _offload_uri(base.path, path, filename)
+        if uri is None:
+            return None
+        expires = int(time.time()) + FILE_URL_TTL
+        location = f"{base.scheme}://{base.netloc}{quote(uri)}?md5={sign_file_uri(uri, expires)}&expires={expires}"
+        if disposition == "attachment":
+            location += "&dl=1"
+        return Response(status_code=307, headers={"Location": location, "Cache-Control": "private, no-store"})
+
+    return None
+
+def file_response(
+    request: Request,
+    path: str,
+    content_hash: str,
+    media_type: str,
+    filename: str,
+    disposition: str = "attachment"
+) -> Response:
+    """
+    Serve path with ETag/Last-Modified validation and Range support.
+
+    Args:
+        content_hash: SHA-256 of the file, used as the strong ETag
+        disposition: "attachment" or "inline"
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{content_hash}"'
+    last_modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": content_disposition(disposition, filename),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since") and _not_modified_since(request.headers["if-modified-since"], last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if FILE_OFFLOAD_MODE != "none":
+        # The proxy handles Range itself
+        offloaded = _offload_response(path, filename, disposition, headers)
+        if offloaded is not None:
+            return offloaded
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        # If-Range: only honour the range when the client's copy is current
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = parse_range(range_header, size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+    return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") != "q=0"
+    return False
+
+def _gzip_chunks(chunks: Iterable[bytes]):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def generated_response(
+    request: Request,
+    chunks: Iterable[bytes],
+    media_type: str,
+    etag: str,
+    stream: bool = True
+) -> Response:
+    """
+    Serve generated content with ETag validation and gzip.
+
+    Args:
+        chunks: body pieces, produced lazily when stream is True
+        etag: validator for the content (identical for both encodings, so weak)
+        stream: send with chunked encoding instead of building the body first
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if not stream:
+        body = b"".join(chunks)
+        if accepts_gzip(request) and len(body) >= GZIP_MIN_BYTES:
+            body = b"".join(_gzip_chunks([body]))
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, media_type=media_type, headers=headers)
+
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        chunks = _gzip_chunks(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
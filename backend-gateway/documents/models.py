@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import Optional
+from sqlalchemy.dialects.postgresql import JSONB
 from database.db import Base
 
 class Document(Base):
@@ -12,11 +14,57 @@ class Document(Base):
     upload_date = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"))
     extracted_text = Column(Text, nullable=True)
+    # SHA-256 of the file content; file_path points at the shared blob
+    content_hash = Column(String(64), nullable=True, index=True)
+    file_size = Column(BigInteger, nullable=True)
+    # Set for documents created from a bulk archive upload
+    batch_id = Column(String(32), ForeignKey("bulk_batches.id"), nullable=True, index=True)
     
     user = relationship("auth.models.User")
 
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Boolean
+class Blob(Base):
+    """A stored file, shared by every document with the same content."""
+    __tablename__ = "blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BulkBatch(Base):
+    """Progress of a bulk archive upload (see documents/bulk_upload.py)."""
+    __tablename__ = "bulk_batches"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    archive_name = Column(String, nullable=True)
+    status = Column(String, nullable=False, default="receiving")  # receiving, processing, completed, failed
+    agents = Column(JSONB, nullable=True)
+    total_files = Column(Integer, nullable=False, default=0)
+    skipped_files = Column(Integer, nullable=False, default=0)
+    extracted_files = Column(Integer, nullable=False, default=0)
+    failed_files = Column(Integer, nullable=False, default=0)
+    analyzed_files = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class UploadSession(Base):
+    """An in-progress resumable upload (see documents/resumable_upload.py)."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    expected_sha256 = Column(String(64), nullable=True)
+    received_bytes = Column(BigInteger, nullable=False, default=0)
+    temp_path = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+from sqlalchemy import Boolean, Index, event
 
 class AgentAnalysis(Base):
     __tablename__ = "agent_analysis"
@@ -34,6 +82,24 @@ class AgentAnalysis(Base):
     retry_count = Column(Integer, default=0)
     ai_provider = Column(String, nullable=True)  # gemini or groq
     
+    # Telemetry of the agent call that produced the row (see apply_agent_telemetry)
+    processing_ms = Column(Integer, nullable=True)  # Gateway-side wall time of the agent call
+    queue_ms = Column(Integer, nullable=True)  # From the processing request to the agent call
+    llm_ms = Column(Integer, nullable=True)  # Time spent in LLM provider calls
+    gemini_attempts = Column(Integer, nullable=True)
+    groq_attempts = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    
+    # Risk metrics materialized from the response at write time (risk agent only)
+    risk_percentage = Column(Integer, nullable=True)
+    confidence_percentage = Column(Integer, nullable=True)
+    total_risks = Column(Integer, nullable=True)
+    critical_count = Column(Integer, nullable=True)
+    high_count = Column(Integer, nullable=True)
+    medium_count = Column(Integer, nullable=True)
+    low_count = Column(Integer, nullable=True)
+    
     user_id = Column(Integer, ForeignKey("users.id"))
     document_id = Column(Integer, ForeignKey("documents.id"))
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -41,6 +107,89 @@ class AgentAnalysis(Base):
     user = relationship("auth.models.User")
     document = relationship("Document")
 
+# Composite indexes for hot queries (see migrations/006_add_hot_query_indexes.sql)
+Index("idx_documents_user_upload_date", Document.user_id, Document.upload_date.desc())
+Index(
+    "idx_agent_analysis_doc_type_created",
+    AgentAnalysis.document_id, AgentAnalysis.agent_type, AgentAnalysis.created_at.desc(),
+    postgresql_include=["success"]
+)
+Index(
+    "idx_agent_analysis_user_type_success_created",
+    AgentAnalysis.user_id, AgentAnalysis.agent_type, AgentAnalysis.success, AgentAnalysis.created_at.desc(),
+    postgresql_include=["document_id", "risk_percentage"]
+)
+Index(
+    "idx_agent_analysis_user_created_latency",
+    AgentAnalysis.user_id, AgentAnalysis.created_at,
+    postgresql_include=["agent_type", "ai_provider", "success", "processing_ms"],
+    postgresql_where=AgentAnalysis.processing_ms.isnot(None)
+)
+Index(
+    "idx_agent_analysis_risk_percentage",
+    AgentAnalysis.risk_percentage,
+    postgresql_where=(AgentAnalysis.agent_type == "risk") & (AgentAnalysis.success == True)
+)
+
+def _as_int(value):
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+def populate_risk_metrics(analysis: AgentAnalysis):
+    """Derive the materialized risk metric columns from analysis.response."""
+    data = analysis.response if analysis.agent_type == "risk" and analysis.success else None
+    if not isinstance(data, dict):
+        analysis.risk_percentage = None
+        analysis.confidence_percentage = None
+        analysis.total_risks = None
+        analysis.critical_count = None
+        analysis.high_count = None
+        analysis.medium_count = None
+        analysis.low_count = None
+        return
+
+    analysis.risk_percentage = _as_int(data.get("risk_percentage")) or 0
+    analysis.confidence_percentage = _as_int(data.get("confidence_percentage")) or 0
+
+    detailed = data.get("detailed_analysis") or {}
+    risks = detailed.get("identified_risks") if isinstance(detailed, dict) else None
+    if not isinstance(risks, list):
+        risks = []
+    severities = [str(r.get("severity", "")).lower() for r in risks if isinstance(r, dict)]
+    analysis.total_risks = len(risks)
+    analysis.critical_count = severities.count("critical")
+    analysis.high_count = severities.count("high")
+    analysis.medium_count = severities.count("medium")
+    analysis.low_count = severities.count("low")
+
+TELEMETRY_COLUMNS = (
+    "processing_ms", "queue_ms", "llm_ms",
+    "gemini_attempts", "groq_attempts", "prompt_tokens", "completion_tokens"
+)
+
+def apply_agent_telemetry(analysis: AgentAnalysis, telemetry: Optional[dict]):
+    """
+    Store the telemetry of the agent call that produced analysis.
+
+    Args:
+        telemetry: the "telemetry" object of an agent response (provider,
+            model, attempts, tokens, llm_ms) plus the gateway's processing_ms
+            and queue_ms; results reused from another document carry
+            only the source analysis's provider and model
+    """
+    telemetry = telemetry if isinstance(telemetry, dict) else {}
+    for column in TELEMETRY_COLUMNS:
+        setattr(analysis, column, _as_int(telemetry.get(column)))
+    analysis.ai_provider = telemetry.get("provider")
+    analysis.model_used = telemetry.get("model")
+
+@event.listens_for(AgentAnalysis, "before_insert")
+@event.listens_for(AgentAnalysis, "before_update")
+def _populate_risk_metrics_on_write(mapper, connection, target):
+    populate_risk_metrics(target)
+
 class Report(Base):
     __tablename__ = "reports"
 
@@ -49,7 +198,17 @@ class Report(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     agent_type = Column(String, nullable=True) # clause, risk, draft, summary, or null for combined
     file_path = Column(String)
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the PDF, served as its ETag
+    # pending: render on next download; rendering; ready: file_path is current; failed
+    render_state = Column(String(16), nullable=False, default="pending", server_default="pending")
+    file_size = Column(BigInteger, nullable=True)  # Counted against the report cache quota
+    rendered_at = Column(DateTime, nullable=True)
+    last_accessed_at = Column(DateTime, nullable=True)  # LRU eviction order
     created_at = Column(DateTime, default=datetime.utcnow)
 
     document = relationship("Document")
     user = relationship("auth.models.User")
+
+Index("idx_reports_doc_type_created", Report.document_id, Report.agent_type, Report.created_at.desc())
+Index("uq_reports_document_agent", Report.document_id, Report.agent_type, unique=True)
+Index("idx_reports_last_accessed", Report.last_accessed_at, postgresql_where=Report.file_path.isnot(None))
@@ -0,0 +1,236 @@
+"""
+Resumable chunked uploads.
+
+Protocol:
+    POST   /documents/uploads                      create a session
+    PUT    /documents/uploads/{id}?offset=N        append a chunk (raw body)
+    GET    /documents/uploads/{id}                 query progress
+    POST   /documents/uploads/{id}/complete        verify hash, create Document
+    DELETE /documents/uploads/{id}                 abort
+
+Chunks must be sent in order: a PUT whose offset differs from the session's
+received_bytes is rejected with 409 and the current offset, so a client that
+lost a connection asks for progress and continues from there. A chunk body
+is streamed into its own part file without holding a database connection,
+then appended to the session file under the session's row lock, so two PUTs
+racing for the same offset can't both write. The session file lives next to
+the blob store and is renamed into place at completion. A session is only
+removed once its content hash has been verified; sessions idle for longer
+than UPLOAD_SESSION_TTL are removed by a periodic task.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from database.db import AsyncSessionLocal, release_connection
+from documents.models import UploadSession, Document
+from documents.blob_store import BLOB_TMP_DIR, discard_temp, hash_file
+from documents.upload_service import create_document_from_temp
+
+logger = logging.getLogger(__name__)
+
+MAX_RESUMABLE_UPLOAD_BYTES = int(os.getenv("MAX_RESUMABLE_UPLOAD_BYTES", 500 * 1024 * 1024))
+MAX_CHUNK_BYTES = int(os.getenv("MAX_UPLOAD_CHUNK_BYTES", 16 * 1024 * 1024))
+RECOMMENDED_CHUNK_BYTES = 5 * 1024 * 1024
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+UPLOAD_GC_INTERVAL = int(os.getenv("UPLOAD_GC_INTERVAL", 600))
+
+def session_status(session: UploadSession) -> dict:
+    return {
+        "upload_id": session.id,
+        "filename": session.filename,
+        "total_size": session.total_size,
+        "received_bytes": session.received_bytes,
+        "complete": session.received_bytes == session.total_size,
+        "chunk_size": RECOMMENDED_CHUNK_BYTES,
+        "expires_at": (session.updated_at or session.created_at) + timedelta(seconds=UPLOAD_SESSION_TTL)
+    }
+
+async def create_session(db: AsyncSession, user_id: int, filename: str, total_size: int, sha256: str = None) -> UploadSession:
+    if total_size <= 0:
+        raise HTTPException(status_code=400, detail="size must be positive")
+    if total_size > MAX_RESUMABLE_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds the maximum upload size of {MAX_RESUMABLE_UPLOAD_BYTES // (1024 * 1024)} MB"
+        )
+
+    session_id = uuid.uuid4().hex
+    temp_path = os.path.join(BLOB_TMP_DIR, f"upload-{session_id}")
+    # Create the (empty) session file up front so chunks can be written in place
+    await run_in_threadpool(lambda: open(temp_path, "wb").close())
+
+    session = UploadSession(
+        id=session_id,
+        user_id=user_id,
+        filename=filename,
+        total_size=total_size,
+        expected_sha256=sha256.lower() if sha256 else None,
+        received_bytes=0,
+        temp_path=temp_path
+    )
+    db.add(session)
+    await db.commit()
+    return session
+
+async def get_session(db: AsyncSession, session_id: str, user_id: int) -> UploadSession:
+    result = await db.execute(select(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.user_id == user_id
+    ))
+    session = result.scalars().first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def _offset_conflict(session: UploadSession):
+    return HTTPException(
+        status_code=409,
+        detail={"message": "Offset does not match the bytes received so far", "received_bytes": session.received_bytes},
+        headers={"Upload-Offset": str(session.received_bytes)}
+    )
+
+def _append_part(part_path: str, temp_path: str, offset: int):
+    with open(part_path, "rb") as src, open(temp_path, "r+b") as dst:
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst)
+
+async def write_chunk(db: AsyncSession, session: UploadSession, offset: int, request: Request) -> UploadSession:
+    """Stream one request body into a part file, then append it at offset."""
+    if offset != session.received_bytes:
+        raise _offset_conflict(session)
+    remaining = session.total_size - offset
+
+    # Nothing is written to the database while the chunk streams in
+    await release_connection(db)
+
+    written = 0
+    part_path = f"{session.temp_path}.{uuid.uuid4().hex[:8]}"
+    f = await run_in_threadpool(open, part_path, "wb")
+    try:
+        try:
+            async for piece in request.stream():
+                if not piece:
+                    continue
+                if written + len(piece) > min(remaining, MAX_CHUNK_BYTES):
+                    raise HTTPException(status_code=413, detail="Chunk exceeds the declared file size or the chunk size limit")
+                await run_in_threadpool(f.write, piece)
+                written += len(piece)
+        except ClientDisconnect:
+            # Keep whatever arrived; the client resumes from received_bytes
+            logger.info(f"Upload {session.id} disconnected after {written} bytes")
+        finally:
+            await run_in_threadpool(f.close)
+
+        if written:
+            # The row lock serialises writers across workers; only the one
+            # that still finds received_bytes at offset appends its part
+            result = await db.execute(
+                select(UploadSession.received_bytes)
+                .where(UploadSession.id == session.id)
+                .with_for_update()
+            )
+            received = result.scalar()
+            if received is None:
+                await db.rollback()
+                raise HTTPException(status_code=404, detail="Upload session not found")
+            if received != offset:
+                await db.rollback()
+                await db.refresh(session)
+                raise _offset_conflict(session)
+            await run_in_threadpool(_append_part, part_path, session.temp_path, offset)
+            await db.execute(
+                update(UploadSession).where(UploadSession.id == session.id)
+                .values(received_bytes=offset + written, updated_at=datetime.utcnow())
+            )
+            await db.commit()
+    finally:
+        discard_temp(part_path)
+
+    await db.refresh(session)
+    return session
+
+async def complete_session(db: AsyncSession, session: UploadSession) -> Document:
+    """Verify a fully received upload and turn it into a Document."""
+    if session.received_bytes != session.total_size:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload is incomplete", "received_bytes": session.received_bytes}
+        )
+
+    # Nothing is written to the database while the file is hashed
+    await release_connection(db)
+
+    content_hash = await run_in_threadpool(hash_file, session.temp_path)
+    if session.expected_sha256 and content_hash != session.expected_sha256:
+        # The session stays so the client can inspect or abort it
+        raise HTTPException(
+            status_code=422,
+            detail=f"SHA-256 mismatch: expected {session.expected_sha256}, received {content_hash}"
+        )
+
+    # Claim the session so a concurrent completion can't create a second document
+    result = await db.execute(delete(UploadSession).where(UploadSession.id == session.id))
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    await db.commit()
+
+    return await create_document_from_temp(
+        db, session.temp_path, content_hash, session.total_size, session.filename, session.user_id
+    )
+
+async def abort_session(db: AsyncSession, session: UploadSession):
+    await db.delete(session)
+    await db.commit()
+    discard_temp(session.temp_path)
+
+async def collect_expired_uploads() -> int:
+    """
+    Remove upload sessions idle for longer than UPLOAD_SESSION_TTL, and any
+    leftover temp file of the same age (crashed uploads, tombstones).
+
+    Returns:
+        Number of sessions removed
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            delete(UploadSession).where(UploadSession.updated_at < cutoff).returning(UploadSession.temp_path)
+        )
+        expired = [row[0] for row in result]
+        await db.commit()
+
+    for path in expired:
+        discard_temp(path)
+
+    def sweep_temp_dir():
+        stale_before = time.time() - UPLOAD_SESSION_TTL
+        for entry in os.scandir(BLOB_TMP_DIR):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < stale_before:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    await run_in_threadpool(sweep_temp_dir)
+    return len(expired)
+
+async def run_upload_gc():
+    """Background loop started with the app."""
+    while True:
+        try:
+            removed = await collect_expired_uploads()
+            if removed:
+                logger.info(f"Removed {removed} expired upload session(s)")
+        except Exception as e:
+            logger.error(f"Upload session cleanup failed: {e}")
+        await asyncio.sleep(UPLOAD_GC_INTERVAL)
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, BackgroundTasks, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.db import get_db
 from auth.auth_service import get_current_user
-from auth.models import User
-from documents.upload_service import save_upload_file
+from auth.principal_cache import Principal
+from documents.upload_service import save_upload_file, ALLOWED_EXTENSIONS
+from documents import resumable_upload
+from documents import bulk_upload as bulk_upload_service
+from documents.models import BulkBatch
+from pydantic import BaseModel
+from typing import List, Optional
 
 router = APIRouter(
     prefix="/documents",
@@ -13,30 +18,161 @@ router = APIRouter(
 @router.post("/upload")
 async def upload_document(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    if not file.filename.endswith(('.pdf', '.docx', '.txt')):
+    if not file.filename.endswith(ALLOWED_EXTENSIONS):
         raise HTTPException(status_code=400, detail="Invalid file format. Only PDF, DOCX, and TXT are supported.")
     
-    document = save_upload_file(file, current_user.id, db)
+    document = await save_upload_file(file, current_user.id, db)
     return document
 
-from fastapi.responses import FileResponse
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+@router.post("/uploads")
+async def create_upload_session(
+    request: UploadSessionCreate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable upload. Send chunks with PUT /documents/uploads/{upload_id}?offset=N."""
+    if not request.filename.endswith(ALLOWED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Invalid file format. Only PDF, DOCX, and TXT are supported.")
+    
+    session = await resumable_upload.create_session(db, current_user.id, request.filename, request.size, request.sha256)
+    return resumable_upload.session_status(session)
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_session(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await resumable_upload.get_session(db, upload_id, current_user.id)
+    return resumable_upload.session_status(session)
+
+@router.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    offset: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Append the raw request body at offset (must equal received_bytes)."""
+    session = await resumable_upload.get_session(db, upload_id, current_user.id)
+    session = await resumable_upload.write_chunk(db, session, offset, request)
+    return resumable_upload.session_status(session)
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload_session(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await resumable_upload.get_session(db, upload_id, current_user.id)
+    return await resumable_upload.complete_session(db, session)
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await resumable_upload.get_session(db, upload_id, current_user.id)
+    await resumable_upload.abort_session(db, session)
+    return {"success": True, "message": "Upload aborted"}
+
 import os
+import json
+import time
+from documents.models import Document, AgentAnalysis, Report
+from documents.blob_store import ensure_content_hash
+from documents.file_serving import file_response, generated_response
+from pdf_reports.render_service import (
+    COMBINED_SECTIONS, materialize_report, mark_reports_pending, report_download_name, latest_agent_results, render_key
+)
+from pdf_reports.views import report_bundle, iter_report_html
 
-from typing import Literal
+from typing import Literal, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import defer
+
+@router.post("/bulk", status_code=202)
+async def bulk_upload(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    agents: List[Literal["clause", "risk", "summary", "draft"]] = Query(default=[]),
+    archive_name: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload a ZIP or tar archive of documents as the raw request body.
+    Every PDF/DOCX/TXT member becomes a document; text is extracted and the
+    given agents (e.g. ?agents=risk&agents=summary) run in the background.
+    Poll GET /documents/bulk/{batch_id} for progress.
+    """
+    batch = await bulk_upload_service.create_batch(db, current_user.id, archive_name, list(agents))
+    documents = await bulk_upload_service.receive_archive(db, batch, request)
+    
+    background_tasks.add_task(
+        bulk_upload_service.process_batch,
+        batch.id,
+        current_user.id,
+        [
+            {"id": d.id, "file_path": d.file_path, "filename": d.filename, "extracted_text": d.extracted_text}
+            for d in documents
+        ],
+        list(agents)
+    )
+    return await bulk_upload_service.batch_progress(db, batch)
+
+@router.get("/bulk/{batch_id}")
+async def get_bulk_batch(
+    batch_id: str,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(select(BulkBatch).filter(
+        BulkBatch.id == batch_id,
+        BulkBatch.user_id == current_user.id
+    ))
+    batch = result.scalars().first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return await bulk_upload_service.batch_progress(db, batch)
 
 @router.get("/{doc_id}/report")
 async def get_report(
     doc_id: int,
+    request: Request,
     agent: Literal["clause", "risk", "draft", "summary", "combined"] = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    format: Literal["pdf", "html", "json"] = "pdf",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
+    """
+    The document's report. format=html|json builds a view straight from the
+    latest analysis results; pdf (the default) is the rendered export.
+    """
+    # Verify document ownership
+    result = await db.execute(select(Document.filename).filter(
+        Document.id == doc_id,
+        Document.user_id == current_user.id
+    ))
+    filename = result.scalar()
+    if filename is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    if format != "pdf":
+        return await _report_view(request, db, doc_id, filename, agent, format)
+    
     # Fetch report from DB
-    from documents.models import Report
-    query = db.query(Report).filter(Report.document_id == doc_id)
+    query = select(Report).filter(Report.document_id == doc_id)
     
     if agent:
         query = query.filter(Report.agent_type == agent)
@@ -44,84 +180,121 @@ async def get_report(
         # Default to combined or latest
         query = query.filter(Report.agent_type == "combined")
         
-    report = query.order_by(Report.created_at.desc()).first()
+    result = await db.execute(query.order_by(Report.created_at.desc()).limit(1))
+    report = result.scalars().first()
     
     # Fallback if no combined report found, just get the latest one
     if not report and not agent:
-         report = db.query(Report).filter(Report.document_id == doc_id).order_by(Report.created_at.desc()).first()
+         result = await db.execute(select(Report).filter(Report.document_id == doc_id).order_by(Report.created_at.desc()).limit(1))
+         report = result.scalars().first()
     
-    if not report or not os.path.exists(report.file_path):
+    if not report:
         raise HTTPException(status_code=404, detail="Report not found")
     
-    return FileResponse(report.file_path, media_type="application/pdf", filename=os.path.basename(report.file_path))
+    # Rendered on first download, or again after eviction / new results
+    report = await materialize_report(db, report, filename)
+    content_hash = await ensure_content_hash(db, report, report.file_path)
+    return file_response(
+        request,
+        report.file_path,
+        content_hash,
+        media_type="application/pdf",
+        filename=report_download_name(doc_id, report.agent_type)
+    )
 
-from documents.models import Document, AgentAnalysis, Report
+async def _report_view(request: Request, db: AsyncSession, doc_id: int, filename: str, agent: Optional[str], format: str):
+    agent_names = COMBINED_SECTIONS if agent in (None, "combined") else [agent]
+    results = await latest_agent_results(db, doc_id, agent_names)
+    await release_connection(db)
+    bundle = report_bundle(doc_id, filename, results, agent_names)
+    if not bundle["sections"]:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    etag = f'W/"{render_key(format, bundle)}"'
+    if format == "json":
+        body = json.dumps(bundle, default=str).encode("utf-8")
+        return generated_response(request, [body], "application/json", etag, stream=False)
+    chunks = (part.encode("utf-8") for part in iter_report_html(bundle))
+    return generated_response(request, chunks, "text/html; charset=utf-8", etag)
 
 @router.get("/reports")
-def get_reports(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_reports(
+    min_risk: Optional[int] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Fetch all documents for the user
-    documents = db.query(Document).filter(Document.user_id == current_user.id).order_by(Document.upload_date.desc()).all()
+    # Latest successful risk analysis per document, read from the materialized
+    # metric columns (the JSONB response is never loaded)
+    latest_risk = select(AgentAnalysis.id).join(
+        Document, Document.id == AgentAnalysis.document_id
+    ).filter(
+        Document.user_id == current_user.id,
+        AgentAnalysis.agent_type == "risk",
+        AgentAnalysis.success == True,
+        AgentAnalysis.response.isnot(None)
+    ).distinct(AgentAnalysis.document_id).order_by(
+        AgentAnalysis.document_id, AgentAnalysis.created_at.desc()
+    ).subquery()
+
+    query = select(AgentAnalysis, Document).join(
+        Document, Document.id == AgentAnalysis.document_id
+    ).filter(
+        AgentAnalysis.id.in_(select(latest_risk.c.id))
+    ).options(
+        defer(AgentAnalysis.response),
+        defer(AgentAnalysis.extracted_text),
+        defer(Document.extracted_text)
+    )
+
+    if min_risk is not None:
+        query = query.filter(AgentAnalysis.risk_percentage >= min_risk)
+
+    result = await db.execute(query.order_by(Document.upload_date.desc()))
+    rows = result.all()
     
     reports_data = []
-    for doc in documents:
-        # Get risk analysis
-        risk_analysis = db.query(AgentAnalysis).filter(
-            AgentAnalysis.document_id == doc.id,
-            AgentAnalysis.agent_type == "risk",
-            AgentAnalysis.success == True
-        ).order_by(AgentAnalysis.created_at.desc()).first()
+    for risk_analysis, doc in rows:
+        # Count risks by severity
+        stats = {
+            "total_risks": risk_analysis.total_risks or 0,
+            "critical_risks": risk_analysis.critical_count or 0,
+            "high_risks": risk_analysis.high_count or 0,
+            "medium_risks": risk_analysis.medium_count or 0,
+            "low_risks": risk_analysis.low_count or 0,
+            "legal_threats": 0, 
+            "time_risks": 0,
+            "complex_sentences": 0,
+            "contract_dates": 0,
+            "alternative_suggestions": 0,
+            "tasks_completed": 5 
+        }
         
-        if risk_analysis and risk_analysis.response:
-            data = risk_analysis.response
-            
-            # Extract summary stats
-            detailed = data.get("detailed_analysis", {})
-            risks = detailed.get("identified_risks", [])
-            
-            # Count risks by severity
-            stats = {
-                "total_risks": len(risks),
-                "critical_risks": sum(1 for r in risks if r.get("severity", "").lower() == "critical"),
-                "high_risks": sum(1 for r in risks if r.get("severity", "").lower() == "high"),
-                "medium_risks": sum(1 for r in risks if r.get("severity", "").lower() == "medium"),
-                "low_risks": sum(1 for r in risks if r.get("severity", "").lower() == "low"),
-                "legal_threats": 0, 
-                "time_risks": 0,
-                "complex_sentences": 0,
-                "contract_dates": 0,
-                "alternative_suggestions": 0,
-                "tasks_completed": 5 
-            }
-            
-            # Determine risk level
-            score = data.get("risk_percentage", 0)
-            if score >= 80: risk_level = "Critical"
-            elif score >= 60: risk_level = "High"
-            elif score >= 40: risk_level = "Medium"
-            else: risk_level = "Low"
-            
-            report_item = {
-                "id": risk_analysis.id,
-                "document_id": doc.id,
-                "document_name": doc.filename,
-                "overall_risk_score": score,
-                "risk_level": risk_level,
-                "status": "completed",
-                "created_at": risk_analysis.created_at.isoformat(),
-                "summary": stats,
-                "analysis_metadata": {
-                    "total_words": 0, 
-                    "confidence": data.get("confidence_percentage", 0) / 100.0,
-                    "ai_model": risk_analysis.model_used or "Unknown",
-                    "version": "1.0",
-                    "analysis_system": risk_analysis.ai_provider or "Unknown"
-                }
+        # Determine risk level
+        score = risk_analysis.risk_percentage or 0
+        if score >= 80: risk_level = "Critical"
+        elif score >= 60: risk_level = "High"
+        elif score >= 40: risk_level = "Medium"
+        else: risk_level = "Low"
+        
+        report_item = {
+            "id": risk_analysis.id,
+            "document_id": doc.id,
+            "document_name": doc.filename,
+            "overall_risk_score": score,
+            "risk_level": risk_level,
+            "status": "completed",
+            "created_at": risk_analysis.created_at.isoformat(),
+            "summary": stats,
+            "analysis_metadata": {
+                "total_words": 0, 
+                "confidence": (risk_analysis.confidence_percentage or 0) / 100.0,
+                "ai_model": risk_analysis.model_used or "Unknown",
+                "version": "1.0",
+                "analysis_system": risk_analysis.ai_provider or "Unknown"
             }
-            
-            reports_data.append(report_item)
+        }
+        
+        reports_data.append(report_item)
             
     return {
         "success": True,
@@ -135,16 +308,20 @@ def get_reports(
     }
 
 @router.get("")
-def get_user_documents(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def get_user_documents(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    documents = db.query(Document).filter(Document.user_id == current_user.id).order_by(Document.upload_date.desc()).all()
+    result = await db.execute(select(Document).filter(Document.user_id == current_user.id).order_by(Document.upload_date.desc()))
+    documents = result.scalars().all()
     
     results = []
     for doc in documents:
         # Check analysis status
-        analysis = db.query(AgentAnalysis).filter(AgentAnalysis.document_id == doc.id).first()
+        result = await db.execute(
+            select(AgentAnalysis.success).filter(AgentAnalysis.document_id == doc.id).limit(1)
+        )
+        analysis = result.first()
         status = "Uploaded"
         if analysis:
             if analysis.success:
@@ -152,13 +329,14 @@ def get_user_documents(
             else:
                 status = "Processing"
         
-        # Mock size or get from file
-        size = 0
-        try:
-             if doc.file_path and os.path.exists(doc.file_path):
-                 size = os.path.getsize(doc.file_path)
-        except:
-             pass
+        # Size recorded at upload; stat the file for older uploads
+        size = doc.file_size or 0
+        if doc.file_size is None:
+            try:
+                 if doc.file_path and os.path.exists(doc.file_path):
+                     size = os.path.getsize(doc.file_path)
+            except:
+                 pass
 
         results.append({
             "id": doc.id,
@@ -175,20 +353,23 @@ def get_user_documents(
     return results
 
 @router.get("/{doc_id}")
-def get_document_details(
+async def get_document_details(
     doc_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    document = db.query(Document).filter(Document.id == doc_id, Document.user_id == current_user.id).first()
+    result = await db.execute(select(Document).filter(Document.id == doc_id, Document.user_id == current_user.id))
+    document = result.scalars().first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Fetch Analysis Results
-    analyses = db.query(AgentAnalysis).filter(AgentAnalysis.document_id == doc_id).all()
+    result = await db.execute(select(AgentAnalysis).filter(AgentAnalysis.document_id == doc_id))
+    analyses = result.scalars().all()
     
     # Fetch Latest Report
-    report = db.query(Report).filter(Report.document_id == doc_id).order_by(Report.created_at.desc()).first()
+    result = await db.execute(select(Report).filter(Report.document_id == doc_id).order_by(Report.created_at.desc()).limit(1))
+    report = result.scalars().first()
     
     return {
         "document": document,
@@ -196,67 +377,94 @@ def get_document_details(
         "report": report
     }
 
-from fastapi import Response
-import requests
+from sqlalchemy import delete, func, Date, cast
+from documents.blob_store import release_blob_reference, restore_blob_file, remove_stored_file
+from analytics.rollup_service import refresh_daily_risk_rollup
 
-@router.get("/{doc_id}/download")
-async def download_document(
+@router.delete("/{doc_id}")
+async def delete_document(
     doc_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    Download the original uploaded document file.
+    Delete a document with its analyses and reports. The stored file is
+    removed once no other document references the same content.
     """
-    # Fetch the document and verify ownership
-    document = db.query(Document).filter(
-        Document.id == doc_id, 
+    result = await db.execute(select(Document).filter(
+        Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
-    
+    ))
+    document = result.scalars().first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # Check if file exists
-    if not document.file_path or not os.path.exists(document.file_path):
-        raise HTTPException(status_code=404, detail="Document file not found on server")
+    # Days whose risk rollup includes this document's analyses
+    result = await db.execute(select(cast(AgentAnalysis.created_at, Date)).filter(
+        AgentAnalysis.document_id == doc_id,
+        AgentAnalysis.agent_type == "risk"
+    ).distinct())
+    risk_days = [row[0] for row in result]
     
-    # Determine media type based on file extension
-    filename = document.filename
-    media_type = "application/octet-stream"  # Default
+    result = await db.execute(select(Report.file_path).filter(Report.document_id == doc_id))
+    report_paths = [row[0] for row in result if row[0]]
     
+    await db.execute(delete(AgentAnalysis).where(AgentAnalysis.document_id == doc_id))
+    await db.execute(delete(Report).where(Report.document_id == doc_id))
+    await db.delete(document)
+    await db.flush()
+    if risk_days:
+        await db.run_sync(refresh_daily_risk_rollup, current_user.id, risk_days)
+    
+    removed_blob = None
+    legacy_path = None
+    if document.content_hash:
+        removed_blob = await release_blob_reference(db, document.content_hash)
+    elif document.file_path:
+        # Uploads from before blob storage: only delete an unshared file
+        shared = await db.scalar(select(func.count()).select_from(Document).filter(
+            Document.file_path == document.file_path
+        ))
+        if not shared:
+            legacy_path = document.file_path
+    
+    try:
+        await db.commit()
+    except BaseException:
+        if removed_blob:
+            restore_blob_file(*removed_blob)
+        raise
+    
+    for path in report_paths + [legacy_path, removed_blob[1] if removed_blob else None]:
+        if path:
+            remove_stored_file(path)
+    
+    return {
+        "success": True,
+        "message": "Document deleted successfully"
+    }
+
+from fastapi import Response
+import httpx
+from processing.agent_client import get_agent_client, post_analyze, elapsed_ms, agent_error_telemetry
+
+def _document_media_type(filename: str) -> str:
+    # Determine media type based on file extension
     if filename.endswith('.pdf'):
-        media_type = "application/pdf"
+        return "application/pdf"
     elif filename.endswith('.docx'):
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     elif filename.endswith('.txt'):
-        media_type = "text/plain"
-    
-    # Return the file
-    return FileResponse(
-        path=document.file_path,
-        media_type=media_type,
-        filename=filename,
-        headers={
-            "Content-Disposition": f"attachment; filename={filename}"
-        }
-    )
+        return "text/plain"
+    return "application/octet-stream"
 
-@router.get("/{doc_id}/view")
-async def view_document(
-    doc_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    View the original uploaded document file inline in the browser.
-    Useful for PDFs and text files that can be rendered by the browser.
-    """
+async def _serve_document(request: Request, doc_id: int, current_user: Principal, db: AsyncSession, disposition: str):
     # Fetch the document and verify ownership
-    document = db.query(Document).filter(
+    result = await db.execute(select(Document).filter(
         Document.id == doc_id, 
         Document.user_id == current_user.id
-    ).first()
+    ))
+    document = result.scalars().first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -265,70 +473,92 @@ async def view_document(
     if not document.file_path or not os.path.exists(document.file_path):
         raise HTTPException(status_code=404, detail="Document file not found on server")
     
-    # Determine media type based on file extension
-    filename = document.filename
-    media_type = "application/octet-stream"  # Default
-    
-    if filename.endswith('.pdf'):
-        media_type = "application/pdf"
-    elif filename.endswith('.docx'):
-        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    elif filename.endswith('.txt'):
-        media_type = "text/plain"
-    
-    # Return the file with inline disposition to view in browser
-    return FileResponse(
-        path=document.file_path,
-        media_type=media_type,
-        filename=filename,
-        headers={
-            "Content-Disposition": f"inline; filename={filename}"
-        }
+    content_hash = await ensure_content_hash(db, document, document.file_path)
+    return file_response(
+        request,
+        document.file_path,
+        content_hash,
+        media_type=_document_media_type(document.filename),
+        filename=document.filename,
+        disposition=disposition
     )
 
+@router.get("/{doc_id}/download")
+async def download_document(
+    doc_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Download the original uploaded document file.
+    """
+    return await _serve_document(request, doc_id, current_user, db, "attachment")
+
+@router.get("/{doc_id}/view")
+async def view_document(
+    doc_id: int,
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    View the original uploaded document file inline in the browser.
+    Useful for PDFs and text files that can be rendered by the browser.
+    """
+    return await _serve_document(request, doc_id, current_user, db, "inline")
+
 
 @router.post("/generate-clean-draft")
 async def generate_clean_draft(
     request: dict,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     draft_url = os.getenv("DRAFT_AGENT_URL", "http://draft-agent:8003")
     try:
         # Forward the request to the draft agent
         # The draft agent expects: filename, analysis_results, apply_recommendations
-        response = requests.post(f"{draft_url}/documents/generate-clean-draft", json=request, timeout=120)
-        
-        if response.status_code != 200:
-             raise HTTPException(status_code=response.status_code, detail=f"Failed to generate draft: {response.text}")
-        
-        # Return the binary content (docx)
-        return Response(
-            content=response.content, 
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename=improved_draft.docx"}
-        )
+        response = await get_agent_client().post(f"{draft_url}/documents/generate-clean-draft", json=request, timeout=120)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=f"Failed to generate draft: {response.text}")
+    
+    # Return the binary content (docx)
+    return Response(
+        content=response.content, 
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers={"Content-Disposition": f"attachment; filename=improved_draft.docx"}
+    )
 
-from extraction.extractor import extract_text
+from extraction.pool import extract_text_in_thread
+from analytics.rollup_service import refresh_rollup_for_analysis
+from database.db import release_connection
+from documents.models import apply_agent_telemetry
+from analytics.usage_service import estimate_tokens, enforce_token_budget, record_token_usage, release_reservation
+from processing.admission import agent_slot, ensure_capacity
+from processing.job_estimates import call_timeout, expected_seconds, observe_call
 
 # Individual Agent Processing Endpoints with Retry
 @router.post("/{doc_id}/process/{agent_type}")
 async def process_document_with_agent(
     doc_id: int,
     agent_type: Literal["clause", "risk", "summary", "draft"],
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Process or retry processing a document with a specific agent.
     Returns the analysis result or error state.
     """
+    accepted_at = time.perf_counter()
     # Verify document ownership
-    document = db.query(Document).filter(
+    result = await db.execute(select(Document).filter(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
+    document = result.scalars().first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
@@ -340,9 +570,9 @@ async def process_document_with_agent(
             if not document.file_path or not os.path.exists(document.file_path):
                 raise HTTPException(status_code=404, detail="Document file not found")
                 
-            text = extract_text(document.file_path)
+            text = await extract_text_in_thread(document.file_path, document.filename)
             document.extracted_text = text
-            db.commit()
+            await db.commit()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to extract text from document: {str(e)}")
     
@@ -358,74 +588,36 @@ async def process_document_with_agent(
     if not agent_url:
         raise HTTPException(status_code=400, detail=f"Invalid agent type: {agent_type}")
     
+    # Check if there's an existing analysis
+    result = await db.execute(select(AgentAnalysis).filter(
+        AgentAnalysis.document_id == doc_id,
+        AgentAnalysis.agent_type == agent_type
+    ).order_by(AgentAnalysis.created_at.desc()).limit(1))
+    existing_analysis = result.scalars().first()
+    
+    # Request fields besides the text, which post_analyze adds
+    payload = {
+        "document_id": doc_id,
+        "file_path": document.file_path,
+        "filename": document.filename
+    }
+    
+    ensure_capacity([agent_type], interactive=True)
+    reservation = await enforce_token_budget(db, current_user.id, estimate_tokens(document.extracted_text))
+    
     try:
-        # Check if there's an existing analysis
-        existing_analysis = db.query(AgentAnalysis).filter(
-            AgentAnalysis.document_id == doc_id,
-            AgentAnalysis.agent_type == agent_type
-        ).order_by(AgentAnalysis.created_at.desc()).first()
-        
-        # Prepare request payload
-        payload = {
-            "text": document.extracted_text,
-            "document_id": doc_id,
-            "file_path": document.file_path,
-            "filename": document.filename
-        }
-        
-        # Call the agent service
-        response = requests.post(
-            f"{agent_url}/analyze",
-            json=payload,
-            timeout=120
-        )
+        # Don't hold a pooled connection for the duration of the agent call;
+        # the loaded rows stay usable and the write below opens a new transaction
+        await release_connection(db)
         
-        # Parse response
-        if response.status_code == 200:
-            result_data = response.json()
-            
-            # Create or update analysis record
-            if existing_analysis:
-                existing_analysis.response = result_data
-                existing_analysis.success = True
-                existing_analysis.error = None
-                existing_analysis.retry_count = (existing_analysis.retry_count or 0) + 1
-                existing_analysis.model_used = result_data.get("model_used")
-                existing_analysis.ai_provider = result_data.get("ai_provider")
-            else:
-                new_analysis = AgentAnalysis(
-                    document_id=doc_id,
-                    user_id=current_user.id,
-                    agent_type=agent_type,
-                    response=result_data,
-                    success=True,
-                    error=None,
-                    retry_count=0,
-                    model_used=result_data.get("model_used"),
-                    ai_provider=result_data.get("ai_provider"),
-                    extracted_text=document.extracted_text
-                )
-                db.add(new_analysis)
-            
-            db.commit()
-            
-            return {
-                "success": True,
-                "message": f"{agent_type.capitalize()} analysis completed successfully",
-                "data": result_data,
-                "agent_type": agent_type
-            }
-        else:
-            # Handle error response
-            error_message = f"{response.status_code} Server Error: {response.text}"
-            
-            # Update or create error record
+        async def record_failure(error_message: str, telemetry: dict):
             if existing_analysis:
                 existing_analysis.success = False
                 existing_analysis.error = error_message
                 existing_analysis.retry_count = (existing_analysis.retry_count or 0) + 1
+                analysis = existing_analysis
             else:
-                new_analysis = AgentAnalysis(
+                analysis = AgentAnalysis(
                     document_id=doc_id,
                     user_id=current_user.id,
                     agent_type=agent_type,
@@ -435,86 +627,116 @@ async def process_document_with_agent(
                     retry_count=0,
                     extracted_text=document.extracted_text
                 )
-                db.add(new_analysis)
-            
-            db.commit()
-            
+                db.add(analysis)
+            apply_agent_telemetry(analysis, telemetry)
+            await record_token_usage(db, analysis, telemetry, reservation)
+        
+            await db.run_sync(refresh_rollup_for_analysis, analysis)
+            await db.commit()
+            reservation.mark_settled()
+        
+        # Failures before the call starts are recorded with these
+        queue_ms = None
+        started = time.perf_counter()
+        try:
+            # Call the agent service once one of its slots is free
+            expected = expected_seconds(agent_type, reservation.tokens)
+            async with agent_slot(agent_type, current_user.id, interactive=True, wait_if_full=True, expected=expected):
+                queue_ms = elapsed_ms(accepted_at)
+                started = time.perf_counter()
+                response = await post_analyze(
+                    agent_url, document.extracted_text, timeout=call_timeout(expected, base=120), extra=payload
+                )
+        except httpx.TimeoutException:
+            error_message = f"Timeout while processing with {agent_type} agent"
+            await record_failure(error_message, {"processing_ms": elapsed_ms(started), "queue_ms": queue_ms})
+            raise HTTPException(status_code=504, detail=error_message)
+        except Exception as e:
+            error_message = str(e)
+            await record_failure(error_message, {"processing_ms": elapsed_ms(started), "queue_ms": queue_ms})
+            raise HTTPException(status_code=500, detail=error_message)
+        
+        if response.status_code != 200:
+            # Handle error response
+            error_message = f"{response.status_code} Server Error: {response.text}"
+            await record_failure(error_message, {
+                **agent_error_telemetry(response), "processing_ms": elapsed_ms(started), "queue_ms": queue_ms
+            })
             raise HTTPException(
                 status_code=response.status_code,
                 detail=error_message
             )
-            
-    except requests.exceptions.Timeout:
-        error_message = f"Timeout while processing with {agent_type} agent"
         
-        if existing_analysis:
-            existing_analysis.success = False
-            existing_analysis.error = error_message
-            existing_analysis.retry_count = (existing_analysis.retry_count or 0) + 1
-        else:
-            new_analysis = AgentAnalysis(
-                document_id=doc_id,
-                user_id=current_user.id,
-                agent_type=agent_type,
-                response=None,
-                success=False,
-                error=error_message,
-                retry_count=0,
-                extracted_text=document.extracted_text
-            )
-            db.add(new_analysis)
-        
-        db.commit()
-        raise HTTPException(status_code=504, detail=error_message)
-        
-    except Exception as e:
-        error_message = str(e)
+        result_data = response.json()
+        telemetry = result_data.pop("telemetry", None)
+        telemetry = {**(telemetry if isinstance(telemetry, dict) else {}), "processing_ms": elapsed_ms(started), "queue_ms": queue_ms}
+        observe_call(agent_type, telemetry)
         
+        # Create or update analysis record
         if existing_analysis:
-            existing_analysis.success = False
-            existing_analysis.error = error_message
+            existing_analysis.response = result_data
+            existing_analysis.success = True
+            existing_analysis.error = None
             existing_analysis.retry_count = (existing_analysis.retry_count or 0) + 1
+            analysis = existing_analysis
         else:
-            new_analysis = AgentAnalysis(
+            analysis = AgentAnalysis(
                 document_id=doc_id,
                 user_id=current_user.id,
                 agent_type=agent_type,
-                response=None,
-                success=False,
-                error=error_message,
+                response=result_data,
+                success=True,
+                error=None,
                 retry_count=0,
                 extracted_text=document.extracted_text
             )
-            db.add(new_analysis)
+            db.add(analysis)
+        apply_agent_telemetry(analysis, telemetry)
+        await record_token_usage(db, analysis, telemetry, reservation)
+        
+        await db.run_sync(refresh_rollup_for_analysis, analysis)
+        # Commits the analysis, rollup and stale reports together; this agent's
+        # report and the combined report render again on their next download
+        await mark_reports_pending(db, doc_id, current_user.id, [agent_type])
+        reservation.mark_settled()
         
-        db.commit()
-        raise HTTPException(status_code=500, detail=error_message)
+        return {
+            "success": True,
+            "message": f"{agent_type.capitalize()} analysis completed successfully",
+            "data": result_data,
+            "agent_type": agent_type
+        }
+    finally:
+        # Tokens not reconciled above (cancelled request, DB error) go back to the budget
+        await release_reservation(reservation)
 
 @router.get("/{doc_id}/analysis/{agent_type}")
 async def get_agent_analysis(
     doc_id: int,
     agent_type: Literal["clause", "risk", "summary", "draft"],
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get the latest analysis result for a specific agent.
     Returns the analysis data, error state, and retry information.
     """
     # Verify document ownership
-    document = db.query(Document).filter(
+    result = await db.execute(select(Document).filter(
         Document.id == doc_id,
         Document.user_id == current_user.id
-    ).first()
+    ))
+    document = result.scalars().first()
     
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Get latest analysis
-    analysis = db.query(AgentAnalysis).filter(
+    result = await db.execute(select(AgentAnalysis).filter(
         AgentAnalysis.document_id == doc_id,
         AgentAnalysis.agent_type == agent_type
-    ).order_by(AgentAnalysis.created_at.desc()).first()
+    ).order_by(AgentAnalysis.created_at.desc()).limit(1))
+    analysis = result.scalars().first()
     
     if not analysis:
         return {
@@ -1,23 +1,48 @@
-import shutil
 import os
 from fastapi import UploadFile
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from documents.models import Document
+from documents.blob_store import stream_to_temp, promote_temp, add_blob_reference, discard_temp
 
+# Legacy location of uploads stored before content-addressed blobs
 UPLOAD_DIR = "shared_data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def save_upload_file(upload_file: UploadFile, user_id: int, db: Session) -> Document:
-    file_location = f"{UPLOAD_DIR}/{user_id}_{upload_file.filename}"
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(upload_file.file, file_object)
+ALLOWED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+async def find_extracted_text(db: AsyncSession, content_hash: str):
+    """Extracted text of any earlier document with the same content, if any."""
+    result = await db.execute(select(Document.extracted_text).filter(
+        Document.content_hash == content_hash,
+        Document.extracted_text.isnot(None)
+    ).limit(1))
+    return result.scalar()
+
+async def create_document_from_temp(db: AsyncSession, temp_path: str, content_hash: str, size: int, filename: str, user_id: int) -> Document:
+    """Store a fully written temp file as a blob and create its Document. Commits."""
+    try:
+        file_location = await add_blob_reference(db, content_hash, size)
+        await run_in_threadpool(promote_temp, temp_path, content_hash)
+    except BaseException:
+        discard_temp(temp_path)
+        raise
     
     db_document = Document(
-        filename=upload_file.filename,
+        filename=filename,
         file_path=file_location,
-        user_id=user_id
+        user_id=user_id,
+        content_hash=content_hash,
+        file_size=size,
+        # Identical content was already extracted once
+        extracted_text=await find_extracted_text(db, content_hash)
     )
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
     return db_document
+
+async def save_upload_file(upload_file: UploadFile, user_id: int, db: AsyncSession) -> Document:
+    temp_path, content_hash, size = await stream_to_temp(upload_file)
+    return await create_document_from_temp(db, temp_path, content_hash, size, upload_file.filename, user_id)
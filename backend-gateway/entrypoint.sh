@@ -5,15 +5,20 @@ echo "Starting backend-gateway initialization..."
 
 # Wait for database to be ready
 echo "Waiting for database to be ready..."
-sleep 5
+python -m database.wait_for_db
 
-# Initialize database tables
-echo "Initializing database..."
-python seed_scripts/init_db.py
+# Create tables and apply pending versioned migrations. Extra replicas can
+# skip this with RUN_MIGRATIONS=false.
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    echo "Running database migrations..."
+    python -m database.migrate
+fi
 
 # Run seed scripts
-echo "Running seed scripts..."
-python seed_scripts/create_admin.py
+if [ "${SEED_ADMIN:-true}" = "true" ]; then
+    echo "Running seed scripts..."
+    python seed_scripts/create_admin.py
+fi
 
 # Start the application
 echo "Starting FastAPI application..."
@@ -1,9 +1,9 @@
 import os
-from pypdf import PdfReader
-from docx import Document as DocxDocument
+from typing import Optional
 
-def extract_text(file_path: str) -> str:
-    _, file_extension = os.path.splitext(file_path)
+def extract_text(file_path: str, filename: Optional[str] = None) -> str:
+    # Blob paths have no extension; the original filename decides the format
+    _, file_extension = os.path.splitext(filename or file_path)
     file_extension = file_extension.lower()
 
     if file_extension == '.pdf':
@@ -16,6 +16,8 @@ def extract_text(file_path: str) -> str:
         raise ValueError(f"Unsupported file format: {file_extension}")
 
 def extract_from_pdf(file_path: str) -> str:
+    # Imported on first use so the gateway starts without loading the parsers
+    from pypdf import PdfReader
     reader = PdfReader(file_path)
     text = ""
     for page in reader.pages:
@@ -23,6 +25,7 @@ def extract_from_pdf(file_path: str) -> str:
     return text
 
 def extract_from_docx(file_path: str) -> str:
+    from docx import Document as DocxDocument
     doc = DocxDocument(file_path)
     text = ""
     for para in doc.paragraphs:
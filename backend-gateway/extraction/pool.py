@@ -0,0 +1,49 @@
+"""
+Process pool for text extraction.
+
+PDF/DOCX parsing is CPU bound and holds the GIL, so batch extraction runs in
+separate processes instead of the threadpool. Workers are started with
+"spawn" so they don't inherit the gateway's event loop or DB connections.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from extraction.extractor import extract_text
+from monitoring.metrics import EXTRACTION_DURATION, file_type_label
+from monitoring.tracing import tracer
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+def shutdown_extraction_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+async def extract_text_in_pool(file_path: str, filename: Optional[str] = None) -> str:
+    loop = asyncio.get_running_loop()
+    file_type = file_type_label(filename or file_path)
+    with tracer.start_as_current_span("extraction", attributes={"file.type": file_type, "executor": "process"}), \
+            EXTRACTION_DURATION.labels(file_type, "process").time():
+        return await loop.run_in_executor(get_extraction_pool(), extract_text, file_path, filename)
+
+async def extract_text_in_thread(file_path: str, filename: Optional[str] = None) -> str:
+    """Extract a single document on the threadpool (request path)."""
+    file_type = file_type_label(filename or file_path)
+    with tracer.start_as_current_span("extraction", attributes={"file.type": file_type, "executor": "thread"}), \
+            EXTRACTION_DURATION.labels(file_type, "thread").time():
+        return await run_in_threadpool(extract_text, file_path, filename)
@@ -1,8 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
-from database.db import engine, Base
+from sqlalchemy import text
+from database.db import async_engine
+from database.pool import pool_status
+from monitoring.metrics import MetricsMiddleware, DB_POOL_CHECKED_OUT, metrics_response
+from monitoring.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from monitoring.profiling import ProfilingMiddleware
+from processing.agent_client import close_agent_client
+from documents.resumable_upload import run_upload_gc
+from processing.text_store import run_text_store_gc
+from processing.job_estimates import seed_latency_estimates
+from auth.invalidation import run_invalidation_listener
+from auth.auth_service import get_admin_user
+from auth.principal_cache import Principal
+from extraction.pool import shutdown_extraction_pool
+from pdf_reports.render_service import shutdown_render_pool, run_report_gc
+import asyncio
 from auth import router as auth_router
 from documents import router as documents_router
 from processing import router as processing_router
@@ -17,8 +33,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create Database Tables
-Base.metadata.create_all(bind=engine)
+setup_tracing()
+
+# Seconds /readyz waits for the database before reporting not ready
+READINESS_DB_TIMEOUT = float(os.getenv("READINESS_DB_TIMEOUT", 2))
 
 app = FastAPI(
     title="Legal Document Assistance Backend",
@@ -35,6 +53,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(auth_router.router)
 app.include_router(documents_router.router)
 app.include_router(processing_router.router)
@@ -50,6 +72,63 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+# Schema creation and migrations run before the server starts (entrypoint.sh),
+# so probes never touch the schema.
+_ready = False
+
+@app.get("/livez", include_in_schema=False)
+async def livez():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: startup has completed and the database answers."""
+    if not _ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    try:
+        async with async_engine.connect() as conn:
+            await asyncio.wait_for(conn.execute(text("SELECT 1")), READINESS_DB_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e}")
+        return JSONResponse(status_code=503, content={"status": "unavailable", "database": type(e).__name__})
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+if hasattr(async_engine.pool, "checkedout"):
+    DB_POOL_CHECKED_OUT.set_function(async_engine.pool.checkedout)
+
+@app.get("/health/db-pool")
+async def db_pool_health(admin: Principal = Depends(get_admin_user)):
+    return pool_status(async_engine.pool)
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def startup():
+    global _ready
+    _background_tasks.append(asyncio.create_task(run_upload_gc()))
+    _background_tasks.append(asyncio.create_task(run_report_gc()))
+    _background_tasks.append(asyncio.create_task(run_text_store_gc()))
+    _background_tasks.append(asyncio.create_task(run_invalidation_listener()))
+    _background_tasks.append(asyncio.create_task(seed_latency_estimates()))
+    _ready = True
+
+@app.on_event("shutdown")
+async def shutdown():
+    global _ready
+    # Stop receiving traffic while draining
+    _ready = False
+    for task in _background_tasks:
+        task.cancel()
+    await close_agent_client()
+    shutdown_extraction_pool()
+    shutdown_render_pool()
+    shutdown_tracing()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -5,10 +5,15 @@
 ALTER TABLE reports 
 ADD COLUMN IF NOT EXISTS user_id INTEGER;
 
--- Add foreign key constraint
-ALTER TABLE reports
-ADD CONSTRAINT fk_reports_user_id 
-FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL;
+-- Add foreign key constraint (guarded so the migration can be re-run)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'fk_reports_user_id') THEN
+        ALTER TABLE reports
+        ADD CONSTRAINT fk_reports_user_id 
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL;
+    END IF;
+END $$;
 
 -- Add index for better query performance
 CREATE INDEX IF NOT EXISTS idx_reports_user_id ON reports(user_id);
@@ -0,0 +1,67 @@
+-- Migration: Add daily_risk_rollup table backing /analytics/trends
+-- Date: 2026-10-19
+-- Purpose: Pre-aggregate successful risk analyses per user and day so the
+--          trends endpoint reads a handful of rollup rows instead of every
+--          agent_analysis row (and its JSONB response) in the period.
+
+CREATE TABLE IF NOT EXISTS daily_risk_rollup (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    analyses_count INTEGER NOT NULL DEFAULT 0,
+    risk_score_sum NUMERIC NOT NULL DEFAULT 0,
+    critical_count INTEGER NOT NULL DEFAULT 0,
+    high_count INTEGER NOT NULL DEFAULT 0,
+    medium_count INTEGER NOT NULL DEFAULT 0,
+    low_count INTEGER NOT NULL DEFAULT 0,
+    risks_detected INTEGER NOT NULL DEFAULT 0,
+    contract_count INTEGER NOT NULL DEFAULT 0,
+    agreement_count INTEGER NOT NULL DEFAULT 0,
+    policy_count INTEGER NOT NULL DEFAULT 0,
+    other_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Backfill from existing risk analyses
+-- (new writes keep the table in sync via analytics/rollup_service.py)
+INSERT INTO daily_risk_rollup (
+    user_id, day, analyses_count, risk_score_sum,
+    critical_count, high_count, medium_count, low_count,
+    risks_detected, contract_count, agreement_count, policy_count, other_count
+)
+SELECT
+    a.user_id,
+    date_trunc('day', a.created_at)::date AS day,
+    count(*),
+    coalesce(sum(s.score), 0),
+    count(*) FILTER (WHERE s.score > 80),
+    count(*) FILTER (WHERE s.score > 60 AND s.score <= 80),
+    count(*) FILTER (WHERE s.score > 40 AND s.score <= 60),
+    count(*) FILTER (WHERE s.score <= 40),
+    coalesce(sum(CASE
+        WHEN jsonb_typeof(a.response -> 'detailed_analysis' -> 'identified_risks') = 'array'
+        THEN jsonb_array_length(a.response -> 'detailed_analysis' -> 'identified_risks')
+        ELSE 0 END), 0),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) LIKE '%contract%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) LIKE '%agreement%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%agreement%'
+                       AND lower(coalesce(d.filename, '')) LIKE '%policy%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%agreement%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%policy%')
+FROM agent_analysis a
+LEFT JOIN documents d ON d.id = a.document_id
+CROSS JOIN LATERAL (
+    SELECT coalesce((a.response ->> 'risk_score')::numeric,
+                    (a.response ->> 'risk_percentage')::numeric, 0) AS score
+) s
+WHERE a.agent_type = 'risk'
+  AND a.success = TRUE
+  AND a.user_id IS NOT NULL
+GROUP BY a.user_id, date_trunc('day', a.created_at)::date
+ON CONFLICT (user_id, day) DO NOTHING;
+
+-- Supports the per-user analytics scan on agent_analysis while rollups are rebuilt
+CREATE INDEX IF NOT EXISTS idx_agent_analysis_user_type_created
+    ON agent_analysis(user_id, agent_type, created_at);
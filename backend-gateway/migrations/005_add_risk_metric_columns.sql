@@ -0,0 +1,23 @@
+-- Migration: Add materialized risk metric columns to agent_analysis table
+-- Date: 2026-10-19
+-- Purpose: Risk score, confidence and severity counts are populated at write
+--          time from the JSONB response so reports, dashboard and analytics
+--          can filter and sort on them without parsing the response.
+
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS risk_percentage INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS confidence_percentage INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS total_risks INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS critical_count INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS high_count INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS medium_count INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS low_count INTEGER;
+
+-- Answers "documents with risk above N%" from an index
+CREATE INDEX IF NOT EXISTS idx_agent_analysis_risk_percentage
+    ON agent_analysis(risk_percentage)
+    WHERE agent_type = 'risk' AND success = TRUE;
+
+COMMENT ON COLUMN agent_analysis.risk_percentage IS 'Overall risk score of a risk analysis (from response.risk_percentage)';
+COMMENT ON COLUMN agent_analysis.confidence_percentage IS 'Confidence of a risk analysis (from response.confidence_percentage)';
+
+-- Note: Existing rows are populated by scripts/backfill_risk_metrics.py
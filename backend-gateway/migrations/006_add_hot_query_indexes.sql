@@ -0,0 +1,36 @@
+-- Migration: Composite indexes for hot endpoint queries
+-- Date: 2026-10-19
+-- Purpose: Replace single-column lookups with composite indexes matching the
+--          filter + ORDER BY of each hot query. Built CONCURRENTLY so deploys
+--          do not block writes on large tables.
+-- migrate:no-transaction
+
+-- save_agent_result, get_latest_agent_results, /documents/{id}/analysis/{agent},
+-- /documents/{id}/process/{agent}, dashboard and document status lookups:
+--   WHERE document_id = ? AND agent_type = ? [AND success] ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agent_analysis_doc_type_created
+    ON agent_analysis(document_id, agent_type, created_at DESC)
+    INCLUDE (success);
+
+-- Dashboard recent risk analyses, daily rollup refresh, analysis history count:
+--   WHERE user_id = ? AND agent_type = ? AND success ORDER BY/RANGE created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_agent_analysis_user_type_success_created
+    ON agent_analysis(user_id, agent_type, success, created_at DESC)
+    INCLUDE (document_id, risk_percentage);
+
+-- Superseded by idx_agent_analysis_user_type_success_created
+DROP INDEX CONCURRENTLY IF EXISTS idx_agent_analysis_user_type_created;
+
+-- Document listings, /documents/reports, dashboard counts and recent uploads:
+--   WHERE user_id = ? [AND upload_date >= ?] ORDER BY upload_date DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_documents_user_upload_date
+    ON documents(user_id, upload_date DESC);
+
+-- /documents/{id}/report and report regeneration:
+--   WHERE document_id = ? AND agent_type = ? ORDER BY created_at DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reports_doc_type_created
+    ON reports(document_id, agent_type, created_at DESC);
+
+ANALYZE agent_analysis;
+ANALYZE documents;
+ANALYZE reports;
@@ -0,0 +1,8 @@
+-- Migration: Add token_version to users table
+-- Date: 2026-10-19
+-- Purpose: Access tokens carry the user's token_version so authenticated
+--          principals can be cached per worker; bumping the version on
+--          password change or deactivation revokes outstanding tokens.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+UPDATE users SET is_active = TRUE WHERE is_active IS NULL;
@@ -0,0 +1,18 @@
+-- Migration: Add content-addressed blob storage
+-- Date: 2026-10-19
+-- Purpose: Uploads are stored once per SHA-256 under shared_data/blobs and
+--          reference counted, so identical files share storage and their
+--          extracted text and analyses can be reused by hash.
+
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 VARCHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    path VARCHAR NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS file_size BIGINT;
+
+CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash);
@@ -0,0 +1,19 @@
+-- Migration: Add upload_sessions table
+-- Date: 2026-10-19
+-- Purpose: Tracks resumable chunked uploads (offset received so far and the
+--          expected SHA-256); idle sessions are garbage-collected.
+
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    filename VARCHAR NOT NULL,
+    total_size BIGINT NOT NULL,
+    expected_sha256 VARCHAR(64),
+    received_bytes BIGINT NOT NULL DEFAULT 0,
+    temp_path VARCHAR NOT NULL,
+    created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+    updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS ix_upload_sessions_user_id ON upload_sessions (user_id);
+CREATE INDEX IF NOT EXISTS ix_upload_sessions_updated_at ON upload_sessions (updated_at);
@@ -0,0 +1,25 @@
+-- Migration: Add bulk_batches table and documents.batch_id
+-- Date: 2026-10-19
+-- Purpose: Tracks progress of bulk archive uploads (POST /documents/bulk)
+--          and links the documents created from each archive.
+
+CREATE TABLE IF NOT EXISTS bulk_batches (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    archive_name VARCHAR,
+    status VARCHAR NOT NULL DEFAULT 'receiving',
+    agents JSONB,
+    total_files INTEGER NOT NULL DEFAULT 0,
+    skipped_files INTEGER NOT NULL DEFAULT 0,
+    extracted_files INTEGER NOT NULL DEFAULT 0,
+    failed_files INTEGER NOT NULL DEFAULT 0,
+    analyzed_files INTEGER NOT NULL DEFAULT 0,
+    error VARCHAR,
+    created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc'),
+    updated_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE INDEX IF NOT EXISTS ix_bulk_batches_user_id ON bulk_batches (user_id);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS batch_id VARCHAR(32) REFERENCES bulk_batches(id);
+CREATE INDEX IF NOT EXISTS ix_documents_batch_id ON documents (batch_id);
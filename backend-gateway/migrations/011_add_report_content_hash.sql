@@ -0,0 +1,6 @@
+-- Migration: Add content_hash to reports table
+-- Date: 2026-10-19
+-- Purpose: SHA-256 of the rendered PDF, used as a strong ETag for
+--          conditional and range requests on report downloads.
+
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
@@ -0,0 +1,24 @@
+-- Migration: Add render state and cache bookkeeping to reports
+-- Date: 2026-10-19
+-- Purpose: Reports are rendered on first download instead of during
+--          processing. render_state tracks whether file_path is current,
+--          file_size and last_accessed_at drive LRU eviction under the
+--          report cache quota, and each document keeps one row per report
+--          type (older duplicates are dropped; their files are swept as
+--          orphans).
+
+-- Existing rows already have their file on disk
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS render_state VARCHAR(16) NOT NULL DEFAULT 'ready';
+ALTER TABLE reports ALTER COLUMN render_state SET DEFAULT 'pending';
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS file_size BIGINT;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS rendered_at TIMESTAMP;
+ALTER TABLE reports ADD COLUMN IF NOT EXISTS last_accessed_at TIMESTAMP;
+
+DELETE FROM reports older
+USING reports newer
+WHERE older.document_id = newer.document_id
+  AND older.agent_type IS NOT DISTINCT FROM newer.agent_type
+  AND (newer.created_at, newer.id) > (older.created_at, older.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_reports_document_agent ON reports (document_id, agent_type);
+CREATE INDEX IF NOT EXISTS idx_reports_last_accessed ON reports (last_accessed_at) WHERE file_path IS NOT NULL;
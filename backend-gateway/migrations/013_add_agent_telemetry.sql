@@ -0,0 +1,25 @@
+-- Migration: Add agent call telemetry columns to agent_analysis table
+-- Date: 2026-10-19
+-- Purpose: Agents return provider, attempts, token usage and LLM time with
+--          each analysis; the gateway adds the call's wall time and queue
+--          time. /analytics/trends reports p50/p95 processing time from them.
+
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS processing_ms INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS queue_ms INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS llm_ms INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS gemini_attempts INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS groq_attempts INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS prompt_tokens INTEGER;
+ALTER TABLE agent_analysis ADD COLUMN IF NOT EXISTS completion_tokens INTEGER;
+
+-- Processing time percentiles per user and period, answered from the index
+CREATE INDEX IF NOT EXISTS idx_agent_analysis_user_created_latency
+    ON agent_analysis(user_id, created_at)
+    INCLUDE (agent_type, ai_provider, success, processing_ms)
+    WHERE processing_ms IS NOT NULL;
+
+COMMENT ON COLUMN agent_analysis.processing_ms IS 'Gateway-side wall time of the agent call in milliseconds';
+COMMENT ON COLUMN agent_analysis.queue_ms IS 'Milliseconds between the processing request and the agent call';
+COMMENT ON COLUMN agent_analysis.llm_ms IS 'Milliseconds spent in LLM provider calls, across attempts';
+
+-- Note: Rows written before this migration have no telemetry and are left out of the percentiles
@@ -0,0 +1,30 @@
+-- Migration: Add token_usage ledger and per-user token budgets
+-- Date: 2026-10-19
+-- Purpose: Every agent call that reports LLM usage adds a ledger row (user,
+--          document, agent, provider). Daily and monthly sums are checked
+--          against the user's budget before agents are called, and
+--          /analytics/usage reports them.
+
+CREATE TABLE IF NOT EXISTS token_usage (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+    agent_type VARCHAR NOT NULL,
+    provider VARCHAR,
+    model VARCHAR,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+-- Budget checks sum a user's tokens since the start of the day/month
+CREATE INDEX IF NOT EXISTS idx_token_usage_user_created
+    ON token_usage (user_id, created_at) INCLUDE (total_tokens);
+
+-- NULL: use the gateway's DAILY_TOKEN_BUDGET / MONTHLY_TOKEN_BUDGET; 0: unlimited
+ALTER TABLE users ADD COLUMN IF NOT EXISTS daily_token_budget INTEGER;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS monthly_token_budget BIGINT;
+
+-- Note: Usage before this migration is not in the ledger; agent_analysis.prompt_tokens
+-- and completion_tokens (migration 013) hold the latest call per document and agent
@@ -0,0 +1,44 @@
+-- Migration: Notify gateway workers when a cached principal changes
+-- Date: 2026-10-19
+-- Purpose: Workers cache principals (id, username, email, full_name,
+--          is_active, token_version) and LISTEN on principal_invalidated;
+--          any change to those fields, from the API or plain SQL, drops the
+--          entry on every worker at commit. Deactivating a user also bumps
+--          token_version so outstanding tokens are revoked.
+
+CREATE OR REPLACE FUNCTION users_revoke_tokens_on_deactivate() RETURNS trigger AS $$
+BEGIN
+    IF NEW.is_active IS FALSE AND OLD.is_active IS DISTINCT FROM FALSE THEN
+        NEW.token_version := OLD.token_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION users_notify_principal_invalidated() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('principal_invalidated', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_revoke_tokens_on_deactivate ON users;
+CREATE TRIGGER users_revoke_tokens_on_deactivate
+    BEFORE UPDATE OF is_active ON users
+    FOR EACH ROW EXECUTE FUNCTION users_revoke_tokens_on_deactivate();
+
+DROP TRIGGER IF EXISTS users_notify_principal_update ON users;
+CREATE TRIGGER users_notify_principal_update
+    AFTER UPDATE ON users
+    FOR EACH ROW
+    WHEN (OLD.username IS DISTINCT FROM NEW.username
+          OR OLD.email IS DISTINCT FROM NEW.email
+          OR OLD.full_name IS DISTINCT FROM NEW.full_name
+          OR OLD.is_active IS DISTINCT FROM NEW.is_active
+          OR OLD.token_version IS DISTINCT FROM NEW.token_version)
+    EXECUTE FUNCTION users_notify_principal_invalidated();
+
+DROP TRIGGER IF EXISTS users_notify_principal_delete ON users;
+CREATE TRIGGER users_notify_principal_delete
+    AFTER DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION users_notify_principal_invalidated();
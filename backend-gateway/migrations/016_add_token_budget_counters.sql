@@ -0,0 +1,27 @@
+-- Migration: Add token_budget_counters for atomic budget reservations
+-- Date: 2026-10-19
+-- Purpose: Agent calls reserve their estimated tokens with a conditional
+--          upsert on the user's counter row, so concurrent requests cannot
+--          all pass the budget check; the reservation is reconciled to the
+--          actual usage afterwards.
+
+CREATE TABLE IF NOT EXISTS token_budget_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    day_used BIGINT NOT NULL DEFAULT 0,
+    month DATE NOT NULL,
+    month_used BIGINT NOT NULL DEFAULT 0
+);
+
+-- Start the counters from this month's ledger
+INSERT INTO token_budget_counters (user_id, day, day_used, month, month_used)
+SELECT
+    user_id,
+    (now() AT TIME ZONE 'utc')::date,
+    COALESCE(SUM(total_tokens) FILTER (WHERE created_at >= date_trunc('day', now() AT TIME ZONE 'utc')), 0),
+    date_trunc('month', now() AT TIME ZONE 'utc')::date,
+    SUM(total_tokens)
+FROM token_usage
+WHERE created_at >= date_trunc('month', now() AT TIME ZONE 'utc')
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
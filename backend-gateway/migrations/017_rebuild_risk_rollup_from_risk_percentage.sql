@@ -0,0 +1,53 @@
+-- Migration: Rebuild daily_risk_rollup from risk_percentage
+-- Date: 2026-10-19
+-- Purpose: The risk agent reports its overall score as risk_percentage, which
+--          is what populate_risk_metrics materializes. Earlier versions of
+--          migration 004 and populate_risk_metrics preferred a risk_score key
+--          when present; recompute the affected metric columns and rebuild the
+--          rollup from risk_percentage alone.
+
+UPDATE agent_analysis
+SET risk_percentage = coalesce(round((response ->> 'risk_percentage')::numeric)::integer, 0)
+WHERE agent_type = 'risk'
+  AND success = TRUE
+  AND risk_percentage IS NOT NULL
+  AND response ? 'risk_score';
+
+DELETE FROM daily_risk_rollup;
+
+INSERT INTO daily_risk_rollup (
+    user_id, day, analyses_count, risk_score_sum,
+    critical_count, high_count, medium_count, low_count,
+    risks_detected, contract_count, agreement_count, policy_count, other_count
+)
+SELECT
+    a.user_id,
+    date_trunc('day', a.created_at)::date AS day,
+    count(*),
+    coalesce(sum(s.score), 0),
+    count(*) FILTER (WHERE s.score > 80),
+    count(*) FILTER (WHERE s.score > 60 AND s.score <= 80),
+    count(*) FILTER (WHERE s.score > 40 AND s.score <= 60),
+    count(*) FILTER (WHERE s.score <= 40),
+    coalesce(sum(CASE
+        WHEN jsonb_typeof(a.response -> 'detailed_analysis' -> 'identified_risks') = 'array'
+        THEN jsonb_array_length(a.response -> 'detailed_analysis' -> 'identified_risks')
+        ELSE 0 END), 0),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) LIKE '%contract%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) LIKE '%agreement%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%agreement%'
+                       AND lower(coalesce(d.filename, '')) LIKE '%policy%'),
+    count(*) FILTER (WHERE lower(coalesce(d.filename, '')) NOT LIKE '%contract%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%agreement%'
+                       AND lower(coalesce(d.filename, '')) NOT LIKE '%policy%')
+FROM agent_analysis a
+LEFT JOIN documents d ON d.id = a.document_id
+CROSS JOIN LATERAL (
+    SELECT coalesce((a.response ->> 'risk_percentage')::numeric, 0) AS score
+) s
+WHERE a.agent_type = 'risk'
+  AND a.success = TRUE
+  AND a.user_id IS NOT NULL
+GROUP BY a.user_id, date_trunc('day', a.created_at)::date;
@@ -0,0 +1,120 @@
+"""
+Prometheus metrics for the gateway, exposed at GET /metrics.
+
+Covers request latency per route, requests in flight, agent call latency,
+agent queue depth and waits, DB pool checkout waits and connect times, text
+extraction and report rendering. Route labels use the route template
+(/documents/{doc_id}/report), never the raw path, to keep label cardinality
+bounded.
+"""
+import time
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "gateway_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "gateway_http_requests_in_flight",
+    "HTTP requests currently being handled"
+)
+AGENT_CALL_DURATION = Histogram(
+    "gateway_agent_call_duration_seconds",
+    "Latency of calls to the analysis agents",
+    ["agent", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+AGENT_CALLS_IN_FLIGHT = Gauge(
+    "gateway_agent_calls_in_flight",
+    "Agent calls currently waiting for a response",
+    ["agent"]
+)
+AGENT_QUEUE_DEPTH = Gauge(
+    "gateway_agent_queue_depth",
+    "Agent calls waiting for a slot (see processing/admission.py)",
+    ["agent"]
+)
+AGENT_QUEUE_WAIT = Histogram(
+    "gateway_agent_queue_wait_seconds",
+    "Time agent calls waited for a slot",
+    ["agent"],
+    buckets=LATENCY_BUCKETS
+)
+AGENT_ADMISSION_REJECTED = Counter(
+    "gateway_agent_admission_rejected_total",
+    "Requests rejected with 429 because an agent's wait queue was full",
+    ["agent"]
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "gateway_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_CONNECT_TIME = Histogram(
+    "gateway_db_pool_connect_seconds",
+    "Time spent opening a new database connection during a checkout",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_TIMEOUTS = Counter(
+    "gateway_db_pool_checkout_timeouts_total",
+    "Connection checkouts that gave up after DB_POOL_TIMEOUT"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "gateway_db_pool_checked_out_connections",
+    "Connections currently checked out of the pool"
+)
+EXTRACTION_DURATION = Histogram(
+    "gateway_extraction_duration_seconds",
+    "Text extraction time by file type",
+    ["file_type", "executor"],
+    buckets=LATENCY_BUCKETS
+)
+REPORT_RENDER_DURATION = Histogram(
+    "gateway_report_render_duration_seconds",
+    "PDF report render time",
+    ["kind"],
+    buckets=LATENCY_BUCKETS
+)
+
+def file_type_label(filename: str) -> str:
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    return extension if extension in ("pdf", "docx", "txt") else "other"
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight count for HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status["code"])
+            ).observe(time.perf_counter() - start)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,337 @@
+"""
+On-demand report rendering.
+
+Processing only marks a document's reports as pending; each report is
+rendered on its first download (GET /documents/{doc_id}/report) on a process
+pool, and concurrent first requests wait on the same render. Every rendered
+file is addressed by a hash of its inputs (RENDER_VERSION, document,
+filename, agent and the agent result), so identical results are never
+rendered twice: a pending report whose inputs did not change just reuses its
+file. The combined report is merged from the per-agent files, so a
+single-agent retry renders only that agent's section.
+
+The reports directory is a cache bounded by REPORT_CACHE_MAX_BYTES: after a
+render, least recently downloaded reports are evicted (file removed, row back
+to pending) until the total is under REPORT_CACHE_LOW_WATER of the quota.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.db import AsyncSessionLocal
+from documents.models import Report, AgentAnalysis
+from documents.blob_store import hash_file, remove_stored_file
+from pdf_reports import worker
+from monitoring.metrics import REPORT_RENDER_DURATION
+from monitoring.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = "shared_data/reports"
+os.makedirs(REPORT_DIR, exist_ok=True)
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", 2))
+# Bump when the report layout changes so existing files are re-rendered
+RENDER_VERSION = 1
+# Section order of the combined report
+COMBINED_SECTIONS = ["summary", "risk", "clause", "draft"]
+
+REPORT_CACHE_MAX_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+REPORT_CACHE_LOW_WATER = 0.9
+REPORT_GC_INTERVAL = int(os.getenv("REPORT_GC_INTERVAL", 3600))
+# Files in REPORT_DIR without a report row older than this are removed
+ORPHAN_REPORT_AGE = 3600
+EVICTION_BATCH_SIZE = 200
+# last_accessed_at is only written again after this many seconds
+ACCESS_TOUCH_INTERVAL = 60
+
+_pool: Optional[ProcessPoolExecutor] = None
+# Output path -> render in progress, so concurrent requests share one render
+_inflight: Dict[str, asyncio.Future] = {}
+# (document_id, agent_type) -> materialization in progress
+_materializing: Dict[Tuple[int, str], asyncio.Future] = {}
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=worker.warm_up
+        )
+    return _pool
+
+def shutdown_render_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def render_key(*parts) -> str:
+    payload = json.dumps([RENDER_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def report_download_name(document_id: int, agent_type: Optional[str]) -> str:
+    if not agent_type or agent_type == "combined":
+        return f"{document_id}_report.pdf"
+    return f"{document_id}_{agent_type}_report.pdf"
+
+async def _timed_render(kind: str, fn, *args) -> str:
+    loop = asyncio.get_running_loop()
+    # The reportlab build runs in a pool process; the span covers the build and the hand-off
+    with tracer.start_as_current_span("report.render", attributes={"report.kind": kind}), \
+            REPORT_RENDER_DURATION.labels(kind).time():
+        return await loop.run_in_executor(get_render_pool(), fn, *args)
+
+async def _render_once(report_path: str, kind: str, fn, *args) -> str:
+    if await run_in_threadpool(os.path.exists, report_path):
+        return report_path
+    future = _inflight.get(report_path)
+    if future is None:
+        future = asyncio.ensure_future(_timed_render(kind, fn, *args))
+        _inflight[report_path] = future
+        future.add_done_callback(lambda _: _inflight.pop(report_path, None))
+    return await asyncio.shield(future)
+
+async def render_agent_report(document_id: int, agent_name: str, data: dict, filename: str) -> str:
+    key = render_key(document_id, filename, agent_name, data)
+    report_path = f"{REPORT_DIR}/{document_id}_{agent_name}_{key[:16]}.pdf"
+    return await _render_once(report_path, "agent", worker.render_agent, document_id, agent_name, data, filename, report_path)
+
+async def render_combined_report(document_id: int, results: dict, filename: str) -> Optional[str]:
+    """Combined report for the successful results, or None if there are none."""
+    agent_names = [name for name in COMBINED_SECTIONS if name in results and "error" not in results[name]]
+    if not agent_names:
+        return None
+    sections = await asyncio.gather(*(
+        render_agent_report(document_id, name, results[name], filename) for name in agent_names
+    ))
+    # Section paths embed the hash of their inputs
+    key = render_key(document_id, filename, sections)
+    report_path = f"{REPORT_DIR}/{document_id}_combined_{key[:16]}.pdf"
+    return await _render_once(report_path, "combined", worker.render_combined, document_id, filename, agent_names, sections, report_path)
+
+async def mark_reports_pending(db: AsyncSession, document_id: int, user_id: int, agent_types: List[str]):
+    """
+    Record that the reports of agent_types and the combined report are out
+    of date; they are rendered again on their next download. Commits.
+    """
+    if not agent_types:
+        return
+    stmt = insert(Report).values([
+        {"document_id": document_id, "user_id": user_id, "agent_type": agent_type, "render_state": "pending"}
+        for agent_type in [*agent_types, "combined"]
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["document_id", "agent_type"],
+        set_={"render_state": "pending"}
+    )
+    await db.execute(stmt)
+    await db.commit()
+
+async def latest_agent_results(db: AsyncSession, document_id: int, agent_types: List[str]) -> dict:
+    """Latest successful result per agent type: agent type -> response."""
+    result = await db.execute(
+        select(AgentAnalysis.agent_type, AgentAnalysis.response).filter(
+            AgentAnalysis.document_id == document_id,
+            AgentAnalysis.agent_type.in_(agent_types),
+            AgentAnalysis.success == True,
+            AgentAnalysis.response.isnot(None)
+        ).distinct(AgentAnalysis.agent_type).order_by(
+            AgentAnalysis.agent_type, AgentAnalysis.created_at.desc()
+        )
+    )
+    return {row.agent_type: row.response for row in result}
+
+async def _store_rendered(db: AsyncSession, document_id: int, user_id: int, agent_type: str, path: str) -> Optional[str]:
+    """
+    Point the report of agent_type at path and mark it ready, unless it was
+    marked pending after the render started (newer results: it stays pending
+    and renders again on its next download). Does not commit.
+
+    Returns:
+        The replaced file, if the report pointed at a different one
+    """
+    content_hash = await run_in_threadpool(hash_file, path)
+    size = await run_in_threadpool(os.path.getsize, path)
+    result = await db.execute(select(Report).filter(
+        Report.document_id == document_id,
+        Report.agent_type == agent_type
+    ).with_for_update())
+    report = result.scalars().first()
+    if report is None:
+        report = Report(document_id=document_id, user_id=user_id, agent_type=agent_type)
+        db.add(report)
+    replaced = report.file_path if report.file_path and report.file_path != path else None
+    now = datetime.utcnow()
+    report.file_path = path
+    report.content_hash = content_hash
+    report.file_size = size
+    if report.render_state != "pending":
+        report.render_state = "ready"
+    report.rendered_at = now
+    report.last_accessed_at = now
+    return replaced
+
+async def _materialize(document_id: int, user_id: int, agent_type: str, filename: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Report).where(
+            Report.document_id == document_id,
+            Report.agent_type == agent_type
+        ).values(render_state="rendering"))
+        results = await latest_agent_results(db, document_id, COMBINED_SECTIONS if agent_type == "combined" else [agent_type])
+        await db.commit()
+
+        rendered: Dict[str, str] = {}
+        try:
+            if agent_type == "combined":
+                combined_path = await render_combined_report(document_id, results, filename)
+                if combined_path:
+                    # The sections are on disk now; track them too
+                    for name in COMBINED_SECTIONS:
+                        if name in results and "error" not in results[name]:
+                            rendered[name] = await render_agent_report(document_id, name, results[name], filename)
+                    rendered["combined"] = combined_path
+            elif agent_type in results:
+                rendered[agent_type] = await render_agent_report(document_id, agent_type, results[agent_type], filename)
+        except Exception as e:
+            logger.error(f"Failed to render {agent_type} report for document {document_id}: {e}")
+            rendered = {}
+
+        if agent_type not in rendered:
+            await db.execute(update(Report).where(
+                Report.document_id == document_id,
+                Report.agent_type == agent_type
+            ).values(render_state="failed"))
+            await db.commit()
+            return
+
+        replaced = []
+        for name, path in rendered.items():
+            old_path = await _store_rendered(db, document_id, user_id, name, path)
+            if old_path:
+                replaced.append(old_path)
+        await db.commit()
+        logger.info(f"Rendered {agent_type} report for document {document_id}")
+
+    for path in replaced:
+        await run_in_threadpool(remove_stored_file, path)
+    await enforce_report_quota(keep=rendered.values())
+
+async def materialize_report(db: AsyncSession, report: Report, filename: str) -> Report:
+    """
+    Make sure report has a current file, rendering it if needed.
+    Concurrent callers for the same report wait on a single render.
+
+    Raises:
+        HTTPException 404 if there is no successful analysis to render
+    """
+    if report.render_state == "ready" and report.file_path and await run_in_threadpool(os.path.exists, report.file_path):
+        now = datetime.utcnow()
+        if report.file_size is None:
+            # Rendered before sizes were recorded
+            report.file_size = await run_in_threadpool(os.path.getsize, report.file_path)
+        if report.last_accessed_at is None or now - report.last_accessed_at > timedelta(seconds=ACCESS_TOUCH_INTERVAL):
+            report.last_accessed_at = now
+        await db.commit()
+        return report
+
+    key = (report.document_id, report.agent_type)
+    future = _materializing.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_materialize(report.document_id, report.user_id, report.agent_type, filename))
+        _materializing[key] = future
+        future.add_done_callback(lambda _: _materializing.pop(key, None))
+    await asyncio.shield(future)
+
+    await db.refresh(report)
+    if report.render_state == "failed" or not report.file_path:
+        raise HTTPException(status_code=404, detail="Report not available")
+    return report
+
+async def enforce_report_quota(keep: Iterable[str] = ()) -> int:
+    """
+    Evict least recently downloaded reports until the cached files fit
+    under REPORT_CACHE_LOW_WATER of REPORT_CACHE_MAX_BYTES.
+
+    Args:
+        keep: paths that must not be evicted (just rendered)
+
+    Returns:
+        Number of reports evicted
+    """
+    keep = list(keep)
+    evicted: List[str] = []
+    async with AsyncSessionLocal() as db:
+        total = await db.scalar(select(func.coalesce(func.sum(Report.file_size), 0)).filter(Report.file_path.isnot(None)))
+        if total <= REPORT_CACHE_MAX_BYTES:
+            return 0
+        target = REPORT_CACHE_MAX_BYTES * REPORT_CACHE_LOW_WATER
+        while total > target:
+            result = await db.execute(select(Report).filter(
+                Report.file_path.isnot(None),
+                Report.file_path.notin_(keep)
+            ).order_by(Report.last_accessed_at.asc().nulls_first()).limit(EVICTION_BATCH_SIZE).with_for_update(skip_locked=True))
+            candidates = result.scalars().all()
+            if not candidates:
+                break
+            for report in candidates:
+                if total <= target:
+                    break
+                total -= report.file_size or 0
+                evicted.append(report.file_path)
+                report.file_path = None
+                report.file_size = None
+                report.content_hash = None
+                report.render_state = "pending"
+            await db.commit()
+
+    for path in evicted:
+        await run_in_threadpool(remove_stored_file, path)
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} cached report(s)")
+    return len(evicted)
+
+async def collect_orphan_reports() -> int:
+    """Remove report files no row points to (replaced or from older versions)."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Report.file_path).filter(Report.file_path.isnot(None)))
+        referenced = {os.path.normpath(row[0]) for row in result}
+
+    def sweep() -> int:
+        removed = 0
+        stale_before = time.time() - ORPHAN_REPORT_AGE
+        for entry in os.scandir(REPORT_DIR):
+            try:
+                if (entry.is_file() and os.path.normpath(entry.path) not in referenced
+                        and entry.stat().st_mtime < stale_before):
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    return await run_in_threadpool(sweep)
+
+async def run_report_gc():
+    """Background loop started with the app."""
+    while True:
+        try:
+            await enforce_report_quota()
+            removed = await collect_orphan_reports()
+            if removed:
+                logger.info(f"Removed {removed} orphaned report file(s)")
+        except Exception as e:
+            logger.error(f"Report cache cleanup failed: {e}")
+        await asyncio.sleep(REPORT_GC_INTERVAL)
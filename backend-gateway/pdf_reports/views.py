@@ -0,0 +1,166 @@
+"""
+HTML and JSON views of a document's analysis.
+
+Built straight from the latest successful AgentAnalysis results with the
+same sections as the PDF reports, so viewing results in the browser needs
+no PDF rendering; the PDF reports remain for export.
+"""
+from html import escape
+from typing import Iterator, List
+
+SECTION_TITLES = {
+    "summary": "Executive Summary",
+    "risk": "Risk Analysis",
+    "clause": "Key Clauses Analysis",
+    "draft": "Drafting Suggestions",
+}
+
+def normalize_section(agent_name: str, data: dict) -> dict:
+    """Pick the fields the reports show from an agent response."""
+    section = {
+        "agent": agent_name,
+        "title": SECTION_TITLES.get(agent_name, f"{agent_name.capitalize()} Analysis"),
+        "model_used": data.get("model_used", "Unknown Model"),
+    }
+    if agent_name == "summary":
+        section["summary"] = data.get("summary", "No summary provided.")
+        section["key_insights"] = data.get("key_insights", [])
+    elif agent_name == "risk":
+        section["risk_percentage"] = data.get("risk_percentage", 0)
+        section["confidence_percentage"] = data.get("confidence_percentage", 0)
+        section["risks"] = [
+            {
+                "risk_type": risk.get("risk_type", ""),
+                "severity": risk.get("severity", ""),
+                "description": risk.get("description", ""),
+                "risk_percentage": risk.get("risk_percentage", 0),
+            }
+            for risk in (data.get("detailed_analysis") or {}).get("identified_risks", [])
+        ]
+    elif agent_name == "clause":
+        section["clauses"] = [
+            {
+                "clause_name": clause.get("clause_name", "Clause"),
+                "clause_type": clause.get("clause_type", "Type"),
+                "summary": clause.get("summary", ""),
+                "risk_level": clause.get("risk_level", ""),
+                "risk_description": clause.get("risk_description", ""),
+                "confidence_percentage": clause.get("confidence_percentage", "N/A"),
+            }
+            for clause in data.get("key_insights", [])
+        ]
+    elif agent_name == "draft":
+        section["suggestions"] = [
+            {
+                "issue": suggestion.get("issue", ""),
+                "location": suggestion.get("location", ""),
+                "problem": suggestion.get("problem", ""),
+                "suggested_revision": suggestion.get("suggested_revision", ""),
+            }
+            for suggestion in data.get("ai_suggestions", [])
+        ]
+    return section
+
+def report_bundle(document_id: int, filename: str, results: dict, agent_names: List[str]) -> dict:
+    """
+    Normalized report: the sections for agent_names (in that order) that
+    have a successful result.
+    """
+    return {
+        "document_id": document_id,
+        "document_name": filename,
+        "sections": [
+            normalize_section(name, results[name])
+            for name in agent_names
+            if name in results and "error" not in results[name]
+        ],
+    }
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ font-family: Helvetica, Arial, sans-serif; max-width: 960px; margin: 2rem auto; padding: 0 1rem; color: #222; }}
+h1 {{ text-align: center; }}
+h2 {{ border-bottom: 1px solid #ccc; padding-bottom: .25rem; margin-top: 2rem; }}
+.meta {{ color: grey; font-size: .8rem; text-align: right; font-style: italic; }}
+table {{ border-collapse: collapse; width: 100%; }}
+th {{ background: grey; color: whitesmoke; text-align: left; }}
+td {{ background: beige; vertical-align: top; }}
+th, td {{ border: 1px solid black; padding: .4rem; }}
+</style>
+</head>
+<body>
+"""
+
+def _summary_html(section: dict) -> str:
+    parts = [f"<p>{escape(str(section['summary']))}</p>"]
+    if section["key_insights"]:
+        parts.append("<h3>Key Insights</h3><ul>")
+        parts.extend(f"<li>{escape(str(insight))}</li>" for insight in section["key_insights"])
+        parts.append("</ul>")
+    return "".join(parts)
+
+def _risk_html(section: dict) -> str:
+    parts = [
+        f"<p><b>Overall Risk Score:</b> {escape(str(section['risk_percentage']))}%</p>",
+        f"<p><b>Confidence:</b> {escape(str(section['confidence_percentage']))}%</p>",
+    ]
+    if section["risks"]:
+        parts.append("<table><tr><th>Risk Type</th><th>Severity</th><th>Description</th><th>Risk %</th></tr>")
+        for risk in section["risks"]:
+            parts.append(
+                f"<tr><td>{escape(str(risk['risk_type']))}</td><td>{escape(str(risk['severity']))}</td>"
+                f"<td>{escape(str(risk['description']))}</td><td>{escape(str(risk['risk_percentage']))}%</td></tr>"
+            )
+        parts.append("</table>")
+    return "".join(parts)
+
+def _clause_html(section: dict) -> str:
+    parts = []
+    for clause in section["clauses"]:
+        parts.append(
+            f"<h3>{escape(str(clause['clause_name']))} ({escape(str(clause['clause_type']))})</h3>"
+            f"<p><b>Summary:</b> {escape(str(clause['summary']))}</p>"
+            f"<p><b>Risk Level:</b> {escape(str(clause['risk_level']))} - {escape(str(clause['risk_description']))}</p>"
+            f"<p><b>Confidence:</b> {escape(str(clause['confidence_percentage']))}%</p>"
+        )
+    return "".join(parts)
+
+def _draft_html(section: dict) -> str:
+    parts = []
+    for idx, suggestion in enumerate(section["suggestions"], 1):
+        parts.append(
+            f"<p><b>Issue {idx}:</b> {escape(str(suggestion['issue']))}<br>"
+            f"<b>Location:</b> {escape(str(suggestion['location']))}<br>"
+            f"<b>Problem:</b> {escape(str(suggestion['problem']))}<br>"
+            f"<b>Suggested Revision:</b> {escape(str(suggestion['suggested_revision']))}</p>"
+        )
+    return "".join(parts)
+
+SECTION_RENDERERS = {
+    "summary": _summary_html,
+    "risk": _risk_html,
+    "clause": _clause_html,
+    "draft": _draft_html,
+}
+
+def iter_report_html(bundle: dict) -> Iterator[str]:
+    """Yield the HTML page for a report bundle one section at a time."""
+    yield HTML_HEAD.format(title=escape(f"Analysis Report - {bundle['document_name']}"))
+    yield "<h1>Legal Document Analysis Report</h1>"
+    yield f"<h2>Document: {escape(bundle['document_name'])}</h2>"
+    for section in bundle["sections"]:
+        renderer = SECTION_RENDERERS.get(section["agent"])
+        if renderer is None:
+            continue
+        yield (
+            f"<section id=\"{escape(section['agent'])}\"><h2>{escape(section['title'])}</h2>"
+            f"<p class=\"meta\">Analyzed by: {escape(str(section['model_used']))}</p>"
+            f"{renderer(section)}</section>"
+        )
+    yield f"<p class=\"meta\">Report generated for document ID: {bundle['document_id']}</p>"
+    yield "</body>\n</html>\n"
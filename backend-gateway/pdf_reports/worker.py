@@ -0,0 +1,20 @@
+"""
+Entry points of the render process pool.
+
+The gateway only pickles references to these functions; reportlab and pypdf
+(pdf_reports/generator.py) are imported inside the pool processes, so they
+are never loaded by the gateway process itself.
+"""
+
+def warm_up():
+    """Pool initializer: load reportlab and build the shared styles once per worker."""
+    from pdf_reports.generator import get_styles
+    get_styles()
+
+def render_agent(*args) -> str:
+    from pdf_reports.generator import generate_agent_report
+    return generate_agent_report(*args)
+
+def render_combined(*args) -> str:
+    from pdf_reports.generator import generate_pdf_report
+    return generate_pdf_report(*args)
@@ -0,0 +1,421 @@
+"""
+Admission control and dispatch order for agent calls.
+
+Every agent has its own AgentQueue: at most AGENT_CONCURRENCY calls to the
+agent run at once, and the rest wait for a slot in one of two lanes:
+
+    interactive   single-agent calls a user is waiting on (retry-agent,
+                  /documents/{id}/process/{agent_type}); always served first
+    shared        everything else (process-document, background and bulk
+                  processing), shared between users by weighted fair queuing
+
+Each call carries its expected duration (processing/job_estimates.py, from
+the document's token count and the agent's recent latency). Within a lane,
+and within one user's calls in the shared lane, the shortest expected call
+goes first, so a 2-page NDA does not wait behind a 400-page loan agreement.
+A call's expected duration is reduced by AGENT_QUEUE_AGING seconds for every
+second it has waited, so long calls are never starved.
+
+Between users the shared lane uses self-clocked fair queuing: a user that
+starts waiting gets a virtual start time (the later of the queue's virtual
+clock and the finish of the user's previous call), and the user whose next
+call would finish first in virtual time, start + expected duration / weight,
+is served next. A user with hundreds of queued bulk calls and a user with
+one call therefore share the agent in proportion to their weights rather
+than in arrival order. Weights come from USER_WEIGHTS
+("<user id>:<weight>,..."), DEFAULT_USER_WEIGHT otherwise.
+
+Each lane holds at most AGENT_QUEUE_DEPTH waiting calls. A request that
+would queue beyond that is rejected with 429 and a Retry-After estimated
+from how fast the agent's queue is draining, instead of piling up as
+blocking agent calls, held pool connections and 504s. Work that was already
+accepted (background processing, bulk batches) waits for a slot rather than
+being rejected, so it still counts towards the limit.
+
+Limits are per gateway worker. Queue depth, wait times and rejections are
+exported as Prometheus metrics and returned, with a per-user breakdown, by
+GET /api/processing/queues; GET /api/processing/estimate/{document_id}
+simulates the dispatch order to tell a client when its calls would start
+and finish.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from monitoring.metrics import AGENT_QUEUE_DEPTH, AGENT_QUEUE_WAIT, AGENT_ADMISSION_REJECTED
+from processing.job_estimates import expected_seconds, seconds_per_token
+
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", 4))
+AGENT_QUEUE_DEPTH_LIMIT = int(os.getenv("AGENT_QUEUE_DEPTH", 32))
+# Completions over this window give the drain rate behind Retry-After
+DRAIN_RATE_WINDOW = float(os.getenv("AGENT_DRAIN_RATE_WINDOW", 60))
+# Assumed duration of a call until the agent has completed any
+ASSUMED_CALL_SECONDS = float(os.getenv("AGENT_ASSUMED_CALL_SECONDS", 30))
+# Seconds of expected duration forgiven per second spent waiting
+AGENT_QUEUE_AGING = float(os.getenv("AGENT_QUEUE_AGING", 1))
+DEFAULT_USER_WEIGHT = float(os.getenv("DEFAULT_USER_WEIGHT", 1))
+
+INTERACTIVE_LANE = "interactive"
+SHARED_LANE = "shared"
+LANES = (INTERACTIVE_LANE, SHARED_LANE)
+
+def _parse_weights(value: str) -> Dict[int, float]:
+    weights = {}
+    for item in value.split(","):
+        user_id, _, weight = item.partition(":")
+        if user_id.strip() and weight.strip():
+            weights[int(user_id)] = float(weight)
+    return weights
+
+USER_WEIGHTS = _parse_weights(os.getenv("USER_WEIGHTS", ""))
+
+def user_weight(user_id: Optional[int]) -> float:
+    weight = USER_WEIGHTS.get(user_id, DEFAULT_USER_WEIGHT)
+    return weight if weight > 0 else DEFAULT_USER_WEIGHT
+
+class Job:
+    """One agent call, from joining the queue until its slot is released."""
+
+    def __init__(self, user_id: Optional[int], lane: str, expected: float, seq: int):
+        self.user_id = user_id
+        self.lane = lane
+        self.expected = expected
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.future: Optional[asyncio.Future] = None
+
+    @property
+    def abandoned(self) -> bool:
+        """Cancelled while waiting; its task removes it from the queue when it resumes."""
+        return self.future is not None and self.future.cancelled()
+
+    def aged_cost(self, now: float) -> float:
+        return max(self.expected - AGENT_QUEUE_AGING * (now - self.enqueued_at), 0.0)
+
+class FairShare:
+    """Virtual clock and per-user tags of the shared lane."""
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        # Virtual start of the next call of each user with calls waiting
+        self.start: Dict[Optional[int], float] = {}
+        self.last_finish: Dict[Optional[int], float] = {}
+
+    def copy(self) -> "FairShare":
+        fair = FairShare()
+        fair.virtual_time = self.virtual_time
+        fair.start = dict(self.start)
+        fair.last_finish = dict(self.last_finish)
+        return fair
+
+    def backlogged(self, user_id: Optional[int]):
+        if user_id not in self.start:
+            self.start[user_id] = max(self.virtual_time, self.last_finish.get(user_id, 0.0))
+
+    def finish(self, job: Job, now: float) -> float:
+        return self.start[job.user_id] + job.aged_cost(now) / user_weight(job.user_id)
+
+    def dispatched(self, job: Job, now: float, more_waiting: bool):
+        finish = self.finish(job, now)
+        self.last_finish[job.user_id] = finish
+        # Self-clocked: the virtual clock is the finish time in service
+        self.virtual_time = max(self.virtual_time, finish)
+        if more_waiting:
+            self.start[job.user_id] = finish
+        else:
+            del self.start[job.user_id]
+        # A finish time the clock has passed no longer affects any start
+        for user_id, last in list(self.last_finish.items()):
+            if last <= self.virtual_time and user_id not in self.start:
+                del self.last_finish[user_id]
+
+    def withdrawn(self, user_id: Optional[int], more_waiting: bool):
+        if not more_waiting:
+            self.start.pop(user_id, None)
+
+def _shortest(jobs: Iterable[Job], now: float) -> Job:
+    return min(jobs, key=lambda job: (job.aged_cost(now), job.seq))
+
+def _next_job(waiters: List[Job], fair: FairShare, now: float) -> Job:
+    interactive = [job for job in waiters if job.lane == INTERACTIVE_LANE]
+    if interactive:
+        return _shortest(interactive, now)
+    by_user: Dict[Optional[int], List[Job]] = {}
+    for job in waiters:
+        by_user.setdefault(job.user_id, []).append(job)
+    heads = [_shortest(jobs, now) for jobs in by_user.values()]
+    return min(heads, key=lambda job: (fair.finish(job, now), job.seq))
+
+def _user_waiting(waiters: List[Job], user_id: Optional[int]) -> bool:
+    return any(job.user_id == user_id and job.lane == SHARED_LANE and not job.abandoned for job in waiters)
+
+class UserStats:
+    def __init__(self):
+        self.waiting = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.total_wait = 0.0
+
+class AgentQueue:
+    """Concurrency limit plus bounded, fair-share wait queue for one agent."""
+
+    def __init__(self, agent: str, concurrency: int = AGENT_CONCURRENCY, depth: int = AGENT_QUEUE_DEPTH_LIMIT):
+        self.agent = agent
+        self.concurrency = concurrency
+        self.depth = depth
+        self.running: Set[Job] = set()
+        self.waiters: List[Job] = []
+        self.fair = FairShare()
+        self.completions = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.users: Dict[Optional[int], UserStats] = {}
+        self._seq = itertools.count()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.running)
+
+    def waiting(self, lane: Optional[str] = None) -> int:
+        return sum(1 for job in self.waiters if lane is None or job.lane == lane)
+
+    def is_full(self, lane: str = SHARED_LANE) -> bool:
+        return self.in_flight >= self.concurrency and self.waiting(lane) >= self.depth
+
+    def drain_rate(self) -> float:
+        """Calls completed per second, over the last DRAIN_RATE_WINDOW."""
+        cutoff = time.monotonic() - DRAIN_RATE_WINDOW
+        while self.completions and self.completions[0] < cutoff:
+            self.completions.popleft()
+        if not self.completions:
+            return max(self.concurrency, 1) / ASSUMED_CALL_SECONDS
+        return len(self.completions) / DRAIN_RATE_WINDOW
+
+    def retry_after(self, lane: str = SHARED_LANE) -> int:
+        """Seconds until the lane is expected to have room again."""
+        # Interactive calls are served first, so they drain before the shared lane
+        ahead = self.waiting(INTERACTIVE_LANE) if lane == SHARED_LANE else 0
+        excess = ahead + max(self.waiting(lane) - self.depth, 0) + 1
+        return max(1, math.ceil(excess / self.drain_rate()))
+
+    def rejection(self, lane: str = SHARED_LANE) -> HTTPException:
+        return HTTPException(
+            status_code=429,
+            detail={
+                "message": f"The {self.agent} agent is at capacity, retry later",
+                "agent": self.agent,
+                "queue_depth": self.waiting(lane)
+            },
+            headers={"Retry-After": str(self.retry_after(lane))}
+        )
+
+    def reject(self, lane: str = SHARED_LANE):
+        self.rejected += 1
+        AGENT_ADMISSION_REJECTED.labels(self.agent).inc()
+        raise self.rejection(lane)
+
+    def _user(self, user_id: Optional[int]) -> UserStats:
+        if user_id not in self.users:
+            self.users[user_id] = UserStats()
+        return self.users[user_id]
+
+    async def acquire(
+        self,
+        user_id: Optional[int] = None,
+        lane: str = SHARED_LANE,
+        wait_if_full: bool = False,
+        expected: Optional[float] = None
+    ) -> Job:
+        """
+        Take a call slot, waiting in line if none is free.
+
+        Args:
+            expected: expected duration of the call in seconds
+                (ASSUMED_CALL_SECONDS when unknown)
+
+        Returns:
+            The running Job, to be passed to release()
+
+        Raises:
+            HTTPException(429) if the lane's wait queue is full, unless wait_if_full
+        """
+        job = Job(user_id, lane, expected or ASSUMED_CALL_SECONDS, next(self._seq))
+        if self.in_flight < self.concurrency and not self.waiters:
+            self._start(job)
+            return job
+        if self.is_full(lane) and not wait_if_full:
+            self.reject(lane)
+
+        job.future = asyncio.get_running_loop().create_future()
+        if lane == SHARED_LANE:
+            self.fair.backlogged(user_id)
+        self.waiters.append(job)
+        self._user(user_id).waiting += 1
+        AGENT_QUEUE_DEPTH.labels(self.agent).set(len(self.waiters))
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job in self.running:
+                # The slot was handed over just as the caller went away
+                self.release(job, completed=False)
+            elif job in self.waiters:
+                self.waiters.remove(job)
+                self._user(user_id).waiting -= 1
+                if lane == SHARED_LANE:
+                    self.fair.withdrawn(user_id, _user_waiting(self.waiters, user_id))
+                AGENT_QUEUE_DEPTH.labels(self.agent).set(len(self.waiters))
+            raise
+        return job
+
+    def _start(self, job: Job):
+        job.started_at = time.monotonic()
+        wait = job.started_at - job.enqueued_at
+        self.running.add(job)
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        user = self._user(job.user_id)
+        user.admitted += 1
+        user.in_flight += 1
+        user.total_wait += wait
+        AGENT_QUEUE_WAIT.labels(self.agent).observe(wait)
+
+    def release(self, job: Job, completed: bool = True):
+        """Free the job's slot and start the next waiting calls."""
+        if completed:
+            self.completions.append(time.monotonic())
+        self.running.discard(job)
+        self._user(job.user_id).in_flight -= 1
+        now = time.monotonic()
+        while self.in_flight < self.concurrency:
+            # Abandoned waiters are left for their own tasks to remove
+            candidates = [job for job in self.waiters if not job.abandoned]
+            if not candidates:
+                break
+            job = _next_job(candidates, self.fair, now)
+            self.waiters.remove(job)
+            self._user(job.user_id).waiting -= 1
+            if job.lane == SHARED_LANE:
+                self.fair.dispatched(job, now, _user_waiting(self.waiters, job.user_id))
+            self._start(job)
+            job.future.set_result(None)
+        AGENT_QUEUE_DEPTH.labels(self.agent).set(len(self.waiters))
+
+    def estimate(self, expected: float, user_id: Optional[int] = None, lane: str = SHARED_LANE) -> Tuple[float, float]:
+        """
+        Seconds from now until a call joining the queue now would start and
+        finish, simulating the dispatch order with every expected duration
+        taken at face value.
+        """
+        now = time.monotonic()
+        fair = self.fair.copy()
+        probe = Job(user_id, lane, expected, math.inf)
+        if lane == SHARED_LANE:
+            fair.backlogged(user_id)
+        waiters = [job for job in self.waiters if not job.abandoned] + [probe]
+        # When each slot frees up
+        slots = [max(job.expected - (now - job.started_at), 0.0) for job in self.running]
+        slots += [0.0] * max(max(self.concurrency, 1) - len(slots), 0)
+        heapq.heapify(slots)
+        while True:
+            job = _next_job(waiters, fair, now)
+            waiters.remove(job)
+            if job.lane == SHARED_LANE:
+                fair.dispatched(job, now, _user_waiting(waiters, job.user_id))
+            start = heapq.heappop(slots)
+            if job is probe:
+                return start, start + expected
+            heapq.heappush(slots, start + job.expected)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_limit": self.depth,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "lanes": {lane: self.waiting(lane) for lane in LANES},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "drain_rate_per_min": round(self.drain_rate() * 60, 2),
+            "retry_after": self.retry_after() if self.is_full() else 0,
+            "seconds_per_1k_tokens": round(seconds_per_token(self.agent) * 1000, 3),
+            "users": {
+                str(user_id): {
+                    "weight": user_weight(user_id),
+                    "waiting": user.waiting,
+                    "in_flight": user.in_flight,
+                    "admitted": user.admitted,
+                    "avg_wait_ms": round(user.total_wait / user.admitted * 1000, 1) if user.admitted else 0.0
+                }
+                for user_id, user in self.users.items()
+            }
+        }
+
+_queues: Dict[str, AgentQueue] = {}
+
+def agent_queue(agent: str) -> AgentQueue:
+    if agent not in _queues:
+        _queues[agent] = AgentQueue(agent)
+    return _queues[agent]
+
+def ensure_capacity(agents: Iterable[str], interactive: bool = False):
+    """Reject the request up front if any of the agents it needs is full."""
+    lane = INTERACTIVE_LANE if interactive else SHARED_LANE
+    for agent in agents:
+        queue = agent_queue(agent)
+        if queue.is_full(lane):
+            queue.reject(lane)
+
+@asynccontextmanager
+async def agent_slot(
+    agent: str,
+    user_id: Optional[int] = None,
+    interactive: bool = False,
+    wait_if_full: bool = False,
+    expected: Optional[float] = None
+):
+    """Hold one of the agent's call slots for the duration of the block."""
+    queue = agent_queue(agent)
+    job = await queue.acquire(user_id, INTERACTIVE_LANE if interactive else SHARED_LANE, wait_if_full, expected)
+    try:
+        yield
+    finally:
+        queue.release(job)
+
+def schedule_estimate(agents: List[str], tokens: int, user_id: Optional[int] = None, interactive: bool = False) -> List[dict]:
+    """
+    Expected duration plus estimated start and finish (seconds from now) of
+    each agent call, for calls made one after another as process-document
+    does.
+    """
+    lane = INTERACTIVE_LANE if interactive else SHARED_LANE
+    schedule = []
+    ready = 0.0
+    for agent in agents:
+        queue = agent_queue(agent)
+        expected = expected_seconds(agent, tokens)
+        start, _ = queue.estimate(expected, user_id, lane)
+        start = max(start, ready)
+        ready = start + expected
+        schedule.append({
+            "agent": agent,
+            "expected_seconds": round(expected, 1),
+            "queue_depth": queue.waiting(),
+            "start_in": round(start, 1),
+            "finish_in": round(ready, 1)
+        })
+    return schedule
+
+def queue_stats() -> dict:
+    return {agent: queue.stats() for agent, queue in sorted(_queues.items())}
@@ -0,0 +1,115 @@
+"""
+Shared async HTTP client for calls from the gateway to the agent services.
+
+Agent calls take 60-120s; doing them with a blocking client inside async
+endpoints would stall the event loop, so all agent traffic goes through one
+pooled httpx.AsyncClient. The document text is passed by reference when
+possible (see processing/text_store.py).
+"""
+import httpx
+import logging
+import os
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from monitoring.metrics import AGENT_CALL_DURATION, AGENT_CALLS_IN_FLIGHT
+from monitoring.tracing import tracer, trace_headers
+from processing.text_store import text_payload
+
+logger = logging.getLogger(__name__)
+
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", 60))
+AGENT_CONNECT_TIMEOUT = float(os.getenv("AGENT_CONNECT_TIMEOUT", 5))
+AGENT_MAX_CONNECTIONS = int(os.getenv("AGENT_MAX_CONNECTIONS", 100))
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_agent_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(AGENT_TIMEOUT, connect=AGENT_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=AGENT_MAX_CONNECTIONS, max_keepalive_connections=20)
+        )
+    return _client
+
+async def close_agent_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def elapsed_ms(since: float) -> int:
+    """Milliseconds since a time.perf_counter() reading."""
+    return round((time.perf_counter() - since) * 1000)
+
+def agent_error_telemetry(response: httpx.Response) -> dict:
+    """Telemetry an agent attached to its error response, if any."""
+    try:
+        detail = response.json().get("detail")
+    except (ValueError, AttributeError):
+        return {}
+    telemetry = detail.get("telemetry") if isinstance(detail, dict) else None
+    return telemetry if isinstance(telemetry, dict) else {}
+
+async def post_analyze(url: str, text: str, timeout: float = AGENT_TIMEOUT, extra: Optional[dict] = None, headers: Optional[dict] = None) -> httpx.Response:
+    """
+    POST the document text, plus any extra fields, to an agent's /analyze.
+
+    The text goes by reference when the store allows it. An agent that
+    can't read the reference (no shared volume, file already collected, or
+    an agent without text_ref support) answers 422, and the request is
+    repeated with the text inline.
+    """
+    payload = {**(extra or {}), **await text_payload(text)}
+    response = await get_agent_client().post(f"{url}/analyze", json=payload, timeout=timeout, headers=headers)
+    if "text_ref" in payload and response.status_code == 422:
+        logger.warning(f"Agent {url} could not read text_ref {payload['text_ref']}, sending the text inline")
+        payload = {**(extra or {}), "text": text}
+        response = await get_agent_client().post(f"{url}/analyze", json=payload, timeout=timeout, headers=headers)
+    return response
+
+async def call_agent(url: str, text: str, timeout: float = AGENT_TIMEOUT) -> dict:
+    """
+    Run an agent's /analyze on text (see post_analyze).
+
+    Returns the agent's result, or {"error": ...} on failure. Either way the
+    result carries a "telemetry" object with the call's processing_ms, merged
+    with the agent's own telemetry (provider, attempts, tokens) when the
+    agent returned any.
+    """
+    # Agents are labelled by service host (clause-agent, ...)
+    agent = urlsplit(url).hostname or url
+    outcome = "error"
+    AGENT_CALLS_IN_FLIGHT.labels(agent).inc()
+    start = time.perf_counter()
+    with tracer.start_as_current_span("agent.call", kind=SpanKind.CLIENT, attributes={
+        "agent.service": agent, "document.text_length": len(text)
+    }) as span:
+        try:
+            # trace_headers() carries this span's context into the agent
+            response = await post_analyze(url, text, timeout, headers=trace_headers())
+            span.set_attribute("http.response.status_code", response.status_code)
+            response.raise_for_status()
+            result = response.json()
+            outcome = "success"
+        except httpx.TimeoutException as e:
+            outcome = "timeout"
+            logger.error(f"Error calling agent {url}: {e}")
+            result = {"error": str(e)}
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error calling agent {url}: {e}")
+            result = {"error": str(e), "telemetry": agent_error_telemetry(e.response)}
+        except Exception as e:
+            logger.error(f"Error calling agent {url}: {e}")
+            result = {"error": str(e)}
+        finally:
+            if outcome != "success":
+                span.set_status(Status(StatusCode.ERROR, outcome))
+            AGENT_CALLS_IN_FLIGHT.labels(agent).dec()
+            AGENT_CALL_DURATION.labels(agent, outcome).observe(time.perf_counter() - start)
+
+    telemetry = result.get("telemetry")
+    result["telemetry"] = {**(telemetry if isinstance(telemetry, dict) else {}), "processing_ms": elapsed_ms(start)}
+    return result
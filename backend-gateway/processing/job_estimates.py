@@ -0,0 +1,82 @@
+"""
+Expected duration of agent calls.
+
+An agent call is expected to take CALL_OVERHEAD_SECONDS plus its estimated
+prompt tokens (analytics.usage_service.estimate_tokens) times the agent's
+seconds per token. Seconds per token start at
+DEFAULT_SECONDS_PER_1K_TOKENS / 1000, are seeded at startup from the
+telemetry of the last LATENCY_HISTORY_DAYS of analyses (processing_ms over
+prompt_tokens), and then follow completed calls as an exponentially
+weighted moving average.
+
+The estimates order dispatch (see processing/admission.py), give clients
+estimated start and finish times, and scale the timeout of each call with
+the size of its document.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import func, select
+from database.db import AsyncSessionLocal
+from documents.models import AgentAnalysis
+from processing.agent_client import AGENT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SECONDS_PER_1K_TOKENS = float(os.getenv("DEFAULT_SECONDS_PER_1K_TOKENS", 4))
+CALL_OVERHEAD_SECONDS = float(os.getenv("AGENT_CALL_OVERHEAD_SECONDS", 2))
+LATENCY_HISTORY_DAYS = int(os.getenv("LATENCY_HISTORY_DAYS", 7))
+LATENCY_EWMA_ALPHA = float(os.getenv("LATENCY_EWMA_ALPHA", 0.2))
+# A call may take this many times its expected duration before timing out
+AGENT_TIMEOUT_FACTOR = float(os.getenv("AGENT_TIMEOUT_FACTOR", 3))
+AGENT_MAX_TIMEOUT = float(os.getenv("AGENT_MAX_TIMEOUT", 600))
+
+_seconds_per_token: Dict[str, float] = {}
+
+def seconds_per_token(agent: str) -> float:
+    return _seconds_per_token.get(agent, DEFAULT_SECONDS_PER_1K_TOKENS / 1000)
+
+def expected_seconds(agent: str, tokens: int) -> float:
+    """Expected duration of one call to agent with a prompt of about tokens."""
+    return CALL_OVERHEAD_SECONDS + tokens * seconds_per_token(agent)
+
+def call_timeout(expected: float, base: float = AGENT_TIMEOUT) -> float:
+    """Timeout for a call expected to take expected seconds: never below base."""
+    return min(max(base, expected * AGENT_TIMEOUT_FACTOR), max(base, AGENT_MAX_TIMEOUT))
+
+def observe_call(agent: str, telemetry: Optional[dict]):
+    """Fold the telemetry of a completed call into the agent's estimate."""
+    if not isinstance(telemetry, dict):
+        return
+    tokens = telemetry.get("prompt_tokens")
+    processing_ms = telemetry.get("processing_ms")
+    if not tokens or not processing_ms:
+        return
+    sample = max(processing_ms / 1000 - CALL_OVERHEAD_SECONDS, 0) / tokens
+    previous = _seconds_per_token.get(agent)
+    _seconds_per_token[agent] = sample if previous is None else previous + LATENCY_EWMA_ALPHA * (sample - previous)
+
+async def seed_latency_estimates():
+    """Start the per-agent estimates from recent telemetry (run at startup)."""
+    since = datetime.utcnow() - timedelta(days=LATENCY_HISTORY_DAYS)
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    AgentAnalysis.agent_type,
+                    func.sum(AgentAnalysis.processing_ms).label("processing_ms"),
+                    func.sum(AgentAnalysis.prompt_tokens).label("prompt_tokens"),
+                    func.count().label("calls")
+                ).where(
+                    AgentAnalysis.success == True,
+                    AgentAnalysis.created_at >= since,
+                    AgentAnalysis.processing_ms.isnot(None),
+                    AgentAnalysis.prompt_tokens > 0
+                ).group_by(AgentAnalysis.agent_type)
+            )
+            for row in result:
+                overhead_ms = CALL_OVERHEAD_SECONDS * 1000 * row.calls
+                _seconds_per_token[row.agent_type] = max(row.processing_ms - overhead_ms, 0) / 1000 / row.prompt_tokens
+    except Exception as e:
+        logger.error(f"Could not load agent latency history: {e}")
@@ -1,18 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.db import get_db
-from auth.auth_service import get_current_user
-from auth.models import User
-from documents.models import Document, AgentAnalysis, Report
-from database.db import SessionLocal
-from extraction.extractor import extract_text
-from pdf_reports.generator import generate_pdf_report, generate_agent_report
-import requests
+from auth.auth_service import get_current_user, get_admin_user
+from auth.principal_cache import Principal
+from documents.models import Document, AgentAnalysis, apply_agent_telemetry
+from database.db import AsyncSessionLocal, release_connection
+from processing.agent_client import call_agent, elapsed_ms
+from processing.admission import agent_slot, ensure_capacity, queue_stats, schedule_estimate
+from processing.job_estimates import call_timeout, expected_seconds, observe_call
+from extraction.pool import extract_text_in_thread
+from pdf_reports.render_service import mark_reports_pending
+from monitoring.tracing import tracer
+from analytics.rollup_service import refresh_rollup_for_analysis
+from analytics.usage_service import (
+    TokenReservation, budget_exceeded_error, estimate_tokens, enforce_token_budget, record_token_usage,
+    release_reservation, reserve_tokens
+)
 import os
+import time
 import logging
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -44,27 +54,43 @@ class AgentType(str, Enum):
 class ProcessRequest(BaseModel):
     priority_agents: List[str] = ["clause", "risk", "draft", "summary"]
 
-def call_agent(url: str, text: str):
-    try:
-        response = requests.post(f"{url}/analyze", json={"text": text}, timeout=60)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logger.error(f"Error calling agent {url}: {e}")
-        return {"error": str(e)}
+async def save_agent_result(
+    db: AsyncSession,
+    agent_name: str,
+    result: dict,
+    document_id: int,
+    user_id: int,
+    text: str,
+    queue_ms: Optional[int] = None,
+    reservation: Optional[TokenReservation] = None
+):
+    """
+    Upsert the agent's analysis of the document.
 
-def save_agent_result(db: Session, agent_name: str, result: dict, document_id: int, user_id: int, text: str):
+    The result's "telemetry" (added by call_agent) is moved into the
+    telemetry columns rather than stored with the response, and the
+    reservation charged to the user's budget for this call is reconciled
+    to its actual usage.
+    """
+    telemetry = result.pop("telemetry", None)
+    if telemetry is not None:
+        telemetry["queue_ms"] = queue_ms
     success = "error" not in result
+    if success:
+        observe_call(agent_name, telemetry)
     error_msg = result.get("error")
     
     # Check if analysis already exists
-    analysis = db.query(AgentAnalysis).filter(
+    result_row = await db.execute(select(AgentAnalysis).filter(
         AgentAnalysis.document_id == document_id,
         AgentAnalysis.agent_type == agent_name
-    ).first()
+    ).limit(1))
+    analysis = result_row.scalars().first()
     
+    previous_created_at = None
     if analysis:
         # Update existing
+        previous_created_at = analysis.created_at
         analysis.response = result
         analysis.success = success
         # Explicitly clear error if successful
@@ -83,58 +109,115 @@ def save_agent_result(db: Session, agent_name: str, result: dict, document_id: i
             user_id=user_id
         )
         db.add(analysis)
+    apply_agent_telemetry(analysis, telemetry)
+    await record_token_usage(db, analysis, telemetry, reservation)
     
-    db.commit()
+    with tracer.start_as_current_span("db.commit", attributes={"agent.type": agent_name, "document.id": document_id}):
+        await db.run_sync(refresh_rollup_for_analysis, analysis, previous_created_at)
+        await db.commit()
+    if reservation is not None:
+        reservation.mark_settled()
+
+async def find_reusable_results(db: AsyncSession, document: Document, agent_names: List[str]) -> dict:
+    """
+    Latest successful result per agent from the same user's other documents
+    with identical content, so re-uploads don't re-run the agents.
+
+    Each result carries a "telemetry" object with the source analysis's
+    provider and model only: no tokens were spent on the reuse.
+    """
+    if not document.content_hash:
+        return {}
+    result = await db.execute(
+        select(
+            AgentAnalysis.agent_type, AgentAnalysis.response, AgentAnalysis.ai_provider, AgentAnalysis.model_used
+        ).join(
+            Document, Document.id == AgentAnalysis.document_id
+        ).filter(
+            Document.content_hash == document.content_hash,
+            Document.user_id == document.user_id,
+            Document.id != document.id,
+            AgentAnalysis.agent_type.in_(agent_names),
+            AgentAnalysis.success == True,
+            AgentAnalysis.response.isnot(None)
+        ).distinct(AgentAnalysis.agent_type).order_by(
+            AgentAnalysis.agent_type, AgentAnalysis.created_at.desc()
+        )
+    )
+    return {
+        row.agent_type: {**row.response, "telemetry": {"provider": row.ai_provider, "model": row.model_used}}
+        for row in result
+    }
 
-def process_background_task(document_id: int, user_id: int, text: str, remaining_agents: List[str], initial_results: dict, filename: str):
+async def process_background_task(
+    document_id: int,
+    user_id: int,
+    text: str,
+    remaining_agents: List[str],
+    initial_results: dict,
+    filename: str,
+    accepted_at: Optional[float] = None
+):
+    """
+    Args:
+        accepted_at: time.perf_counter() when the work was requested, for
+            the analyses' queue_ms (defaults to now)
+    """
+    accepted_at = accepted_at or time.perf_counter()
     # Create a new DB session for the background task
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         results = initial_results.copy()
         
         for agent_name in remaining_agents:
             if agent_name in AGENT_URLS:
                 logger.info(f"Background processing: {agent_name}")
-                res = call_agent(AGENT_URLS[agent_name], text)
-                results[agent_name] = res
-                
-                # Save to DB
-                save_agent_result(db, agent_name, res, document_id, user_id, text)
+                estimated = estimate_tokens(text)
+                reservation = await reserve_tokens(db, user_id, estimated)
+                try:
+                    if reservation is None:
+                        budget_error = await budget_exceeded_error(db, user_id, estimated)
+                        await release_connection(db)
+                        logger.warning(f"Skipping {agent_name} for document {document_id}: {budget_error.detail['message']}")
+                        queue_ms = elapsed_ms(accepted_at)
+                        res = {"error": budget_error.detail["message"]}
+                    else:
+                        await release_connection(db)
+                        # Accepted work waits for a slot instead of being rejected
+                        expected = expected_seconds(agent_name, estimated)
+                        async with agent_slot(agent_name, user_id, wait_if_full=True, expected=expected):
+                            queue_ms = elapsed_ms(accepted_at)
+                            res = await call_agent(AGENT_URLS[agent_name], text, call_timeout(expected))
+                    results[agent_name] = res
+                    
+                    # Save to DB
+                    await save_agent_result(db, agent_name, res, document_id, user_id, text, queue_ms, reservation)
+                finally:
+                    await release_reservation(reservation)
                 
-        # Generate PDF
-        try:
-            pdf_path = generate_pdf_report(document_id, results, filename)
-            logger.info(f"Full PDF Report generated at {pdf_path}")
-            
-            # Save Report to DB
-            report = Report(document_id=document_id, file_path=pdf_path)
-            db.add(report)
-            db.commit()
-            
-        except Exception as e:
-            logger.error(f"Failed to generate PDF in background: {e}")
-            
-    finally:
-        db.close()
+        # Reports are rendered on their first download
+        updated = [name for name in remaining_agents if name in results and 'error' not in results[name]]
+        await mark_reports_pending(db, document_id, user_id, updated)
 
 @router.post("/process-document/{document_id}")
 async def process_document(
     document_id: int,
     request: ProcessRequest,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    document = db.query(Document).filter(Document.id == document_id, Document.user_id == current_user.id).first()
+    accepted_at = time.perf_counter()
+    result = await db.execute(select(Document).filter(Document.id == document_id, Document.user_id == current_user.id))
+    document = result.scalars().first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # 1. Extract Text (Synchronous for now to feed the first agent)
     if not document.extracted_text:
         try:
-            text = extract_text(document.file_path)
+            text = await extract_text_in_thread(document.file_path, document.filename)
             document.extracted_text = text
-            db.commit()
+            await db.commit()
         except Exception as e:
             logger.error(f"Extraction failed: {e}")
             raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
@@ -146,51 +229,51 @@ async def process_document(
     if not agents_to_run:
         agents_to_run = ["clause", "risk", "draft", "summary"]
     
-    results = {}
-    
-    # 3. Run All Agents Synchronously
-    for agent_name in agents_to_run:
-        if agent_name in AGENT_URLS:
-            logger.info(f"Processing agent: {agent_name}")
-            # Call Agent
-            res = call_agent(AGENT_URLS[agent_name], text)
-            results[agent_name] = res
-            
-            # Save to DB
-            save_agent_result(db, agent_name, res, document_id, current_user.id, text)
-            
-            # Generate Individual Report (only if no error)
-            if 'error' not in res:
-                try:
-                    report_path = generate_agent_report(document_id, agent_name, res, document.filename)
-                    logger.info(f"Report for {agent_name} generated at {report_path}")
-                    
-                    # Save Report Metadata
-                    report = Report(document_id=document_id, user_id=current_user.id, agent_type=agent_name, file_path=report_path)
-                    db.add(report)
-                    db.commit()
-                except Exception as e:
-                    logger.error(f"Failed to generate report for {agent_name}: {e}")
-            else:
-                logger.warning(f"Skipping report generation for {agent_name} due to error: {res.get('error')}")
+    reusable = await find_reusable_results(db, document, agents_to_run)
+    to_call = [name for name in agents_to_run if name in AGENT_URLS and name not in reusable]
+    reservation = None
+    if to_call:
+        # Admission first, so a rejected request reserves no tokens
+        ensure_capacity(to_call)
+        reservation = await enforce_token_budget(db, current_user.id, estimate_tokens(text, len(to_call)))
 
-    # 4. Generate Combined PDF Report (only if at least one agent succeeded)
-    successful_results = {k: v for k, v in results.items() if 'error' not in v}
-    
-    if successful_results:
-        try:
-            pdf_path = generate_pdf_report(document_id, results, document.filename)
-            logger.info(f"Full PDF Report generated at {pdf_path}")
-            
-            # Save Report to DB (agent_type=None for combined)
-            report = Report(document_id=document_id, user_id=current_user.id, agent_type="combined", file_path=pdf_path)
-            db.add(report)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Failed to generate combined PDF: {e}")
-    else:
-        logger.warning("No successful agent results, skipping combined report generation")
-        # We don't fail the request if PDF fails, but we warn
+    try:
+        # End the read transaction so no pooled connection is held while the
+        # agents run; every save below is its own short transaction
+        await release_connection(db)
+        
+        results = {}
+        
+        # 3. Run All Agents Synchronously
+        for agent_name in agents_to_run:
+            if agent_name in AGENT_URLS:
+                queue_ms = None
+                share = None
+                if agent_name in reusable:
+                    logger.info(f"Reusing {agent_name} result for identical content")
+                    res = reusable[agent_name]
+                else:
+                    logger.info(f"Processing agent: {agent_name}")
+                    # This agent's share of the reservation made above
+                    share = reservation.take(estimate_tokens(text))
+                    # Admitted above; waits in line if the agent is busy
+                    expected = expected_seconds(agent_name, share.tokens)
+                    async with agent_slot(agent_name, current_user.id, wait_if_full=True, expected=expected):
+                        queue_ms = elapsed_ms(accepted_at)
+                        res = await call_agent(AGENT_URLS[agent_name], text, call_timeout(expected))
+                results[agent_name] = res
+                
+                # Save to DB
+                await save_agent_result(db, agent_name, res, document_id, current_user.id, text, queue_ms, share)
+                
+                if 'error' in res:
+                    logger.warning(f"Skipping report generation for {agent_name} due to error: {res.get('error')}")
+
+        # 4. Individual and combined PDF reports are rendered on their first download
+        await mark_reports_pending(db, document_id, current_user.id, [name for name, res in results.items() if 'error' not in res])
+    finally:
+        # Tokens of calls that never got saved (cancelled or failed request)
+        await release_reservation(reservation)
         
     # 5. Return All Results
     return {
@@ -199,33 +282,21 @@ async def process_document(
         "document_id": document_id
     }
 
-def get_latest_agent_results(db: Session, document_id: int) -> dict:
-    """Fetch the latest successful result for each agent type for a document."""
-    results = {}
-    for agent_name in AGENT_URLS.keys():
-        analysis = db.query(AgentAnalysis).filter(
-            AgentAnalysis.document_id == document_id,
-            AgentAnalysis.agent_type == agent_name,
-            AgentAnalysis.success == True
-        ).order_by(AgentAnalysis.created_at.desc()).first()
-        
-        if analysis and analysis.response:
-            results[agent_name] = analysis.response
-    return results
-
 @router.post("/retry-agent/{document_id}/{agent_name}")
 async def retry_agent(
     document_id: int,
     agent_name: AgentType,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
+    accepted_at = time.perf_counter()
     # Convert enum to string for dictionary lookup
     agent_name_str = agent_name.value
     if agent_name_str not in AGENT_URLS:
         raise HTTPException(status_code=400, detail="Invalid agent name")
 
-    document = db.query(Document).filter(Document.id == document_id, Document.user_id == current_user.id).first()
+    result = await db.execute(select(Document).filter(Document.id == document_id, Document.user_id == current_user.id))
+    document = result.scalars().first()
     if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
@@ -233,87 +304,83 @@ async def retry_agent(
         raise HTTPException(status_code=400, detail="Document text not extracted yet")
         
     text = document.extracted_text
-    
-    # Call Agent
-    logger.info(f"Retrying agent: {agent_name_str}")
-    result = call_agent(AGENT_URLS[agent_name_str], text)
-    
-    # Save Result
-    save_agent_result(db, agent_name_str, result, document_id, current_user.id, text)
-    
-    # Delete old reports for this specific agent
-    old_agent_reports = db.query(Report).filter(
-        Report.document_id == document_id,
-        Report.agent_type == agent_name_str
-    ).all()
-    
-    for old_report in old_agent_reports:
-        # Delete physical file if it exists
-        if old_report.file_path and os.path.exists(old_report.file_path):
-            try:
-                os.remove(old_report.file_path)
-                logger.info(f"Deleted old report file: {old_report.file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete old report file {old_report.file_path}: {e}")
-        # Delete database record
-        db.delete(old_report)
-    
-    db.commit()
-    logger.info(f"Deleted {len(old_agent_reports)} old report(s) for agent {agent_name_str}")
-    
-    # Generate new individual agent report
+    ensure_capacity([agent_name_str], interactive=True)
+    reservation = await enforce_token_budget(db, current_user.id, estimate_tokens(text))
     try:
-        agent_report_path = generate_agent_report(document_id, agent_name_str, result, document.filename)
-        logger.info(f"New report for {agent_name_str} generated at {agent_report_path}")
+        await release_connection(db)
         
-        # Save new agent report to DB
-        agent_report = Report(
-            document_id=document_id, 
-            user_id=current_user.id, 
-            agent_type=agent_name_str, 
-            file_path=agent_report_path
-        )
-        db.add(agent_report)
-        db.commit()
-    except Exception as e:
-        logger.error(f"Failed to generate individual report for {agent_name_str}: {e}")
-    
-    # Regenerate combined PDF with all latest results
-    all_results = get_latest_agent_results(db, document_id)
-    
-    # Delete old combined report
-    old_combined_reports = db.query(Report).filter(
-        Report.document_id == document_id,
-        Report.agent_type == "combined"
-    ).all()
-    
-    for old_combined in old_combined_reports:
-        if old_combined.file_path and os.path.exists(old_combined.file_path):
-            try:
-                os.remove(old_combined.file_path)
-                logger.info(f"Deleted old combined report: {old_combined.file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to delete old combined report {old_combined.file_path}: {e}")
-        db.delete(old_combined)
-    
-    db.commit()
-    
-    try:
-        pdf_path = generate_pdf_report(document_id, all_results, document.filename)
-        logger.info(f"Combined PDF Report regenerated at {pdf_path}")
+        # Call Agent
+        logger.info(f"Retrying agent: {agent_name_str}")
+        expected = expected_seconds(agent_name_str, reservation.tokens)
+        async with agent_slot(agent_name_str, current_user.id, interactive=True, wait_if_full=True, expected=expected):
+            queue_ms = elapsed_ms(accepted_at)
+            result = await call_agent(AGENT_URLS[agent_name_str], text, call_timeout(expected))
         
-        # Save new combined report to DB
-        report = Report(document_id=document_id, user_id=current_user.id, agent_type="combined", file_path=pdf_path)
-        db.add(report)
-        db.commit()
-        
-    except Exception as e:
-        logger.error(f"Failed to regenerate combined PDF after retry: {e}")
-        # We don't fail the request if PDF fails, but we warn
+        # Save Result
+        await save_agent_result(db, agent_name_str, result, document_id, current_user.id, text, queue_ms, reservation)
+    finally:
+        await release_reservation(reservation)
+    
+    # This agent's report and the combined report render again on their next
+    # download; the combined report reuses the other agents' rendered sections
+    success = "error" not in result
+    if success:
+        await mark_reports_pending(db, document_id, current_user.id, [agent_name_str])
     
     return {
         "message": f"Agent {agent_name_str} retried successfully",
         "result": result,
-        "agent_report_generated": True,
-        "combined_report_regenerated": True
+        "agent_report_generated": success,
+        "combined_report_regenerated": success
+    }
+
+@router.get("/processing/queues")
+async def processing_queues(admin: Principal = Depends(get_admin_user)):
+    """Per-agent concurrency, queue depth and wait times of this worker."""
+    return {"success": True, "data": queue_stats()}
+
+@router.get("/processing/estimate/{document_id}")
+async def processing_estimate(
+    document_id: int,
+    agents: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    When the document's agent calls would start and finish if requested now,
+    run one after another as process-document does. agents is a
+    comma-separated list (all agents by default).
+    """
+    result = await db.execute(select(Document).filter(Document.id == document_id, Document.user_id == current_user.id))
+    document = result.scalars().first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not document.extracted_text:
+        # Extracted once here; process-document reuses it
+        try:
+            document.extracted_text = await extract_text_in_thread(document.file_path, document.filename)
+            await db.commit()
+        except Exception as e:
+            logger.error(f"Extraction failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
+
+    agent_names = [name.strip() for name in agents.split(",")] if agents else ["clause", "risk", "draft", "summary"]
+    unknown = [name for name in agent_names if name not in AGENT_URLS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid agent name: {', '.join(unknown)}")
+
+    now = datetime.utcnow()
+    schedule = schedule_estimate(agent_names, estimate_tokens(document.extracted_text), current_user.id)
+    return {
+        "success": True,
+        "data": [
+            {
+                "agent": item["agent"],
+                "expected_seconds": item["expected_seconds"],
+                "queue_depth": item["queue_depth"],
+                "estimated_start": (now + timedelta(seconds=item["start_in"])).isoformat(),
+                "estimated_finish": (now + timedelta(seconds=item["finish_in"])).isoformat()
+            }
+            for item in schedule
+        ]
     }
@@ -0,0 +1,111 @@
+"""
+Document text handed to the agents by reference.
+
+Rather than serializing the extracted text into every /analyze request, the
+gateway writes it once, UTF-8 encoded, to TEXT_STORE_DIR/<aa>/<sha256>.txt on
+the volume it shares with the agents, and sends {"text_ref", "sha256"}. The
+agents map the file and read it from there. Files are written to a temp name
+and renamed into place, so an agent never sees a partial file.
+
+Texts shorter than TEXT_REF_MIN_CHARS are still sent inline, and so is
+everything when AGENT_TEXT_BY_REFERENCE is off or the store can't be written.
+Files not used for TEXT_STORE_TTL are removed by a periodic task; reusing a
+text refreshes its mtime.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import Tuple
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR", "shared_data/texts")
+AGENT_TEXT_BY_REFERENCE = os.getenv("AGENT_TEXT_BY_REFERENCE", "true").lower() in ("1", "true", "yes")
+TEXT_REF_MIN_CHARS = int(os.getenv("TEXT_REF_MIN_CHARS", 8192))
+TEXT_STORE_TTL = int(os.getenv("TEXT_STORE_TTL", 24 * 3600))
+TEXT_STORE_GC_INTERVAL = int(os.getenv("TEXT_STORE_GC_INTERVAL", 3600))
+
+def text_ref(sha256: str) -> str:
+    """Path of a stored text relative to TEXT_STORE_DIR."""
+    return f"{sha256[:2]}/{sha256}.txt"
+
+def store_text(text: str) -> Tuple[str, str]:
+    """
+    Write text to the store unless it is already there.
+
+    Returns:
+        (text_ref, sha256) of the UTF-8 encoded text
+    """
+    data = text.encode("utf-8")
+    sha256 = hashlib.sha256(data).hexdigest()
+    ref = text_ref(sha256)
+    path = os.path.join(TEXT_STORE_DIR, ref)
+    try:
+        # Keeps a text in use from being collected
+        os.utime(path)
+        return ref, sha256
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return ref, sha256
+
+async def text_payload(text: str) -> dict:
+    """The part of an /analyze request that carries the document text."""
+    if not AGENT_TEXT_BY_REFERENCE or len(text) < TEXT_REF_MIN_CHARS:
+        return {"text": text}
+    try:
+        ref, sha256 = await run_in_threadpool(store_text, text)
+    except OSError as e:
+        logger.warning(f"Could not store document text, sending it inline: {e}")
+        return {"text": text}
+    return {"text_ref": ref, "sha256": sha256}
+
+def collect_stale_texts() -> int:
+    """
+    Remove stored texts (and leftover temp files) unused for TEXT_STORE_TTL.
+
+    Returns:
+        Number of files removed
+    """
+    stale_before = time.time() - TEXT_STORE_TTL
+    removed = 0
+    if not os.path.isdir(TEXT_STORE_DIR):
+        return 0
+    for shard in os.scandir(TEXT_STORE_DIR):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < stale_before:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+async def run_text_store_gc():
+    """Background loop started with the app."""
+    while True:
+        try:
+            removed = await run_in_threadpool(collect_stale_texts)
+            if removed:
+                logger.info(f"Removed {removed} unused document text(s)")
+        except Exception as e:
+            logger.error(f"Text store cleanup failed: {e}")
+        await asyncio.sleep(TEXT_STORE_GC_INTERVAL)
@@ -0,0 +1,58 @@
+"""
+Backfill the materialized risk metric columns on agent_analysis.
+Run once after applying migrations/005_add_risk_metric_columns.sql; new rows
+are populated automatically at write time.
+"""
+import sys
+import os
+# Add parent directory to path since we're in scripts/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db import SessionLocal
+from auth.models import User
+from documents.models import AgentAnalysis, populate_risk_metrics
+from analytics.rollup_service import rebuild_all_rollups
+
+BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", 500))
+
+def backfill_risk_metrics():
+    """Populate risk metric columns for risk analyses that predate them."""
+    db = SessionLocal()
+    try:
+        updated = 0
+        last_id = 0
+        while True:
+            # Keyset pagination keeps each batch a short transaction
+            batch = db.query(AgentAnalysis).filter(
+                AgentAnalysis.agent_type == "risk",
+                AgentAnalysis.risk_percentage.is_(None),
+                AgentAnalysis.id > last_id
+            ).order_by(AgentAnalysis.id).limit(BATCH_SIZE).all()
+
+            if not batch:
+                break
+
+            for analysis in batch:
+                populate_risk_metrics(analysis)
+            db.commit()
+
+            updated += len(batch)
+            last_id = batch[-1].id
+            print(f"   Backfilled {updated} analyses (last id {last_id})")
+
+        print("Rebuilding daily risk rollups...")
+        rebuild_all_rollups(db)
+        print(f"✅ Backfill complete: {updated} analyses updated")
+
+    except Exception as e:
+        print(f"❌ Error backfilling risk metrics: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    print("Backfilling risk metrics...")
+    print("-" * 50)
+    backfill_risk_metrics()
+    print("-" * 50)
@@ -0,0 +1,115 @@
+"""
+Startup time benchmark for the gateway and the agents.
+
+For each run, measures in a fresh interpreter:
+    - import: time to import the application module
+    - live: time from process start until GET /livez answers 200
+    - ready: time from process start until GET /readyz answers 200
+and prints the median and worst of each. It also fails (exit code 1) when a
+module that must be imported lazily (reportlab, pypdf, python-docx, the LLM
+provider SDKs) is loaded by the import:
+
+    python scripts/startup_benchmark.py --runs 5
+    python scripts/startup_benchmark.py --app-dir ../clause-agent --app app.main:app
+
+The gateway needs DATABASE_URL pointing at a migrated database to become ready.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ["reportlab", "pypdf", "docx", "google.generativeai", "groq"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure application import and probe-ready times")
+    parser.add_argument("--app-dir", default=GATEWAY_DIR, help="Service directory (default: backend-gateway)")
+    parser.add_argument("--app", default="main:app", help="ASGI application (default: main:app)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /readyz per run")
+    return parser.parse_args()
+
+IMPORT_PROBE = """
+import sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(elapsed)
+print(",".join(name for name in {lazy!r} if name in sys.modules))
+"""
+
+def measure_import(app_dir: str, module: str):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE.format(module=module, lazy=LAZY_MODULES)],
+        cwd=app_dir, capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    return float(output[-2]), [name for name in output[-1].split(",") if name]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for(client: httpx.Client, url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} not ready")
+
+def measure_probes(app_dir: str, app: str, timeout: float):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=1) as client:
+            deadline = started + timeout
+            live = _wait_for(client, f"{base}/livez", deadline) - started
+            ready = _wait_for(client, f"{base}/readyz", deadline) - started
+        return live, ready
+    finally:
+        process.terminate()
+        process.wait()
+
+def _summary(values) -> str:
+    return f"median {statistics.median(values) * 1000:>7.0f} ms   max {max(values) * 1000:>7.0f} ms"
+
+def main():
+    args = parse_args()
+    app_dir = os.path.abspath(args.app_dir)
+    module = args.app.split(":")[0]
+    os.makedirs(os.path.join(app_dir, "logs"), exist_ok=True)
+
+    imports, lives, readies = [], [], []
+    eager = set()
+    for _ in range(args.runs):
+        elapsed, loaded = measure_import(app_dir, module)
+        imports.append(elapsed)
+        eager.update(loaded)
+        live, ready = measure_probes(app_dir, args.app, args.timeout)
+        lives.append(live)
+        readies.append(ready)
+
+    print(f"Startup of {args.app} in {app_dir} ({args.runs} runs)")
+    print(f"   import  {_summary(imports)}")
+    print(f"   live    {_summary(lives)}")
+    print(f"   ready   {_summary(readies)}")
+    if eager:
+        print(f"❌ Imported at startup: {', '.join(sorted(eager))}")
+        sys.exit(1)
+    print("✅ No heavy modules imported at startup")
+
+if __name__ == "__main__":
+    main()
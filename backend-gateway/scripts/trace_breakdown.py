@@ -0,0 +1,136 @@
+"""
+Per-stage latency breakdown of one request trace.
+
+Reads spans written by the gateway and agents (logs/traces.jsonl with
+OTEL_TRACES_EXPORTER=file) or by the otel-collector file exporter
+(logs/collector-traces.jsonl), and prints the span tree of one trace with
+each stage's duration and share of the total:
+
+    python scripts/trace_breakdown.py logs/collector-traces.jsonl
+    python scripts/trace_breakdown.py logs/traces.jsonl --trace-id 4bf92f3577b34da6a3ce929d0e0e4736
+
+Without --trace-id the slowest trace whose root is an HTTP request is shown.
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Print the per-stage latency breakdown of a trace")
+    parser.add_argument("files", nargs="+", help="Span files (JSON lines)")
+    parser.add_argument("--trace-id", help="Trace to show (default: the slowest one)")
+    parser.add_argument("--list", type=int, metavar="N", help="List the N slowest traces instead")
+    return parser.parse_args()
+
+def _hex(value: str) -> str:
+    return (value or "").lower().removeprefix("0x")
+
+def _iso_seconds(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+def _sdk_span(record: dict) -> dict:
+    """Span as written by the SDK's ReadableSpan.to_json()."""
+    return {
+        "trace_id": _hex(record["context"]["trace_id"]),
+        "span_id": _hex(record["context"]["span_id"]),
+        "parent_id": _hex(record.get("parent_id")),
+        "name": record["name"],
+        "service": record.get("resource", {}).get("attributes", {}).get("service.name", "?"),
+        "start": _iso_seconds(record["start_time"]),
+        "end": _iso_seconds(record["end_time"]),
+        "error": record.get("status", {}).get("status_code") == "ERROR",
+    }
+
+def _otlp_spans(record: dict):
+    """Spans from one OTLP JSON export request (collector file exporter)."""
+    for resource_spans in record.get("resourceSpans", []):
+        service = "?"
+        for attribute in resource_spans.get("resource", {}).get("attributes", []):
+            if attribute["key"] == "service.name":
+                service = attribute["value"].get("stringValue", "?")
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                yield {
+                    "trace_id": _hex(span["traceId"]),
+                    "span_id": _hex(span["spanId"]),
+                    "parent_id": _hex(span.get("parentSpanId")),
+                    "name": span["name"],
+                    "service": service,
+                    "start": int(span["startTimeUnixNano"]) / 1e9,
+                    "end": int(span["endTimeUnixNano"]) / 1e9,
+                    "error": span.get("status", {}).get("code") in (2, "STATUS_CODE_ERROR"),
+                }
+
+def load_spans(paths):
+    traces = defaultdict(list)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                spans = _otlp_spans(record) if "resourceSpans" in record else [_sdk_span(record)]
+                for span in spans:
+                    traces[span["trace_id"]].append(span)
+    return traces
+
+def trace_duration(spans) -> float:
+    return max(s["end"] for s in spans) - min(s["start"] for s in spans)
+
+def root_name(spans) -> str:
+    ids = {s["span_id"] for s in spans}
+    roots = [s for s in spans if s["parent_id"] not in ids]
+    return min(roots, key=lambda s: s["start"])["name"] if roots else "?"
+
+def print_tree(spans):
+    children = defaultdict(list)
+    ids = {s["span_id"] for s in spans}
+    for span in spans:
+        children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+    trace_start = min(s["start"] for s in spans)
+    total = trace_duration(spans) or 1e-9
+
+    def walk(span, depth):
+        duration = span["end"] - span["start"]
+        offset = span["start"] - trace_start
+        marker = "❌" if span["error"] else "  "
+        label = f"{'  ' * depth}{span['name']} [{span['service']}]"
+        print(f"{marker} {label:<60} {duration * 1000:>10.1f} ms {duration / total:>6.1%}  +{offset * 1000:.1f} ms")
+        for child in sorted(children[span["span_id"]], key=lambda s: s["start"]):
+            walk(child, depth + 1)
+
+    for root in sorted(children[None], key=lambda s: s["start"]):
+        walk(root, 0)
+
+def main():
+    args = parse_args()
+    traces = load_spans(args.files)
+    if not traces:
+        print("❌ No spans found")
+        sys.exit(1)
+
+    if args.list:
+        ranked = sorted(traces.items(), key=lambda item: trace_duration(item[1]), reverse=True)
+        for trace_id, spans in ranked[:args.list]:
+            print(f"{trace_id}  {trace_duration(spans) * 1000:>10.1f} ms  {len(spans):>4} spans  {root_name(spans)}")
+        return
+
+    if args.trace_id:
+        trace_id = _hex(args.trace_id)
+        if trace_id not in traces:
+            print(f"❌ Trace {args.trace_id} not found")
+            sys.exit(1)
+    else:
+        http_traces = {tid: spans for tid, spans in traces.items() if " /" in root_name(spans)} or traces
+        trace_id = max(http_traces, key=lambda tid: trace_duration(http_traces[tid]))
+
+    spans = traces[trace_id]
+    services = sorted({s["service"] for s in spans})
+    print(f"✅ Trace {trace_id}: {trace_duration(spans) * 1000:.1f} ms, {len(spans)} spans across {', '.join(services)}\n")
+    print_tree(spans)
+
+if __name__ == "__main__":
+    main()
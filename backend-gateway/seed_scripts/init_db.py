@@ -9,7 +9,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database.db import engine, Base
 from auth.models import User
-from documents.models import Document, AgentAnalysis, Report
+from documents.models import Document, AgentAnalysis, Report, Blob, UploadSession, BulkBatch
+from analytics.models import DailyRiskRollup
 
 def init_database():
     """Create all database tables."""
@@ -0,0 +1,204 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from auth import auth_service
+from processing import admission
+from processing.admission import AgentQueue, FairShare, Job, INTERACTIVE_LANE, SHARED_LANE
+from processing.job_estimates import AGENT_MAX_TIMEOUT, AGENT_TIMEOUT_FACTOR, call_timeout
+
+TEXT = b"x" * 4000
+
+def _busy(queue: AgentQueue, expected: float = 30) -> Job:
+    """Occupy one of the queue's slots with a call that has just started."""
+    job = Job(None, SHARED_LANE, expected, -1)
+    job.started_at = job.enqueued_at
+    queue.running.add(job)
+    return job
+
+def test_queue_admits_in_order_and_rejects_when_full():
+    async def scenario():
+        queue = AgentQueue("summary", concurrency=1, depth=2)
+        order = []
+        running = await queue.acquire()
+
+        async def wait(name):
+            order.append((name, await queue.acquire()))
+
+        waiters = [asyncio.create_task(wait(name)) for name in ("first", "second")]
+        await asyncio.sleep(0)
+        assert queue.stats()["queue_depth"] == 2
+
+        with pytest.raises(HTTPException) as rejected:
+            await queue.acquire()
+        assert rejected.value.status_code == 429
+        assert int(rejected.value.headers["Retry-After"]) >= 1
+
+        queue.release(running)
+        await asyncio.sleep(0)
+        queue.release(order[0][1])
+        await asyncio.gather(*waiters)
+        queue.release(order[1][1])
+        return [name for name, _ in order], queue.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["first", "second"]
+    assert (stats["in_flight"], stats["queue_depth"], stats["admitted"], stats["rejected"]) == (0, 0, 3, 1)
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        queue = AgentQueue("summary", concurrency=1, depth=1)
+        running = await queue.acquire()
+        waiter = asyncio.create_task(queue.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        queue.release(running)
+        return queue.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["in_flight"], stats["queue_depth"]) == (0, 0)
+
+def test_waiter_cancelled_in_the_same_tick_as_a_release():
+    async def scenario():
+        queue = AgentQueue("summary", concurrency=1, depth=1)
+        running = await queue.acquire(user_id=1)
+        waiter = asyncio.create_task(queue.acquire(user_id=2))
+        await asyncio.sleep(0)
+        # The waiter's task has not resumed yet when the slot is released
+        waiter.cancel()
+        queue.release(running)
+        results = await asyncio.gather(waiter, return_exceptions=True)
+        return queue, results
+
+    queue, results = asyncio.run(scenario())
+    assert isinstance(results[0], asyncio.CancelledError)
+    stats = queue.stats()
+    assert (stats["in_flight"], stats["queue_depth"]) == (0, 0)
+    assert all(user["waiting"] == 0 for user in stats["users"].values())
+    assert queue.fair.start == {}
+
+def test_retry_after_follows_drain_rate():
+    queue = AgentQueue("summary", concurrency=1, depth=0)
+    _busy(queue)
+    for _ in range(30):
+        queue.completions.append(admission.time.monotonic())
+    # 30 completions a minute: the next opening is about 2s away
+    assert queue.retry_after() == 2
+
+def test_full_agent_rejects_before_reserving_tokens(client, auth_headers, monkeypatch):
+    upload = client.post("/documents/upload", headers=auth_headers, files={"file": ("nda.txt", TEXT, "text/plain")})
+    document_id = upload.json()["id"]
+    busy = AgentQueue("summary", concurrency=1, depth=0)
+    _busy(busy)
+    monkeypatch.setitem(admission._queues, "summary", busy)
+
+    response = client.post(f"/api/process-document/{document_id}", headers=auth_headers, json={"priority_agents": ["summary"]})
+    assert response.status_code == 429
+    assert response.json()["detail"]["agent"] == "summary"
+    assert int(response.headers["Retry-After"]) >= 1
+
+    usage = client.get("/analytics/usage", headers=auth_headers).json()["data"]
+    assert usage["budget"]["daily"]["used"] == 0
+
+def test_queue_stats_require_admin(client, user, auth_headers, monkeypatch):
+    assert client.get("/api/processing/queues", headers=auth_headers).status_code == 403
+    monkeypatch.setattr(auth_service, "ADMIN_USERNAMES", {user["user"]["username"]})
+    response = client.get("/api/processing/queues", headers=auth_headers)
+    assert response.status_code == 200
+    assert isinstance(response.json()["data"], dict)
+
+def _dispatch_order(queue: AgentQueue, calls) -> list:
+    """
+    Queue calls ((user_id, interactive) or (user_id, interactive, expected)
+    tuples) behind a busy slot and release them one at a time.
+    """
+    async def scenario():
+        running = await queue.acquire(user_id=0)
+        order = []
+
+        async def call(index, user_id, interactive, expected=None):
+            job = await queue.acquire(user_id, INTERACTIVE_LANE if interactive else SHARED_LANE, expected=expected)
+            order.append(index)
+            queue.release(job)
+
+        tasks = []
+        for index, args in enumerate(calls):
+            tasks.append(asyncio.create_task(call(index, *args)))
+            await asyncio.sleep(0)
+        queue.release(running)
+        await asyncio.gather(*tasks)
+        return order
+    return asyncio.run(scenario())
+
+def test_users_share_the_agent_fairly():
+    bulk = [(1, False)] * 6
+    order = _dispatch_order(AgentQueue("risk", concurrency=1, depth=10), bulk + [(2, False)])
+    # The single call from user 2 overtakes most of user 1's backlog
+    assert order.index(6) <= 1
+
+def test_weights_set_the_share(monkeypatch):
+    monkeypatch.setitem(admission.USER_WEIGHTS, 1, 2.0)
+    order = _dispatch_order(AgentQueue("risk", concurrency=1, depth=10), [(1, False)] * 4 + [(2, False)] * 4)
+    first_six = [1 if index < 4 else 2 for index in order[:6]]
+    assert first_six.count(1) == 4
+
+def test_interactive_lane_goes_first():
+    order = _dispatch_order(AgentQueue("risk", concurrency=1, depth=10), [(1, False)] * 3 + [(2, True)])
+    assert order[0] == 3
+
+def test_per_user_stats():
+    queue = AgentQueue("risk", concurrency=1, depth=10)
+    _dispatch_order(queue, [(1, False), (1, False), (2, True)])
+    users = queue.stats()["users"]
+    assert users["1"]["admitted"] == 2 and users["2"]["admitted"] == 1
+    assert all(user["waiting"] == 0 and user["in_flight"] == 0 for user in users.values())
+
+def test_shortest_expected_call_goes_first():
+    order = _dispatch_order(AgentQueue("risk", concurrency=1, depth=10), [(1, False, 300), (1, False, 10), (1, False, 60)])
+    assert order == [1, 2, 0]
+
+def test_waiting_ages_long_calls(monkeypatch):
+    long_call = Job(1, SHARED_LANE, 300, 0)
+    short_call = Job(1, SHARED_LANE, 10, 1)
+    fair = FairShare()
+    fair.backlogged(1)
+    now = admission.time.monotonic()
+    assert admission._next_job([long_call, short_call], fair, now) is short_call
+    # After waiting 295s the long call's remaining cost is below the new call's
+    long_call.enqueued_at -= 295
+    assert admission._next_job([long_call, short_call], fair, now) is long_call
+
+def test_estimate_simulates_dispatch():
+    queue = AgentQueue("risk", concurrency=1, depth=10)
+    _busy(queue, expected=30)
+
+    async def scenario():
+        waiters = [asyncio.create_task(queue.acquire(1, expected=expected)) for expected in (100, 20)]
+        await asyncio.sleep(0)
+        # Another user's 25s call goes after user 1's 20s call but before its 100s one
+        estimate = queue.estimate(25, user_id=2)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        return estimate
+
+    start, finish = asyncio.run(scenario())
+    assert 49 < start <= 50 and finish == pytest.approx(start + 25)
+
+def test_call_timeout_scales_with_expected_duration():
+    assert call_timeout(1, base=60) == 60
+    assert call_timeout(100, base=60) == 100 * AGENT_TIMEOUT_FACTOR
+    assert call_timeout(10 ** 6, base=60) == max(60, AGENT_MAX_TIMEOUT)
+
+def test_estimate_endpoint(client, auth_headers):
+    upload = client.post("/documents/upload", headers=auth_headers, files={"file": ("nda.txt", TEXT, "text/plain")})
+    document_id = upload.json()["id"]
+
+    response = client.get(f"/api/processing/estimate/{document_id}?agents=summary,risk", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    summary, risk = response.json()["data"]
+    assert (summary["agent"], risk["agent"]) == ("summary", "risk")
+    assert summary["estimated_start"] <= summary["estimated_finish"] <= risk["estimated_start"] <= risk["estimated_finish"]
+    assert summary["expected_seconds"] > 0
+
+    assert client.get(f"/api/processing/estimate/{document_id}?agents=nope", headers=auth_headers).status_code == 400
@@ -0,0 +1,44 @@
+import httpx
+from sqlalchemy import text
+from documents import router as documents_router
+
+TEXT = b"Section 1. Term of the lease.\n" * 20
+
+def _upload(client, headers) -> int:
+    response = client.post("/documents/upload", headers=headers, files={"file": ("lease.txt", TEXT, "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def _fake_post_analyze(monkeypatch, response: httpx.Response):
+    async def post_analyze(url, text, timeout=None, extra=None, headers=None):
+        return response
+    monkeypatch.setattr(documents_router, "post_analyze", post_analyze)
+
+def _report_states(document_id: int) -> dict:
+    from database.db import engine
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT agent_type, render_state FROM reports WHERE document_id = :id"), {"id": document_id})
+        return dict(rows.all())
+
+def test_agent_result_marks_reports_pending(client, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+    _fake_post_analyze(monkeypatch, httpx.Response(200, json={"summary": "ok"}))
+
+    response = client.post(f"/documents/{document_id}/process/summary", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert _report_states(document_id) == {"summary": "pending", "combined": "pending"}
+
+def test_failure_before_the_call_is_recorded(client, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+
+    def broken_estimate(agent, tokens):
+        raise ValueError("no estimate")
+    monkeypatch.setattr(documents_router, "expected_seconds", broken_estimate)
+
+    response = client.post(f"/documents/{document_id}/process/summary", headers=auth_headers)
+    assert response.status_code == 500
+    assert response.json()["detail"] == "no estimate"
+    analysis = client.get(f"/documents/{document_id}/analysis/summary", headers=auth_headers)
+    assert analysis.status_code == 200, analysis.text
+    assert analysis.json()["error"] == "no estimate"
+    assert client.get("/analytics/usage", headers=auth_headers).json()["data"]["budget"]["daily"]["used"] == 0
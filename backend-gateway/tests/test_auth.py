@@ -0,0 +1,84 @@
+import time
+from auth.auth_service import create_access_token
+from auth.principal_cache import Principal, PrincipalCache
+from conftest import bearer, update_user
+
+def _principal(user_id: int = 1, version: int = 0) -> Principal:
+    return Principal(id=user_id, username="u", email=None, full_name=None, is_active=True, token_version=version)
+
+def test_cache_entries_expire_after_ttl():
+    cache = PrincipalCache(ttl=0.05, max_size=10)
+    cache.put(_principal())
+    assert cache.get(1) is not None
+    time.sleep(0.06)
+    assert cache.get(1) is None
+
+def test_cache_skips_principal_loaded_before_invalidation():
+    cache = PrincipalCache(ttl=60, max_size=10)
+    generation = cache.generation
+    cache.invalidate(1)
+    cache.put(_principal(), generation)
+    assert cache.get(1) is None
+
+def test_cache_evicts_least_recently_used():
+    cache = PrincipalCache(ttl=60, max_size=2)
+    cache.put(_principal(1))
+    cache.put(_principal(2))
+    cache.get(1)
+    cache.put(_principal(3))
+    assert cache.get(2) is None and cache.get(1) is not None
+
+def _wait_for_status(client, headers: dict, expected: int, timeout: float = 3) -> int:
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get("/auth/me", headers=headers).status_code
+        if status == expected or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+def test_deactivation_reaches_cached_principal(client, user):
+    headers = bearer(user["token"])
+    # Cache the principal
+    assert client.get("/auth/me", headers=headers).status_code == 200
+
+    update_user(user["user"]["id"], "is_active = FALSE")
+
+    # Dropped through the NOTIFY listener, well before AUTH_CACHE_TTL
+    assert _wait_for_status(client, headers, 401) == 401
+    assert client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]}).status_code == 401
+
+def test_profile_change_reaches_cached_principal(client, user):
+    headers = bearer(user["token"])
+    assert client.get("/auth/me", headers=headers).json()["data"]["full_name"] == "Test User"
+
+    update_user(user["user"]["id"], "full_name = 'Renamed'")
+
+    deadline = time.monotonic() + 3
+    while client.get("/auth/me", headers=headers).json()["data"]["full_name"] != "Renamed":
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+def test_legacy_token_is_version_checked(client, user):
+    legacy = bearer(create_access_token(data={"sub": user["user"]["username"]}))
+    assert client.get("/auth/me", headers=legacy).status_code == 200
+
+    update_user(user["user"]["id"], "token_version = token_version + 1")
+
+    assert client.get("/auth/me", headers=legacy).status_code == 401
+
+def test_change_password_revokes_earlier_tokens(client, user):
+    headers = bearer(user["token"])
+    response = client.post("/auth/change-password", headers=headers, json={
+        "old_password": user["password"],
+        "new_password": "another-password"
+    })
+    assert response.status_code == 200
+    tokens = response.json()["data"]
+    assert client.get("/auth/me", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": user["refresh_token"]}).status_code == 401
+    # The caller stays signed in with the tokens it got back
+    assert client.get("/auth/me", headers=bearer(tokens["token"])).status_code == 200
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+
+    login = client.post("/auth/login", json={"username": user["user"]["username"], "password": "another-password"})
+    assert login.status_code == 200
@@ -0,0 +1,61 @@
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from fastapi import HTTPException
+from documents import blob_store, bulk_upload
+
+def _archive(tmp_path, data: bytes) -> str:
+    path = tmp_path / "archive"
+    path.write_bytes(data)
+    return str(path)
+
+def _zip(count: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(count):
+            zf.writestr(f"contract{i}.txt", f"Contract {i}. " * 1000)
+    return buffer.getvalue()
+
+def _tar_gz(count: int) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for i in range(count):
+            data = os.urandom(64 * 1024)
+            info = tarfile.TarInfo(f"contract{i}.txt")
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "blobs-tmp"
+    directory.mkdir()
+    monkeypatch.setattr(blob_store, "BLOB_TMP_DIR", str(directory))
+    return directory
+
+def test_too_many_files_leaves_no_temp_files(tmp_path, temp_dir, monkeypatch):
+    monkeypatch.setattr(bulk_upload, "MAX_BULK_FILES", 2)
+    with pytest.raises(HTTPException) as rejected:
+        bulk_upload.unpack_archive(_archive(tmp_path, _zip(3)))
+    assert rejected.value.status_code == 413
+    assert os.listdir(temp_dir) == []
+
+def test_truncated_archive_is_a_client_error(tmp_path, temp_dir):
+    data = _tar_gz(3)
+    with pytest.raises(HTTPException) as rejected:
+        bulk_upload.unpack_archive(_archive(tmp_path, data[:len(data) // 2]))
+    assert rejected.value.status_code == 400
+    assert os.listdir(temp_dir) == []
+
+def test_corrupt_zip_member_is_a_client_error(tmp_path, temp_dir):
+    data = bytearray(_zip(2))
+    info = zipfile.ZipFile(io.BytesIO(bytes(data))).infolist()[1]
+    # Damage the compressed data of the second member, past its local header
+    offset = info.header_offset + 30 + len(info.filename) + 8
+    data[offset:offset + 16] = b"\xff" * 16
+    with pytest.raises(HTTPException) as rejected:
+        bulk_upload.unpack_archive(_archive(tmp_path, bytes(data)))
+    assert rejected.value.status_code == 400
+    assert os.listdir(temp_dir) == []
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from urllib.parse import unquote
+import pytest
+from documents.file_serving import _not_modified_since, content_disposition, parse_range
+
+@pytest.mark.parametrize("filename", ["contrato_año.pdf", "x;y.pdf", 'say "hi".txt', "back\\slash.txt", "契約書.docx"])
+def test_content_disposition_round_trips_filename(filename):
+    value = content_disposition("attachment", filename)
+    # Headers must be latin-1 encodable; filename* carries the exact name
+    value.encode("latin-1")
+    extended = value.rsplit("; ", 1)[1]
+    assert value.startswith("attachment; filename=\"")
+    assert extended.startswith("filename*=utf-8''")
+    assert unquote(extended.removeprefix("filename*=utf-8''")) == filename
+    assert ";" not in extended
+
+def test_content_disposition_escapes_fallback():
+    assert content_disposition("inline", 'a"b.pdf').startswith('inline; filename="a\\"b.pdf"')
+    assert content_disposition("attachment", "año.pdf").startswith('attachment; filename="a_o.pdf"')
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=0-1,5-6", 1000) is None
+
+def test_if_modified_since_tolerates_any_date():
+    modified = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+    assert _not_modified_since("Mon, 19 Oct 2026 12:00:00 GMT", modified)
+    # Parses to a naive datetime
+    assert _not_modified_since("Mon, 19 Oct 2026 12:00:00 -0000", modified)
+    assert not _not_modified_since("Mon, 19 Oct 2026 11:00:00 -0000", modified)
+    assert not _not_modified_since("yesterday", modified)
+
+@pytest.mark.parametrize("filename", ["contrato_año.txt", "x;y.txt"])
+def test_download_with_special_filename(client, auth_headers, filename):
+    upload = client.post("/documents/upload", headers=auth_headers, files={"file": (filename, b"contract text", "text/plain")})
+    assert upload.status_code == 200, upload.text
+
+    response = client.get(f"/documents/{upload.json()['id']}/download", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.content == b"contract text"
+    extended = response.headers["content-disposition"].rsplit("; ", 1)[1]
+    assert unquote(extended.removeprefix("filename*=utf-8''")) == filename
+
+    ranged = client.get(f"/documents/{upload.json()['id']}/download", headers={**auth_headers, "Range": "bytes=0-7"})
+    assert ranged.status_code == 206
+    assert ranged.content == b"contract"
+
+def test_download_with_naive_if_modified_since(client, auth_headers):
+    upload = client.post("/documents/upload", headers=auth_headers, files={"file": ("lease.txt", b"contract text", "text/plain")})
+    response = client.get(
+        f"/documents/{upload.json()['id']}/download",
+        headers={**auth_headers, "If-Modified-Since": "Sun, 01 Jan 2006 00:00:00 -0000"}
+    )
+    assert response.status_code == 200
+
+def test_signed_urls_require_a_secret():
+    import os
+    import subprocess
+    import sys
+    env = {**os.environ, "FILE_OFFLOAD_MODE": "signed-url"}
+    env.pop("FILE_URL_SECRET", None)
+    result = subprocess.run([sys.executable, "-c", "import documents.file_serving"], env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "FILE_URL_SECRET" in result.stderr
+
+    env["FILE_URL_SECRET"] = "s3cret"
+    assert subprocess.run([sys.executable, "-c", "import documents.file_serving"], env=env).returncode == 0
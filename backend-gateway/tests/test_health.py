@@ -0,0 +1,28 @@
+from auth import auth_service
+
+def test_db_pool_status_requires_admin(client, user, auth_headers, monkeypatch):
+    assert client.get("/health/db-pool").status_code in (401, 403)
+    assert client.get("/health/db-pool", headers=auth_headers).status_code == 403
+
+    monkeypatch.setattr(auth_service, "ADMIN_USERNAMES", {user["user"]["username"]})
+    response = client.get("/health/db-pool", headers=auth_headers)
+    assert response.status_code == 200
+    assert "checkouts" in response.json()
+
+def test_connect_time_is_not_counted_as_wait(client):
+    from sqlalchemy import text
+    from database.db import async_engine
+    from database.pool import pool_stats
+
+    async def checkout_fresh_connection():
+        # Disposing the pool makes the next checkout open a new connection
+        await async_engine.dispose()
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    before = pool_stats.snapshot()
+    client.portal.call(checkout_fresh_connection)
+    after = pool_stats.snapshot()
+    assert after["connects"] == before["connects"] + 1
+    assert after["checkouts"] == before["checkouts"] + 1
+    assert after["max_connect_ms"] > 0
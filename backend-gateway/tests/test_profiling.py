@@ -0,0 +1,27 @@
+import os
+from auth import auth_service
+from auth.principal_cache import principal_cache
+from monitoring import profiling
+from conftest import bearer, update_user
+
+def test_profiles_only_active_admin_tokens(client, user, monkeypatch, tmp_path):
+    monkeypatch.setattr(auth_service, "ADMIN_USERNAMES", {user["user"]["username"]})
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    headers = {**bearer(user["token"]), "X-Profile": "1"}
+
+    response = client.get("/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert os.path.exists(response.headers["x-profile-path"])
+
+    # A token revoked by deactivation no longer enables profiling
+    update_user(user["user"]["id"], "is_active = FALSE")
+    # Don't depend on the NOTIFY listener's timing here
+    principal_cache.invalidate(user["user"]["id"])
+    assert "x-profile-path" not in client.get("/auth/me", headers=headers).headers
+
+def test_ignores_flag_from_other_users(client, user, monkeypatch, tmp_path):
+    monkeypatch.setattr(auth_service, "ADMIN_USERNAMES", {"someone-else"})
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    response = client.get("/auth/me", headers={**bearer(user["token"]), "X-Profile": "1"})
+    assert response.status_code == 200
+    assert "x-profile-path" not in response.headers
@@ -0,0 +1,39 @@
+import uuid
+from processing import router as processing_router
+
+def _upload(client, headers, content: bytes) -> int:
+    response = client.post("/documents/upload", headers=headers, files={"file": ("notes.txt", content, "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def _process(client, headers, document_id: int):
+    response = client.post(f"/api/process-document/{document_id}", headers=headers, json={"priority_agents": ["summary"]})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_reused_result_keeps_provider_and_model(client, auth_headers, monkeypatch):
+    content = f"identical content {uuid.uuid4().hex}".encode()
+    calls = []
+
+    async def summary_agent(url, text, timeout=None):
+        calls.append(url)
+        return {
+            "summary": "ok",
+            "telemetry": {"provider": "groq", "model": "fallback-model", "prompt_tokens": 40, "completion_tokens": 10, "processing_ms": 5}
+        }
+    monkeypatch.setattr(processing_router, "call_agent", summary_agent)
+
+    first = _upload(client, auth_headers, content)
+    _process(client, auth_headers, first)
+    second = _upload(client, auth_headers, content)
+    assert second != first
+    result = _process(client, auth_headers, second)
+
+    assert len(calls) == 1
+    assert "telemetry" not in result["results"]["summary"]
+    analysis = client.get(f"/documents/{second}/analysis/summary", headers=auth_headers).json()
+    assert (analysis["ai_provider"], analysis["model_used"]) == ("groq", "fallback-model")
+
+    # The reuse spent no tokens
+    usage = client.get("/analytics/usage", headers=auth_headers).json()["data"]
+    assert usage["totals"]["total_tokens"] == 50
@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import os
+import httpx
+from documents.blob_store import BLOB_TMP_DIR
+
+CONTENT = b"resumable upload test content\n" * 100
+
+def _create(client, headers, sha256: str) -> str:
+    response = client.post("/documents/uploads", headers=headers, json={
+        "filename": "contract.txt",
+        "size": len(CONTENT),
+        "sha256": sha256
+    })
+    assert response.status_code == 200, response.text
+    return response.json()["upload_id"]
+
+def test_complete_creates_document(client, auth_headers):
+    upload_id = _create(client, auth_headers, hashlib.sha256(CONTENT).hexdigest())
+    half = len(CONTENT) // 2
+    assert client.put(f"/documents/uploads/{upload_id}?offset=0", headers=auth_headers, content=CONTENT[:half]).status_code == 200
+    assert client.put(f"/documents/uploads/{upload_id}?offset={half}", headers=auth_headers, content=CONTENT[half:]).status_code == 200
+
+    response = client.post(f"/documents/uploads/{upload_id}/complete", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert client.get(f"/documents/uploads/{upload_id}", headers=auth_headers).status_code == 404
+
+def test_hash_mismatch_keeps_session(client, auth_headers):
+    upload_id = _create(client, auth_headers, hashlib.sha256(b"something else").hexdigest())
+    assert client.put(f"/documents/uploads/{upload_id}?offset=0", headers=auth_headers, content=CONTENT).status_code == 200
+
+    response = client.post(f"/documents/uploads/{upload_id}/complete", headers=auth_headers)
+    assert response.status_code == 422
+
+    status = client.get(f"/documents/uploads/{upload_id}", headers=auth_headers)
+    assert status.status_code == 200
+    assert status.json()["received_bytes"] == len(CONTENT)
+    assert client.delete(f"/documents/uploads/{upload_id}", headers=auth_headers).status_code == 200
+
+def test_concurrent_chunks_at_same_offset(client, auth_headers):
+    upload_id = _create(client, auth_headers, None)
+    half = len(CONTENT) // 2
+    payloads = [CONTENT[:half], b"x" * half]
+
+    async def put_both():
+        import main
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(
+                async_client.put(f"/documents/uploads/{upload_id}?offset=0", headers=auth_headers, content=payload)
+                for payload in payloads
+            ))
+
+    responses = client.portal.call(put_both)
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    winner = payloads[[response.status_code for response in responses].index(200)]
+
+    # Only the accepted chunk reached the session file
+    with open(os.path.join(BLOB_TMP_DIR, f"upload-{upload_id}"), "rb") as f:
+        assert f.read(half) == winner
@@ -0,0 +1,62 @@
+import os
+from datetime import date
+from processing import router as processing_router
+from documents.models import AgentAnalysis, populate_risk_metrics
+
+MIGRATION = os.path.join("migrations", "017_rebuild_risk_rollup_from_risk_percentage.sql")
+
+def _risk_response(**scores) -> dict:
+    return {
+        **scores,
+        "confidence_percentage": 90,
+        "detailed_analysis": {"identified_risks": [{"severity": "high"}, {"severity": "low"}]},
+        "telemetry": {"provider": "gemini", "model": "test", "prompt_tokens": 10, "completion_tokens": 10, "processing_ms": 5}
+    }
+
+def test_risk_metrics_come_from_risk_percentage():
+    analysis = AgentAnalysis(agent_type="risk", success=True, response=_risk_response(risk_percentage=70, risk_score=10))
+    populate_risk_metrics(analysis)
+    assert analysis.risk_percentage == 70
+    assert (analysis.total_risks, analysis.high_count, analysis.low_count) == (2, 1, 1)
+
+def _today_trend(client, headers) -> dict:
+    trends = client.get("/analytics/trends", headers=headers).json()["data"]
+    return next(day for day in trends["daily_trend"] if day["date"] == date.today().isoformat())
+
+def test_rollup_uses_risk_percentage(client, auth_headers, monkeypatch):
+    async def risk_agent(url, text, timeout=None):
+        return _risk_response(risk_percentage=70, risk_score=10)
+    monkeypatch.setattr(processing_router, "call_agent", risk_agent)
+
+    upload = client.post("/documents/upload", headers=auth_headers, files={"file": ("lease.txt", b"lease terms", "text/plain")})
+    document_id = upload.json()["id"]
+    response = client.post(f"/api/process-document/{document_id}", headers=auth_headers, json={"priority_agents": ["risk"]})
+    assert response.status_code == 200, response.text
+    assert _today_trend(client, auth_headers)["average_risk"] == 70
+
+    # The corrective migration rebuilds the same figures
+    from database.db import engine
+    from database.migrate import _execute_script
+    with open(MIGRATION) as f, engine.begin() as conn:
+        _execute_script(conn, f.read())
+    assert _today_trend(client, auth_headers)["average_risk"] == 70
+
+def test_concurrent_saves_leave_a_complete_rollup(client, user, auth_headers):
+    document_ids = [
+        client.post("/documents/upload", headers=auth_headers, files={"file": (f"lease{i}.txt", b"lease terms", "text/plain")}).json()["id"]
+        for i in range(4)
+    ]
+
+    async def save(document_id):
+        from database.db import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            await processing_router.save_agent_result(
+                db, "risk", _risk_response(risk_percentage=50), document_id, user["user"]["id"], "lease terms"
+            )
+
+    async def save_concurrently():
+        import asyncio
+        await asyncio.gather(*(save(document_id) for document_id in document_ids))
+
+    client.portal.call(save_concurrently)
+    assert _today_trend(client, auth_headers)["analyses_count"] == len(document_ids)
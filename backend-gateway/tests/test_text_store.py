@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+import httpx
+from processing import agent_client, text_store
+
+TEXT = "Section 1. Term of the lease. " * 1000
+
+def _fake_agents(monkeypatch, tmp_path, handler) -> list:
+    monkeypatch.setattr(text_store, "TEXT_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(text_store, "TEXT_REF_MIN_CHARS", 1024)
+    requests = []
+
+    def record(request: httpx.Request):
+        payload = json.loads(request.content)
+        requests.append(payload)
+        return handler(payload)
+    monkeypatch.setattr(agent_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(record)))
+    return requests
+
+def test_text_is_stored_once_by_content(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_store, "TEXT_STORE_DIR", str(tmp_path))
+    ref, sha256 = text_store.store_text(TEXT)
+    assert text_store.store_text(TEXT) == (ref, sha256)
+    with open(os.path.join(tmp_path, ref), encoding="utf-8") as f:
+        assert f.read() == TEXT
+    assert os.listdir(os.path.join(tmp_path, sha256[:2])) == [f"{sha256}.txt"]
+
+def test_agents_receive_a_reference(monkeypatch, tmp_path):
+    requests = _fake_agents(monkeypatch, tmp_path, lambda payload: httpx.Response(200, json={"summary": "ok"}))
+
+    async def call_twice():
+        return [await agent_client.call_agent("http://summary-agent:8004", TEXT) for _ in range(2)]
+    results = asyncio.run(call_twice())
+
+    assert all(result["summary"] == "ok" for result in results)
+    assert [set(payload) for payload in requests] == [{"text_ref", "sha256"}] * 2
+    assert requests[0] == requests[1]
+
+def test_short_text_is_sent_inline(monkeypatch, tmp_path):
+    requests = _fake_agents(monkeypatch, tmp_path, lambda payload: httpx.Response(200, json={"summary": "ok"}))
+    asyncio.run(agent_client.call_agent("http://summary-agent:8004", "short"))
+    assert requests == [{"text": "short"}]
+
+def test_unreadable_reference_falls_back_to_inline(monkeypatch, tmp_path):
+    def agent_without_shared_volume(payload):
+        if "text" not in payload:
+            return httpx.Response(422, json={"detail": {"error": "missing", "code": "text_ref_unavailable"}})
+        return httpx.Response(200, json={"summary": "ok"})
+    requests = _fake_agents(monkeypatch, tmp_path, agent_without_shared_volume)
+
+    result = asyncio.run(agent_client.call_agent("http://summary-agent:8004", TEXT))
+    assert result["summary"] == "ok"
+    assert "text_ref" in requests[0] and requests[1] == {"text": TEXT}
+
+def test_stale_texts_are_collected(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_store, "TEXT_STORE_DIR", str(tmp_path))
+    ref, _ = text_store.store_text(TEXT)
+    os.utime(os.path.join(tmp_path, ref), (0, 0))
+    fresh, _ = text_store.store_text("another document")
+
+    assert text_store.collect_stale_texts() == 1
+    assert not os.path.exists(os.path.join(tmp_path, ref))
+    assert os.path.exists(os.path.join(tmp_path, fresh))
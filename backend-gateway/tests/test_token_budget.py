@@ -0,0 +1,121 @@
+import asyncio
+from datetime import timedelta
+import pytest
+from sqlalchemy import select, update
+from processing import router as processing_router
+from analytics.models import TokenBudgetCounter
+from analytics.usage_service import budget_exceeded_error, estimate_tokens, record_token_usage, reserve_tokens, token_budget_status
+from database.db import AsyncSessionLocal
+from documents.models import AgentAnalysis
+from conftest import update_user
+
+TEXT = "x" * 4000
+
+def _upload(client, headers) -> int:
+    response = client.post("/documents/upload", headers=headers, files={"file": ("budget.txt", TEXT.encode(), "text/plain")})
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def _process(client, headers, document_id: int):
+    return client.post(f"/api/process-document/{document_id}", headers=headers, json={"priority_agents": ["summary"]})
+
+def _fake_agent(total_tokens: int):
+    async def call_agent(url, text, timeout=None):
+        return {
+            "summary": "ok",
+            "telemetry": {"provider": "gemini", "model": "test", "prompt_tokens": total_tokens - 10, "completion_tokens": 10, "processing_ms": 5}
+        }
+    return call_agent
+
+def test_concurrent_reservations_do_not_overshoot(client, user):
+    per_call = 1000
+    update_user(user["user"]["id"], f"daily_token_budget = {per_call * 3}")
+
+    async def reserve_once():
+        async with AsyncSessionLocal() as db:
+            return await reserve_tokens(db, user["user"]["id"], per_call)
+
+    async def reserve_concurrently():
+        return await asyncio.gather(*(reserve_once() for _ in range(10)))
+
+    results = client.portal.call(reserve_concurrently)
+    assert sum(reservation is not None for reservation in results) == 3
+
+    async def rejection():
+        async with AsyncSessionLocal() as db:
+            return await budget_exceeded_error(db, user["user"]["id"], per_call)
+    rejected = client.portal.call(rejection)
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) > 0
+
+    async def status():
+        async with AsyncSessionLocal() as db:
+            return await token_budget_status(db, user["user"]["id"])
+    assert client.portal.call(status)["daily"]["used"] == per_call * 3
+
+def test_reservation_is_reconciled_to_actual_usage(client, user, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+    monkeypatch.setattr(processing_router, "call_agent", _fake_agent(500))
+
+    response = _process(client, auth_headers, document_id)
+    assert response.status_code == 200, response.text
+
+    usage = client.get("/analytics/usage", headers=auth_headers).json()["data"]
+    assert usage["totals"]["total_tokens"] == 500
+    # The estimate reserved before the call was replaced by the actual usage
+    assert usage["budget"]["daily"]["used"] == 500
+
+def test_over_budget_request_gets_429(client, user, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+    monkeypatch.setattr(processing_router, "call_agent", _fake_agent(500))
+    update_user(user["user"]["id"], f"daily_token_budget = {estimate_tokens(TEXT) + 100}")
+
+    assert _process(client, auth_headers, document_id).status_code == 200
+    # 500 used; another estimate no longer fits
+    response = _process(client, auth_headers, document_id)
+    assert response.status_code == 429
+    assert response.json()["detail"]["message"] == "Daily token budget exceeded"
+    assert int(response.headers["Retry-After"]) > 0
+
+def test_failed_call_releases_reservation(client, user, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+
+    async def failing_agent(url, text, timeout=None):
+        return {"error": "agent unavailable", "telemetry": {"processing_ms": 5}}
+    monkeypatch.setattr(processing_router, "call_agent", failing_agent)
+
+    _process(client, auth_headers, document_id)
+    usage = client.get("/analytics/usage", headers=auth_headers).json()["data"]
+    assert usage["budget"]["daily"]["used"] == 0
+
+def test_reservation_is_released_when_saving_fails(client, user, auth_headers, monkeypatch):
+    document_id = _upload(client, auth_headers)
+    monkeypatch.setattr(processing_router, "call_agent", _fake_agent(500))
+
+    async def broken_save(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+    monkeypatch.setattr(processing_router, "save_agent_result", broken_save)
+
+    with pytest.raises(RuntimeError):
+        _process(client, auth_headers, document_id)
+    usage = client.get("/analytics/usage", headers=auth_headers).json()["data"]
+    assert usage["budget"]["daily"]["used"] == 0
+
+def test_overrun_is_charged_to_the_reservation_day(client, user):
+    user_id = user["user"]["id"]
+
+    async def reserve_then_reconcile_after_midnight():
+        async with AsyncSessionLocal() as db:
+            reservation = await reserve_tokens(db, user_id, 100)
+            # Reserved yesterday, completed today
+            await db.execute(update(TokenBudgetCounter).where(TokenBudgetCounter.user_id == user_id).values(
+                day=TokenBudgetCounter.day - 1
+            ))
+            reservation.day -= timedelta(days=1)
+            analysis = AgentAnalysis(user_id=user_id, agent_type="summary")
+            await record_token_usage(db, analysis, {"prompt_tokens": 900, "completion_tokens": 100}, reservation)
+            await db.commit()
+            result = await db.execute(select(TokenBudgetCounter.day_used).where(TokenBudgetCounter.user_id == user_id))
+            return result.scalar()
+
+    assert client.portal.call(reserve_then_reconcile_after_midnight) == 1000
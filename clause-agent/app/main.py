@@ -1,6 +1,12 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+import asyncio
 import logging
 from app.routes import router
+from app.utils.metrics import MetricsMiddleware, metrics_response
+from app.utils.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.gemini_client import preload_sdks
 
 # Configure logging
 logging.basicConfig(
@@ -10,10 +16,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+setup_tracing()
+
 app = FastAPI(title="Clause Agent")
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(router.router)
 
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
+
+_ready = False
+
+@app.get("/livez", include_in_schema=False)
+async def livez():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: startup has completed (provider SDKs may still be loading)."""
+    if not _ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+async def _preload_sdks():
+    try:
+        await asyncio.to_thread(preload_sdks)
+    except Exception as e:
+        # The import error surfaces again on the first request
+        logger.error(f"Failed to preload provider SDKs: {e}")
+
+@app.on_event("startup")
+async def startup():
+    global _ready
+    app.state.preload = asyncio.create_task(_preload_sdks())
+    _ready = True
+
+@app.on_event("shutdown")
+async def shutdown():
+    global _ready
+    _ready = False
+    shutdown_tracing()
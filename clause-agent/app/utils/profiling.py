@@ -0,0 +1,151 @@
+"""
+On-demand sampling profiler for single requests.
+
+A request sent with the header "X-Profile: 1" (or the query parameter
+profile=1) and "X-Profile-Token: <PROFILING_TOKEN>" is profiled while it
+runs. The agent has no users of its own, so the shared token is the only
+authorization; the flag is ignored without it, and profiling is off while
+PROFILING_TOKEN is unset.
+
+A sampler thread records the request task's stack every
+PROFILE_INTERVAL seconds. While the task runs, the event loop thread's
+stack is used. While it is suspended, the task's chain of awaiting
+coroutines is used, with a "[waiting]" leaf. The samples are written in
+folded-stack format (one "frame;frame;frame count" line per stack), which
+flamegraph.pl, speedscope and inferno read directly. The file goes under
+PROFILE_DIR, and its path is returned in the X-Profile-Path header.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+def _coroutine_frames(coro):
+    """Frames of a suspended coroutine chain, outermost first."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+class RequestSampler:
+    """Samples one asyncio task's stack from a background thread."""
+
+    def __init__(self, task: asyncio.Task, interval: float = PROFILE_INTERVAL):
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread_id = threading.get_ident()  # Created on the loop thread
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception:
+                # The task changes state under us; skip the sample
+                continue
+
+    def _sample(self):
+        root = self.task.get_coro()
+        root_frame = getattr(root, "cr_frame", None)
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(frame)
+                if frame is root_frame:
+                    break
+                frame = frame.f_back
+            stack = [_frame_label(f) for f in reversed(frames)]
+        else:
+            stack = [_frame_label(f) for f in _coroutine_frames(root)] + ["[waiting]"]
+        if stack:
+            self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def write_folded(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def _wants_profile(scope, headers: dict) -> bool:
+    if headers.get("x-profile", "").lower() in ("1", "true"):
+        return True
+    query = scope.get("query_string", b"").decode("latin-1")
+    return any(part in ("profile=1", "profile=true") for part in query.split("&"))
+
+def _authorized(headers: dict) -> bool:
+    return bool(PROFILING_TOKEN) and headers.get("x-profile-token") == PROFILING_TOKEN
+
+def profile_path(method: str, path: str) -> str:
+    slug = "".join(c if c.isalnum() else "_" for c in path.strip("/"))[:60] or "root"
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug}-{uuid.uuid4().hex[:8]}.folded")
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests flagged with the profiling token."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        if not _wants_profile(scope, headers) or not _authorized(headers):
+            await self.app(scope, receive, send)
+            return
+
+        path = profile_path(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # The file is complete once the response body has been sent
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-path", path.encode("latin-1"))]
+            await send(message)
+
+        sampler = RequestSampler(asyncio.current_task())
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            try:
+                sampler.write_folded(path)
+                logger.info(f"Profiled {scope['method']} {scope['path']}: {sampler.samples} samples over {sampler.duration:.3f}s -> {path}")
+            except OSError as e:
+                logger.error(f"Failed to write profile {path}: {e}")
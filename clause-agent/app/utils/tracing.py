@@ -0,0 +1,106 @@
+"""
+OpenTelemetry tracing for the agent.
+
+Every HTTP request gets a server span that continues the gateway's trace
+(traceparent header set by the gateway's call_agent). Gemini attempts, JSON
+validation and the Groq fallback get their own spans (see gemini_client).
+
+OTEL_TRACES_EXPORTER selects where spans go:
+    file  one JSON span per line in TRACE_FILE (default, local stand-in)
+    otlp  OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (the otel-collector service)
+    none  tracing disabled
+"""
+import json
+import logging
+import os
+import threading
+from typing import Sequence
+from opentelemetry import trace, propagate
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, ReadableSpan
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "clause-agent")
+OTEL_TRACES_EXPORTER = os.getenv("OTEL_TRACES_EXPORTER", "file").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+
+tracer = trace.get_tracer("clause-agent")
+
+class JsonLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(json.loads(span.to_json())) + "\n" for span in spans]
+        try:
+            with self._lock, open(self.path, "a") as f:
+                f.writelines(lines)
+        except OSError as e:
+            logger.error(f"Failed to write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+def setup_tracing():
+    """Install the tracer provider. Call once at import of the app."""
+    if OTEL_TRACES_EXPORTER == "none":
+        return
+    if OTEL_TRACES_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    else:
+        exporter = JsonLinesSpanExporter(TRACE_FILE)
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+def shutdown_tracing():
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+class TracingMiddleware:
+    """ASGI middleware opening a server span per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}",
+            # Without a traceparent, stay under any span an outer layer opened
+            context=propagate.extract(carrier) if "traceparent" in carrier else None,
+            kind=SpanKind.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]}
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route.path}")
+                    span.set_attribute("http.route", route.path)
+                span.set_attribute("http.response.status_code", status["code"])
+                if status["code"] >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
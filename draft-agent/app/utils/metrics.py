@@ -0,0 +1,88 @@
+"""
+Prometheus metrics for the agent, exposed at GET /metrics.
+
+Covers request latency per route, requests in flight, LLM call latency per
+provider, Gemini attempts, JSON failures, Groq fallbacks and token usage.
+"""
+import time
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "agent_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "agent_http_requests_in_flight",
+    "HTTP requests currently being handled"
+)
+LLM_CALL_DURATION = Histogram(
+    "agent_llm_call_duration_seconds",
+    "Latency of a single LLM provider call",
+    ["provider", "model", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+GEMINI_ATTEMPTS = Counter(
+    "agent_gemini_attempts_total",
+    "Gemini call attempts by outcome (success, json_error, timeout, error)",
+    ["outcome"]
+)
+JSON_FAILURES = Counter(
+    "agent_llm_json_failures_total",
+    "LLM responses that were not valid JSON",
+    ["provider"]
+)
+GROQ_FALLBACKS = Counter(
+    "agent_groq_fallbacks_total",
+    "Requests that fell back to Groq after Gemini failed",
+    ["outcome"]
+)
+LLM_TOKENS = Counter(
+    "agent_llm_tokens_total",
+    "Tokens reported by the LLM provider",
+    ["provider", "model", "kind"]
+)
+
+def record_tokens(provider: str, model: str, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and in-flight count for HTTP requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status["code"])
+            ).observe(time.perf_counter() - start)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
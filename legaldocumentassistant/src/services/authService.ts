@@ -143,13 +143,17 @@ class AuthService {
     );
   }
 
-  async changePassword(currentPassword: string, newPassword: string): Promise<ApiResponse> {
-    return apiCall<ApiResponse>(() =>
-      apiClient.post<ApiResponse>('/auth/change-password', {
-        current_password: currentPassword,
+  async changePassword(currentPassword: string, newPassword: string): Promise<void> {
+    const response = await apiCall<{ token: string; refresh_token: string }>(() =>
+      apiClient.post<{ token: string; refresh_token: string }>('/auth/change-password', {
+        old_password: currentPassword,
         new_password: newPassword
       })
     );
+
+    // Tokens issued before the change are revoked
+    apiClient.setToken(response.token);
+    apiClient.setRefreshToken(response.refresh_token);
   }
 
   async refreshToken(): Promise<string | null> {
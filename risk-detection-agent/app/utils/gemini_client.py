@@ -6,8 +6,11 @@ import os
 import json
 import logging
 from typing import Dict, Any, Optional
-import google.generativeai as genai
-from groq import Groq
+import time
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+from app.utils.metrics import GEMINI_ATTEMPTS, GROQ_FALLBACKS, JSON_FAILURES, LLM_CALL_DURATION, record_tokens
+from app.utils.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +25,21 @@ AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini")
 # Configure Groq (fallback)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+def preload_sdks():
+    """
+    Import the provider SDKs. They are imported on first use so the agent
+    starts serving (and probing) without them; main.py calls this in a
+    background thread after startup so the first request does not pay for it.
+    """
+    import google.generativeai  # noqa: F401
+    import groq  # noqa: F401
+
 def get_gemini_client():
     """Initialize and return Gemini client"""
     if not GEMINI_API_KEY:
         raise ValueError("GEMINI_API_KEY not found in environment variables")
     
+    import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)
     
     # Use model name without 'models/' prefix - the SDK adds it automatically
@@ -45,8 +58,35 @@ def get_groq_client():
     """Initialize and return Groq client (fallback)"""
     if not GROQ_API_KEY:
         raise ValueError("GROQ_API_KEY not found in environment variables")
+    from groq import Groq
     return Groq(api_key=GROQ_API_KEY)
 
+def new_usage() -> Dict[str, int]:
+    """Per-request totals returned to the gateway with the analysis."""
+    return {"gemini_attempts": 0, "groq_attempts": 0, "prompt_tokens": 0, "completion_tokens": 0, "llm_ms": 0}
+
+def _record_gemini_usage(response, totals: Dict[str, int]):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        record_tokens("gemini", GEMINI_MODEL, prompt_tokens, completion_tokens)
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        span = trace.get_current_span()
+        span.set_attribute("gen_ai.usage.input_tokens", prompt_tokens)
+        span.set_attribute("gen_ai.usage.output_tokens", completion_tokens)
+
+def _record_gemini_attempt(outcome: str, started: float, totals: Dict[str, int]):
+    elapsed = time.perf_counter() - started
+    GEMINI_ATTEMPTS.labels(outcome).inc()
+    LLM_CALL_DURATION.labels("gemini", GEMINI_MODEL, outcome).observe(elapsed)
+    totals["llm_ms"] += round(elapsed * 1000)
+    span = trace.get_current_span()
+    span.set_attribute("gemini.outcome", outcome)
+    if outcome != "success":
+        span.set_status(Status(StatusCode.ERROR, outcome))
+
 def build_structured_context(
     text: str,
     filename: Optional[str] = None,
@@ -106,65 +146,80 @@ def call_gemini_api(
         Dict with 'content', 'model_used', 'provider', 'success'
     """
     previous_errors = []
+    usage = new_usage()
     
     for attempt in range(max_retries):
-        try:
-            logger.info(f"Gemini API call attempt {attempt + 1}/{max_retries}")
+        with tracer.start_as_current_span("gemini.attempt", attributes={
+            "gemini.attempt": attempt + 1, "gen_ai.request.model": GEMINI_MODEL
+        }):
+            started = time.perf_counter()
+            usage["gemini_attempts"] += 1
+            try:
+                logger.info(f"Gemini API call attempt {attempt + 1}/{max_retries}")
             
-            # Get Gemini client
-            model = get_gemini_client()
+                # Get Gemini client
+                model = get_gemini_client()
             
-            # Combine system prompt and user content
-            full_prompt = f"{system_prompt}\n\n{user_content}"
+                # Combine system prompt and user content
+                full_prompt = f"{system_prompt}\n\n{user_content}"
             
-            # Call Gemini API
-            response = model.generate_content(full_prompt)
+                # Call Gemini API
+                response = model.generate_content(full_prompt)
+                _record_gemini_usage(response, usage)
             
-            # Extract text
-            response_text = response.text
+                # Extract text
+                response_text = response.text
             
-            # Validate JSON
-            try:
-                json_data = json.loads(response_text)
-                logger.info(f"Gemini API success on attempt {attempt + 1}")
-                return {
-                    "content": response_text,
-                    "parsed": json_data,
-                    "model_used": GEMINI_MODEL,
-                    "provider": "gemini",
-                    "success": True,
-                    "attempt": attempt + 1
-                }
-            except json.JSONDecodeError as e:
-                error_msg = f"JSON validation failed: {str(e)}"
-                logger.warning(error_msg)
-                previous_errors.append(error_msg)
+                # Validate JSON
+                try:
+                    with tracer.start_as_current_span("json.validate"):
+                        json_data = json.loads(response_text)
+                    _record_gemini_attempt("success", started, usage)
+                    logger.info(f"Gemini API success on attempt {attempt + 1}")
+                    return {
+                        "content": response_text,
+                        "parsed": json_data,
+                        "model_used": GEMINI_MODEL,
+                        "provider": "gemini",
+                        "success": True,
+                        "attempt": attempt + 1,
+                        "usage": usage
+                    }
+                except json.JSONDecodeError as e:
+                    _record_gemini_attempt("json_error", started, usage)
+                    JSON_FAILURES.labels("gemini").inc()
+                    error_msg = f"JSON validation failed: {str(e)}"
+                    logger.warning(error_msg)
+                    previous_errors.append(error_msg)
                 
-                # Rebuild context with error info for retry
-                if attempt < max_retries - 1:
-                    user_content = build_structured_context(
-                        text=user_content.split("DOCUMENT_TEXT:")[-1].strip(),
-                        previous_errors=previous_errors
-                    )
-                continue
+                    # Rebuild context with error info for retry
+                    if attempt < max_retries - 1:
+                        user_content = build_structured_context(
+                            text=user_content.split("DOCUMENT_TEXT:")[-1].strip(),
+                            previous_errors=previous_errors
+                        )
+                    continue
                 
-        except Exception as e:
-            error_msg = f"Gemini API error: {str(e)}"
-            logger.error(error_msg)
-            previous_errors.append(error_msg)
+            except Exception as e:
+                _record_gemini_attempt("error", started, usage)
+                error_msg = f"Gemini API error: {str(e)}"
+                logger.error(error_msg)
+                previous_errors.append(error_msg)
             
-            if attempt == max_retries - 1:
-                # Last attempt failed, try Groq fallback
-                logger.warning("All Gemini attempts failed, falling back to Groq")
-                return call_groq_fallback(system_prompt, user_content, previous_errors)
+                if attempt == max_retries - 1:
+                    # Last attempt failed, try Groq fallback
+                    logger.warning("All Gemini attempts failed, falling back to Groq")
+                    return call_groq_fallback(system_prompt, user_content, previous_errors, usage)
     
     # Should not reach here, but fallback anyway
-    return call_groq_fallback(system_prompt, user_content, previous_errors)
+    return call_groq_fallback(system_prompt, user_content, previous_errors, usage)
 
+@tracer.start_as_current_span("groq.fallback")
 def call_groq_fallback(
     system_prompt: str,
     user_content: str,
-    previous_errors: list
+    previous_errors: list,
+    usage: Optional[Dict[str, int]] = None
 ) -> Dict[str, Any]:
     """
     Fallback to Groq API when Gemini fails
@@ -173,10 +228,14 @@ def call_groq_fallback(
         system_prompt: System instructions
         user_content: User message
         previous_errors: List of previous errors
+        usage: Totals from the Gemini attempts, updated in place
     
     Returns:
         Dict with response data
     """
+    usage = usage if usage is not None else new_usage()
+    usage["groq_attempts"] += 1
+    started = time.perf_counter()
     try:
         logger.info("Using Groq as fallback provider")
         client = get_groq_client()
@@ -198,8 +257,26 @@ def call_groq_fallback(
         )
         
         response_content = completion.choices[0].message.content
-        json_data = json.loads(response_content)
+        groq_usage = getattr(completion, "usage", None)
+        if groq_usage is not None:
+            record_tokens("groq", "llama-3.3-70b-versatile", groq_usage.prompt_tokens, groq_usage.completion_tokens)
+            usage["prompt_tokens"] += groq_usage.prompt_tokens or 0
+            usage["completion_tokens"] += groq_usage.completion_tokens or 0
+            trace.get_current_span().set_attributes({
+                "gen_ai.usage.input_tokens": groq_usage.prompt_tokens or 0,
+                "gen_ai.usage.output_tokens": groq_usage.completion_tokens or 0
+            })
+        try:
+            with tracer.start_as_current_span("json.validate"):
+                json_data = json.loads(response_content)
+        except json.JSONDecodeError:
+            JSON_FAILURES.labels("groq").inc()
+            raise
         
+        GROQ_FALLBACKS.labels("success").inc()
+        elapsed = time.perf_counter() - started
+        LLM_CALL_DURATION.labels("groq", "llama-3.3-70b-versatile", "success").observe(elapsed)
+        usage["llm_ms"] += round(elapsed * 1000)
         logger.info("Groq fallback successful")
         return {
             "content": response_content,
@@ -207,10 +284,16 @@ def call_groq_fallback(
             "model_used": "llama-3.3-70b-versatile",
             "provider": "groq",
             "success": True,
-            "fallback": True
+            "fallback": True,
+            "usage": usage
         }
         
     except Exception as e:
+        GROQ_FALLBACKS.labels("failure").inc()
+        trace.get_current_span().set_status(Status(StatusCode.ERROR, str(e)))
+        elapsed = time.perf_counter() - started
+        LLM_CALL_DURATION.labels("groq", "llama-3.3-70b-versatile", "error").observe(elapsed)
+        usage["llm_ms"] += round(elapsed * 1000)
         logger.error(f"Groq fallback also failed: {e}")
         return {
             "content": None,
@@ -219,5 +302,6 @@ def call_groq_fallback(
             "provider": None,
             "success": False,
             "error": str(e),
-            "previous_errors": previous_errors
+            "previous_errors": previous_errors,
+            "usage": usage
         }
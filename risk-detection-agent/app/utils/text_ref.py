@@ -0,0 +1,32 @@
+"""
+Document text passed by reference.
+
+The gateway writes each document's text once to the volume it shares with
+the agents, as TEXT_STORE_DIR/<aa>/<sha256>.txt, and sends
+{"text_ref", "sha256"} instead of the text. The file is mapped and decoded
+straight from the page cache. Files are content-addressed and renamed into
+place complete, so the text is not re-hashed here.
+"""
+import mmap
+import os
+import re
+
+TEXT_STORE_DIR = os.getenv("TEXT_STORE_DIR", "shared_data/texts")
+
+_TEXT_REF = re.compile(r"[0-9a-f]{2}/[0-9a-f]{64}\.txt")
+
+class TextRefError(Exception):
+    """The referenced text is malformed or not readable."""
+
+def read_text_ref(text_ref: str, sha256: str) -> str:
+    if not _TEXT_REF.fullmatch(text_ref) or text_ref != f"{sha256[:2]}/{sha256}.txt":
+        raise TextRefError(f"Invalid text_ref {text_ref!r}")
+    path = os.path.join(TEXT_STORE_DIR, text_ref)
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return str(mapped, "utf-8")
+    except OSError as e:
+        raise TextRefError(f"Cannot read text_ref {text_ref!r}: {e.strerror}")
@@ -1,19 +1,40 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
+from typing import Optional
 import logging
 from app.services.analysis_service import analyze_document
+from app.utils.text_ref import TextRefError, read_text_ref
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 class AnalyzeRequest(BaseModel):
-    text: str
+    text: Optional[str] = None
+    # Text written to the shared volume by the gateway (see app/utils/text_ref.py)
+    text_ref: Optional[str] = None
+    sha256: Optional[str] = None
+
+async def request_text(request: AnalyzeRequest) -> str:
+    if request.text_ref and request.sha256:
+        try:
+            return await run_in_threadpool(read_text_ref, request.text_ref, request.sha256)
+        except TextRefError as e:
+            if request.text is None:
+                # The gateway resends the text inline
+                raise HTTPException(status_code=422, detail={"error": str(e), "code": "text_ref_unavailable"})
+            logger.warning(f"{e}; using the inline text")
+    if request.text is None:
+        raise HTTPException(status_code=422, detail={"error": "text or text_ref is required"})
+    return request.text
 
 @router.post("/analyze")
 async def analyze(request: AnalyzeRequest):
     logger.info("Received analysis request")
-    result = analyze_document(request.text)
+    text = await request_text(request)
+    # The LLM call blocks; keep the event loop free for probes and other requests
+    result = await run_in_threadpool(analyze_document, text)
     if "error" in result:
         logger.error(f"Analysis failed: {result['error']}")
         raise HTTPException(status_code=500, detail=result)
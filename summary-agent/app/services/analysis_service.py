@@ -1,7 +1,9 @@
 import os
 import json
 import logging
+import time
 from app.utils.gemini_client import call_gemini_api, build_structured_context
+from app.utils.tracing import tracer
 from app.models.schemas import SummaryResponse
 
 logger = logging.getLogger(__name__)
@@ -11,6 +13,15 @@ def get_system_prompt():
     with open(prompt_path, "r") as f:
         return f.read()
 
+def build_telemetry(response: dict, started: float) -> dict:
+    """Provider, model, attempts, token usage and timings of one analysis."""
+    return {
+        "provider": response.get("provider"),
+        "model": response.get("model_used"),
+        "agent_ms": round((time.perf_counter() - started) * 1000),
+        **response.get("usage", {})
+    }
+
 def analyze_document(text: str, filename: str = None) -> dict:
     """
     Analyze document using Gemini AI with Groq fallback
@@ -22,6 +33,7 @@ def analyze_document(text: str, filename: str = None) -> dict:
     Returns:
         Dictionary with analysis results
     """
+    started = time.perf_counter()
     system_prompt = get_system_prompt()
     
     # Build structured context
@@ -43,13 +55,17 @@ def analyze_document(text: str, filename: str = None) -> dict:
         return {
             "error": "Failed to process document after retries",
             "details": response.get("error"),
-            "previous_errors": response.get("previous_errors", [])
+            "previous_errors": response.get("previous_errors", []),
+            # Tokens spent on failed attempts still count against the user's budget
+            "telemetry": build_telemetry(response, started)
         }
     
     try:
         # Validate with Pydantic
-        validated_data = SummaryResponse(**response["parsed"])
+        with tracer.start_as_current_span("response.validate"):
+            validated_data = SummaryResponse(**response["parsed"])
         result = validated_data.model_dump()
+        result["telemetry"] = build_telemetry(response, started)
         
         # Log success
         logger.info(f"Analysis successful using {response['provider']} - {response['model_used']}")
@@ -63,5 +79,6 @@ def analyze_document(text: str, filename: str = None) -> dict:
         return {
             "error": "Response validation failed",
             "details": str(e),
-            "raw_response": response.get("content")
+            "raw_response": response.get("content"),
+            "telemetry": build_telemetry(response, started)
         }
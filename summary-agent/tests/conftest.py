@@ -0,0 +1,24 @@
+"""
+Agent tests. They run in-process and never call an LLM provider:
+
+    cd <agent directory>
+    python -m pytest tests
+"""
+import os
+import sys
+import pytest
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("OTEL_TRACES_EXPORTER", "none")
+sys.path.insert(0, AGENT_DIR)
+# app.main logs to logs/app.log relative to the working directory
+os.chdir(AGENT_DIR)
+os.makedirs("logs", exist_ok=True)
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.routes import router
+from app.utils import text_ref
+
+def test_probes_answer_while_analysis_runs(client, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_analysis(text):
+        started.set()
+        # Times out if the probes below could not answer during the analysis
+        return {"result": text, "released": release.wait(5)}
+
+    monkeypatch.setattr(router, "analyze_document", slow_analysis)
+    with ThreadPoolExecutor(1) as executor:
+        pending = executor.submit(client.post, "/analyze", json={"text": "contract"})
+        assert started.wait(5)
+        try:
+            assert client.get("/livez", timeout=2).status_code == 200
+            assert client.get("/readyz", timeout=2).status_code == 200
+        finally:
+            release.set()
+        response = pending.result(10)
+    assert response.status_code == 200
+    assert response.json() == {"result": "contract", "released": True}
+
+def test_analysis_error_returns_500(client, monkeypatch):
+    monkeypatch.setattr(router, "analyze_document", lambda text: {"error": "provider down"})
+    response = client.post("/analyze", json={"text": "contract"})
+    assert response.status_code == 500
+    assert response.json()["detail"]["error"] == "provider down"
+
+def _store_text(directory, text: str) -> dict:
+    data = text.encode("utf-8")
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = directory / sha256[:2] / f"{sha256}.txt"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(data)
+    return {"text_ref": f"{sha256[:2]}/{sha256}.txt", "sha256": sha256}
+
+def test_text_is_read_by_reference(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(text_ref, "TEXT_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(router, "analyze_document", lambda text: {"result": text})
+    response = client.post("/analyze", json=_store_text(tmp_path, "Vertrag über Miete"))
+    assert response.status_code == 200
+    assert response.json() == {"result": "Vertrag über Miete"}
+
+def test_unreadable_text_ref(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(text_ref, "TEXT_STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(router, "analyze_document", lambda text: {"result": text})
+    missing = {"text_ref": f"ab/{'ab' * 32}.txt", "sha256": "ab" * 32}
+
+    response = client.post("/analyze", json=missing)
+    assert response.status_code == 422
+    assert response.json()["detail"]["code"] == "text_ref_unavailable"
+    # Inline text is the fallback
+    assert client.post("/analyze", json={**missing, "text": "inline"}).json() == {"result": "inline"}
+    # References outside the store are refused
+    escape = {"text_ref": "../../etc/passwd", "sha256": "ab" * 32}
+    assert client.post("/analyze", json=escape).status_code == 422